@@ -0,0 +1,220 @@
+# Benchmark de l'API contre des simulateurs locaux des fournisseurs : python -m benchmarks.run
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+from benchmarks.standins import Behaviour, start_standins
+
+TRANSACTION_PROVIDERS = ("stripe", "paypal", "revolut")
+SUBSCRIPTION_PROVIDERS = ("stripe", "paypal")
+SCENARIOS = ("create_transaction", "transaction_status", "create_subscription", "webhook")
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Percentile par rang le plus proche sur une liste triée."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def transaction_payload(provider: str) -> Dict[str, Any]:
+    return {
+        "amount": 19.99,
+        "currency": "EUR",
+        "payment_details": {"email": "bench@example.com"},
+        "success_url": "https://example.com/success",
+        "cancel_url": "https://example.com/cancel",
+        "description": f"Benchmark {provider}",
+        "custom_metadata": {"benchmark": True}
+    }
+
+def subscription_payload() -> Dict[str, Any]:
+    return {
+        "user_id": 1,
+        "plan_id": "benchmark_plan",
+        "amount": 9.99,
+        "currency": "EUR",
+        "interval": "month",
+        "interval_count": 1,
+        "payment_details": {
+            "customer_id": "cus_benchmark",
+            "success_url": "https://example.com/success",
+            "cancel_url": "https://example.com/cancel"
+        }
+    }
+
+async def drive(send: Callable[[int], Any], requests: int, concurrency: int) -> Dict[str, Any]:
+    """Envoie `requests` requêtes avec `concurrency` clients simultanés."""
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        while True:
+            index = next(counter)
+            if index >= requests:
+                return
+            started = time.perf_counter()
+            try:
+                response = await send(index)
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "duration_s": round(duration, 4),
+        "rps": round(requests / duration, 2) if duration else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0
+    }
+
+async def prepare_transactions(client, provider: str, count: int) -> List[str]:
+    """Crée les transactions interrogées par le scénario transaction_status."""
+    ids = []
+    for _ in range(count):
+        response = await client.post("/transactions/", params={"provider": provider}, json=transaction_payload(provider))
+        if response.status_code == 201:
+            ids.append(response.json()["provider_transaction_id"])
+    if not ids:
+        raise RuntimeError(f"Impossible de créer des transactions {provider} pour le scénario de statut")
+    return ids
+
+def build_cases(client, status_ids: Dict[str, List[str]], scenarios: List[str]) -> List[Tuple[str, str, Callable[[int], Any]]]:
+    cases = []
+    if "create_transaction" in scenarios:
+        for provider in TRANSACTION_PROVIDERS:
+            payload = transaction_payload(provider)
+            cases.append(("create_transaction", provider, lambda index, provider=provider, payload=payload:
+                          client.post("/transactions/", params={"provider": provider}, json=payload)))
+    if "transaction_status" in scenarios:
+        for provider in TRANSACTION_PROVIDERS:
+            ids = status_ids[provider]
+            cases.append(("transaction_status", provider, lambda index, provider=provider, ids=ids:
+                          client.get(f"/transactions/{ids[index % len(ids)]}/status", params={"provider": provider})))
+    if "create_subscription" in scenarios:
+        for provider in SUBSCRIPTION_PROVIDERS:
+            payload = subscription_payload()
+            cases.append(("create_subscription", provider, lambda index, provider=provider, payload=payload:
+                          client.post("/subscriptions/", params={"provider": provider}, json=payload)))
+    if "webhook" in scenarios:
+        cases.append(("webhook", "stripe", lambda index: client.post("/webhook/stripe", json={
+            "type": "payment_intent.succeeded",
+            "data": {"object": {"id": f"pi_benchmark_{index}", "status": "completed"}}
+        })))
+    return cases
+
+async def run_benchmarks(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    import httpx
+    # Import après la configuration de l'environnement : les paramètres sont lus au chargement
+    from main import app
+
+    results = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            status_ids = {}
+            if "transaction_status" in args.scenarios:
+                for provider in TRANSACTION_PROVIDERS:
+                    status_ids[provider] = await prepare_transactions(client, provider, args.status_pool)
+            for scenario, provider, send in build_cases(client, status_ids, args.scenarios):
+                for concurrency in args.concurrency:
+                    # Échauffement : connexions, caches et registres de prix/plans
+                    await drive(send, min(args.warmup, args.requests), concurrency)
+                    result = await drive(send, args.requests, concurrency)
+                    result.update({"scenario": scenario, "provider": provider, "concurrency": concurrency})
+                    results.append(result)
+                    print(f"{scenario:<20} {provider:<8} c={concurrency:<4} {result['rps']:>9.1f} req/s  "
+                          f"p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms p99={result['p99_ms']:.1f}ms  erreurs={result['errors']}")
+    return results
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def configure_environment(args: argparse.Namespace, urls: Dict[str, str], database_dir: str) -> None:
+    """Fait pointer l'application vers les simulateurs et une base de données dédiée."""
+    os.environ.update({
+        "DATABASE_URL": args.database_url or f"sqlite:///{os.path.join(database_dir, 'benchmark.db')}",
+        "STRIPE_PUBLIC_KEY": "pk_test_benchmark",
+        "STRIPE_SECRET_KEY": "sk_test_benchmark",
+        "STRIPE_API_BASE": urls["stripe"],
+        "PAYPAL_CLIENT_ID": "benchmark",
+        "PAYPAL_CLIENT_SECRET": "benchmark",
+        "PAYPAL_API_BASE": urls["paypal"],
+        "REVOLUT_PUBLIC_KEY": "benchmark",
+        "REVOLUT_SECRET_KEY": "benchmark",
+        "REVOLUT_API_BASE": urls["revolut"] + "/api",
+        "RECONCILIATION_INTERVAL": "0",
+        "LOG_LEVEL": args.log_level,
+    })
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mesure le débit et la latence de l'API contre des simulateurs locaux des fournisseurs.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50], help="Niveaux de concurrence à mesurer")
+    parser.add_argument("--requests", type=int, default=200, help="Nombre de requêtes par scénario et par niveau de concurrence")
+    parser.add_argument("--warmup", type=int, default=20, help="Requêtes d'échauffement non mesurées")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS), help="Scénarios à exécuter")
+    parser.add_argument("--status-pool", type=int, default=50, help="Transactions créées par fournisseur pour le scénario de statut")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Latence simulée des fournisseurs")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Variation aléatoire de la latence simulée")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Proportion de réponses 500 des fournisseurs")
+    parser.add_argument("--database-url", default=None, help="Base de données à utiliser (par défaut une base SQLite temporaire)")
+    parser.add_argument("--log-level", default="CRITICAL", help="Niveau de journalisation de l'application")
+    parser.add_argument("--output", default=None, help="Fichier JSON des résultats (par défaut benchmarks/results/<date>.json)")
+    args = parser.parse_args()
+
+    behaviour = Behaviour(args.latency_ms, args.jitter_ms, args.error_rate)
+    servers = start_standins(behaviour)
+    started_at = datetime.utcnow()
+    try:
+        with tempfile.TemporaryDirectory() as database_dir:
+            configure_environment(args, {key: server.url for key, server in servers.items()}, database_dir)
+            results = asyncio.run(run_benchmarks(args))
+    finally:
+        for server in servers.values():
+            server.stop()
+
+    report = {
+        "started_at": started_at.isoformat(),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": {
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "error_rate": args.error_rate,
+            "database": "sqlite (temporaire)" if not args.database_url else args.database_url.split("://", 1)[0]
+        },
+        "results": results
+    }
+    output = args.output or os.path.join(os.path.dirname(__file__), "results", f"{started_at.strftime('%Y%m%dT%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Résultats enregistrés dans {output}")
+
+if __name__ == "__main__":
+    main()
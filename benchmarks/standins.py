@@ -0,0 +1,201 @@
+# Simulateurs locaux des API Stripe, PayPal et Revolut appelées par les fournisseurs
+import asyncio
+import random
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+class Behaviour:
+    """Latence et taux d'erreur d'un simulateur."""
+
+    def __init__(self, latency_ms: float = 50.0, jitter_ms: float = 10.0, error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.requests = 0
+
+    async def apply(self) -> bool:
+        """Attend la latence simulée et indique si la requête doit échouer."""
+        self.requests += 1
+        delay = max(self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms), 0.0)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        return random.random() < self.error_rate
+
+def _id(prefix: str) -> str:
+    return f"{prefix}{uuid.uuid4().hex[:24]}"
+
+def stripe_app(behaviour: Behaviour) -> Starlette:
+    def error() -> JSONResponse:
+        return JSONResponse({"error": {"type": "api_error", "message": "Erreur simulée"}}, status_code=500)
+
+    async def create_session(request: Request):
+        if await behaviour.apply():
+            return error()
+        session_id = _id("cs_test_")
+        return JSONResponse({
+            "id": session_id, "object": "checkout.session", "status": "open", "payment_status": "unpaid",
+            "url": f"https://checkout.stripe.com/c/pay/{session_id}", "client_secret": None, "payment_intent": None
+        })
+
+    async def retrieve_session(request: Request):
+        if await behaviour.apply():
+            return error()
+        session_id = request.path_params["session_id"]
+        return JSONResponse({
+            "id": session_id, "object": "checkout.session", "status": "open", "payment_status": "unpaid",
+            "url": f"https://checkout.stripe.com/c/pay/{session_id}", "payment_intent": "pi_" + session_id[-24:]
+        })
+
+    async def retrieve_payment_intent(request: Request):
+        if await behaviour.apply():
+            return error()
+        return JSONResponse({
+            "id": request.path_params["payment_intent_id"], "object": "payment_intent", "status": "requires_payment_method",
+            "amount": 1000, "currency": "eur", "payment_method": None, "customer": None
+        })
+
+    async def create_object(request: Request):
+        if await behaviour.apply():
+            return error()
+        kind = request.path_params["kind"]
+        prefixes = {"products": ("prod_", "product"), "prices": ("price_", "price"), "customers": ("cus_", "customer"), "subscriptions": ("sub_", "subscription")}
+        if kind not in prefixes:
+            return Response(status_code=404)
+        prefix, object_name = prefixes[kind]
+        form = parse_qs((await request.body()).decode())
+        body: Dict[str, Any] = {"id": _id(prefix), "object": object_name}
+        if kind == "subscriptions":
+            body.update({"status": "incomplete", "start_date": int(time.time())})
+        if kind == "customers":
+            body.update({"email": form.get("email", [None])[0], "name": form.get("name", [None])[0]})
+        return JSONResponse(body)
+
+    async def list_prices(request: Request):
+        return JSONResponse({"object": "list", "data": [], "has_more": False, "url": "/v1/prices"})
+
+    return Starlette(routes=[
+        Route("/v1/checkout/sessions", create_session, methods=["POST"]),
+        Route("/v1/checkout/sessions/{session_id}", retrieve_session, methods=["GET"]),
+        Route("/v1/payment_intents/{payment_intent_id}", retrieve_payment_intent, methods=["GET"]),
+        Route("/v1/prices", list_prices, methods=["GET"]),
+        Route("/v1/{kind}", create_object, methods=["POST"]),
+    ])
+
+def paypal_app(behaviour: Behaviour) -> Starlette:
+    def error() -> JSONResponse:
+        return JSONResponse({"name": "INTERNAL_SERVICE_ERROR", "message": "Erreur simulée"}, status_code=500)
+
+    def approval_links(resource_id: str) -> List[Dict[str, str]]:
+        return [{"rel": "approval_url", "href": f"https://www.sandbox.paypal.com/checkoutnow?token={resource_id}", "method": "REDIRECT"}]
+
+    async def token(request: Request):
+        return JSONResponse({"access_token": "A21-standin", "token_type": "Bearer", "expires_in": 32400})
+
+    async def create_payment(request: Request):
+        if await behaviour.apply():
+            return error()
+        payment_id = _id("PAYID-")
+        return JSONResponse({"id": payment_id, "state": "created", "links": approval_links(payment_id)}, status_code=201)
+
+    async def find_payment(request: Request):
+        if await behaviour.apply():
+            return error()
+        return JSONResponse({
+            "id": request.path_params["payment_id"], "state": "created", "payer": {"status": "UNVERIFIED"},
+            "transactions": [{"amount": {"total": "10.00", "currency": "EUR"}}],
+            "create_time": "2024-01-01T00:00:00Z", "update_time": "2024-01-01T00:00:00Z"
+        })
+
+    async def create_plan(request: Request):
+        if await behaviour.apply():
+            return error()
+        return JSONResponse({"id": _id("P-"), "state": "CREATED"}, status_code=201)
+
+    async def update_plan(request: Request):
+        if await behaviour.apply():
+            return error()
+        return Response(status_code=200)
+
+    async def create_agreement(request: Request):
+        if await behaviour.apply():
+            return error()
+        agreement_id = _id("I-")
+        return JSONResponse({"id": agreement_id, "state": "Pending", "links": approval_links(agreement_id)}, status_code=201)
+
+    return Starlette(routes=[
+        Route("/v1/oauth2/token", token, methods=["POST"]),
+        Route("/v1/payments/payment", create_payment, methods=["POST"]),
+        Route("/v1/payments/payment/{payment_id}", find_payment, methods=["GET"]),
+        Route("/v1/payments/billing-plans", create_plan, methods=["POST"]),
+        Route("/v1/payments/billing-plans/{plan_id}", update_plan, methods=["PATCH"]),
+        Route("/v1/payments/billing-agreements", create_agreement, methods=["POST"]),
+    ])
+
+def revolut_app(behaviour: Behaviour) -> Starlette:
+    def error() -> JSONResponse:
+        return JSONResponse({"code": "internal_error", "message": "Erreur simulée"}, status_code=500)
+
+    async def create_order(request: Request):
+        if await behaviour.apply():
+            return error()
+        order_id = str(uuid.uuid4())
+        return JSONResponse({"id": order_id, "state": "PENDING", "checkout_url": f"https://checkout.revolut.com/payment-link/{order_id}"}, status_code=201)
+
+    async def retrieve_order(request: Request):
+        if await behaviour.apply():
+            return error()
+        return JSONResponse({"id": request.path_params["order_id"], "state": "PENDING"})
+
+    return Starlette(routes=[
+        Route("/api/orders", create_order, methods=["POST"]),
+        Route("/api/orders/{order_id}", retrieve_order, methods=["GET"]),
+    ])
+
+class StandinServer:
+    """Serveur uvicorn exécuté dans un thread, sur un port libre de 127.0.0.1."""
+
+    def __init__(self, app: Starlette, port: Optional[int] = None):
+        self.port = port or _free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", access_log=False))
+        self.thread = threading.Thread(target=self.server.run, name=f"standin-{self.port}", daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout: float = 10.0) -> None:
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Le simulateur sur le port {self.port} n'a pas démarré")
+            time.sleep(0.01)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(5)
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_standins(behaviour: Behaviour) -> Dict[str, StandinServer]:
+    """Démarre les trois simulateurs et retourne les serveurs par clé de fournisseur."""
+    servers = {
+        "stripe": StandinServer(stripe_app(behaviour)),
+        "paypal": StandinServer(paypal_app(behaviour)),
+        "revolut": StandinServer(revolut_app(behaviour)),
+    }
+    for server in servers.values():
+        server.start()
+    return servers
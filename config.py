@@ -1,12 +1,18 @@
 # Importation des modules nécessaires
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 
 # Configuration pour les fournisseurs de paiement
 class PaymentProviderConfig(BaseSettings):
     name: str
     class_path: str
     config: Dict[str, Any] = {}
+    # Cloisonnement : appels simultanés (0 = illimité, sinon également la taille du pool de
+    # threads du fournisseur), appels en attente au-delà (0 = refus immédiat) et attente maximale
+    max_concurrency: int = 0
+    max_queued: int = 0
+    queue_timeout: float = 5.0
 
 # Paramètres globaux de l'application
 class Settings(BaseSettings):
@@ -14,26 +20,202 @@ class Settings(BaseSettings):
     database_url: str
     base_url: str = "http://localhost:8000"
     
+    # Profil de stockage SQLite ("default" ou "wal") et ses réglages, appliqués aux bases SQLite sur disque
+    sqlite_profile: str = "default"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 268435456  # 256 Mo
+    sqlite_cache_size_kb: int = 65536
+    sqlite_pool_size: int = 10
+    sqlite_max_overflow: int = 20
+    # Maintenance périodique en secondes (0 désactive) : point de contrôle WAL et ANALYZE
+    sqlite_checkpoint_interval: int = 300
+    sqlite_analyze_interval: int = 3600
+
     # Paramètres des fournisseurs de paiement
-    stripe_public_key: str
-    stripe_secret_key: str
-    paypal_client_id: str
-    paypal_client_secret: str
+    # Activation de chaque fournisseur : par défaut, un fournisseur est activé si ses identifiants
+    # sont renseignés ; STRIPE_ENABLED=true exige les identifiants, false désactive le fournisseur
+    stripe_enabled: Optional[bool] = None
+    paypal_enabled: Optional[bool] = None
+    revolut_enabled: Optional[bool] = None
+    stripe_public_key: Optional[str] = None
+    stripe_secret_key: Optional[str] = None
+    paypal_client_id: Optional[str] = None
+    paypal_client_secret: Optional[str] = None
     paypal_mode: str = "sandbox"
-    revolut_public_key: str
-    revolut_secret_key: str
+    revolut_public_key: Optional[str] = None
+    revolut_secret_key: Optional[str] = None
     revolut_mode: str = "sandbox"
+    revolut_pool_size: int = 10
+    revolut_keepalive_expiry: float = 30.0
+    revolut_connect_timeout: float = 5.0
+    revolut_read_timeout: float = 15.0
+    revolut_http2: bool = False
+    # Délai maximal de chaque appel HTTP des SDK Stripe et PayPal (réduit au temps restant de la requête)
+    stripe_timeout: float = 30.0
+    paypal_timeout: float = 30.0
+
+    # URLs des API des fournisseurs (par défaut celles du mode choisi), par exemple
+    # pour pointer vers les simulateurs locaux de benchmarks/
+    stripe_api_base: Optional[str] = None
+    paypal_api_base: Optional[str] = None
+    revolut_api_base: Optional[str] = None
+
+    # Fournisseur simulé "local" pour les tests de capacité (désactivé par défaut)
+    local_provider_enabled: bool = False
+    local_latency_distribution: str = "fixed"  # fixed, uniform, exponential, lognormal
+    local_latency_ms: float = 0.0
+    local_latency_jitter_ms: float = 0.0
+    local_failure_rate: float = 0.0
+    local_decline_rate: float = 0.0
+    local_settle_after: float = 1.0
+    # Envoi des webhooks simulés au service (par défaut vers {base_url}/webhook/local)
+    local_webhooks: bool = False
+    local_webhook_url: Optional[str] = None
+
+    # Serveur de production (gunicorn.conf.py) : adresse d'écoute, nombre de workers
+    # (0 = un par cœur), délais et recyclage des workers après N requêtes (0 = jamais)
+    server_bind: str = "0.0.0.0:8000"
+    server_workers: int = 0
+    server_timeout: int = 60
+    server_graceful_timeout: int = 30
+    server_keepalive: int = 5
+    server_max_requests: int = 0
+    server_max_requests_jitter: int = 0
+
+    # Échéance des requêtes HTTP en secondes (0 : sans échéance), par défaut et par route
+    # (ex: {"POST /transactions/batch": 60}), et plafond du délai demandé par le client
+    # dans l'en-tête X-Request-Timeout
+    request_timeout: float = 30.0
+    request_timeouts: Dict[str, float] = {}
+    request_timeout_max: float = 120.0
+
+    # Taille du pool de threads dédié à chaque fournisseur synchrone
+    provider_max_workers: int = 8
+    # Fournisseurs chargés au démarrage plutôt qu'à leur première utilisation ("*" pour tous) :
+    # module importé au chargement de l'application (une fois dans le processus maître de
+    # gunicorn), fournisseur instancié au démarrage de chaque worker
+    provider_preload: List[str] = []
+
+    # Résilience des appels aux fournisseurs : disjoncteur (échecs transitoires consécutifs avant
+    # ouverture, délai avant un appel de test), nouvelles tentatives (0 les désactive) avec un
+    # délai aléatoire exponentiel, et fournisseurs de secours des paiements ponctuels (ex: {"paypal": "stripe"})
+    provider_breaker_failure_threshold: int = 5
+    provider_breaker_recovery_timeout: float = 30.0
+    provider_retry_attempts: int = 2
+    provider_retry_base_delay: float = 0.2
+    provider_retry_max_delay: float = 2.0
+    provider_failover: Dict[str, str] = {}
+
+    # Cloisonnement par fournisseur (ex: {"paypal": 20}) : voir PaymentProviderConfig
+    provider_max_concurrency: Dict[str, int] = {}
+    provider_max_queued: Dict[str, int] = {}
+    provider_queue_timeout: float = 5.0
+
+    # Routage provider=auto : fournisseurs candidats par devise ("*" pour les autres devises,
+    # tous les fournisseurs chargés si vide), poids choisis par le marchand (0 exclut un fournisseur),
+    # lissage des moyennes mobiles, demi-vie (secondes) du taux d'erreur, majoration du coût
+    # d'un fournisseur en échec et part des choix tirés au hasard pour garder des mesures à jour
+    routing_providers: Dict[str, List[str]] = {}
+    routing_weights: Dict[str, float] = {}
+    routing_ewma_alpha: float = 0.2
+    routing_error_half_life: float = 60.0
+    routing_error_penalty: float = 10.0
+    routing_exploration: float = 0.05
+
+    # File d'attente des webhooks ; par défaut, seul le processus élu pour les tâches de fond
+    # l'applique, WEBHOOK_DRAIN_ALL_WORKERS=true la fait appliquer par chaque worker
+    webhook_workers: int = 2
+    webhook_batch_size: int = 100
+    webhook_poll_interval: float = 1.0
+    webhook_max_attempts: int = 5
+    # Délai (secondes) avant une nouvelle tentative d'un événement en échec
+    webhook_retry_delay: float = 30.0
+    webhook_drain_all_workers: bool = False
+
+    # Tâches de fond (réconciliation, purge des clés d'idempotence, maintenance SQLite, préchargement
+    # des prix, file des webhooks) exécutées par un seul processus, élu par un bail en base renouvelé
+    # toutes les LEADER_LEASE_TTL / 3 secondes ; false exclut ce processus de l'élection
+    background_jobs_enabled: bool = True
+    leader_lease_ttl: float = 30.0
+
+    # Réconciliation des transactions non finalisées (0 désactive la tâche planifiée) : seules les
+    # transactions des `lookback_hours` dernières heures sont vérifiées, par lots de `batch_size`
+    reconciliation_interval: int = 0
+    reconciliation_concurrency: int = 5
+    reconciliation_lookback_hours: int = 72
+    reconciliation_batch_size: int = 500
 
-    # Configuration des fournisseurs de paiement
+    # Création de transactions par lot : taille maximale d'un lot et appels simultanés au fournisseur
+    transaction_batch_max_items: int = 100
+    transaction_batch_concurrency: int = 10
+
+    # Exports en flux : nombre de lignes lues par paquet
+    export_chunk_size: int = 1000
+
+    # Clés d'idempotence (en-tête Idempotency-Key) : durée de conservation, délai après lequel
+    # une requête interrompue libère sa clé, cache des réponses et purge (0 la désactive)
+    idempotency_key_ttl_hours: int = 24
+    idempotency_lock_timeout: float = 60.0
+    idempotency_cache_size: int = 10000
+    idempotency_purge_interval: int = 3600
+
+    # Préchargement au démarrage du registre des prix récurrents
+    price_registry_warmup: bool = True
+
+    # Cache des statuts de paiement (les statuts définitifs n'expirent pas)
+    status_cache_size: int = 10000
+    status_cache_ttls: Dict[str, float] = {"pending": 5.0, "processing": 2.0}
+    status_cache_default_ttl: float = 5.0
+
+    # Journalisation : niveau global, niveaux par module (ex: {"providers.paypal": "DEBUG"}),
+    # format ("json" ou "text") et taux d'échantillonnage par événement (ex: {"transaction.status_checked": 0.1})
+    log_level: str = "INFO"
+    log_levels: Dict[str, str] = {}
+    log_format: str = "json"
+    log_sampling: Dict[str, float] = {}
+    log_queue_size: int = 10000
+
+    # Traçage des requêtes (en-tête Server-Timing, requêtes lentes) et profileur
+    tracing_enabled: bool = True
+    tracing_slow_threshold_ms: float = 500.0
+    tracing_buffer_size: int = 100
+    profiler_max_seconds: float = 60.0
+    # Jeton exigé dans l'en-tête X-Admin-Token par les endpoints /admin et /exports (refusés s'il est vide)
+    admin_token: Optional[str] = None
+
+    # Erreur de configuration détectée au démarrage plutôt qu'au premier appel du fournisseur
+    @model_validator(mode="after")
+    def check_providers(self) -> "Settings":
+        for provider_key, enabled, credentials in self._provider_credentials():
+            if enabled and not all(credentials):
+                raise ValueError(f"{provider_key.upper()}_ENABLED=true exige les identifiants du fournisseur {provider_key}")
+        unknown = set(self.provider_preload) - set(self.payment_providers) - {"*"}
+        if unknown:
+            raise ValueError(f"PROVIDER_PRELOAD désigne des fournisseurs non activés : {sorted(unknown)}")
+        return self
+
+    # Activation explicite (ou None) et identifiants de chaque fournisseur réel
+    def _provider_credentials(self):
+        return [
+            ("stripe", self.stripe_enabled, (self.stripe_public_key, self.stripe_secret_key)),
+            ("paypal", self.paypal_enabled, (self.paypal_client_id, self.paypal_client_secret)),
+            ("revolut", self.revolut_enabled, (self.revolut_public_key, self.revolut_secret_key))
+        ]
+
+    # Configuration des fournisseurs de paiement activés ; aucun module de fournisseur n'est
+    # importé ici (voir utils/provider_loader.py)
     @property
     def payment_providers(self) -> Dict[str, PaymentProviderConfig]:
-        return {
+        providers = {
             "stripe": PaymentProviderConfig(
                 name="Stripe",
                 class_path="providers.stripe.StripeProvider",
                 config={
                     "public_key": self.stripe_public_key,
-                    "secret_key": self.stripe_secret_key
+                    "secret_key": self.stripe_secret_key,
+                    "api_base": self.stripe_api_base,
+                    "timeout": self.stripe_timeout
                 }
             ),
             "paypal": PaymentProviderConfig(
@@ -42,7 +224,9 @@ class Settings(BaseSettings):
                 config={
                     "client_id": self.paypal_client_id,
                     "client_secret": self.paypal_client_secret,
-                    "mode": self.paypal_mode
+                    "mode": self.paypal_mode,
+                    "api_base": self.paypal_api_base,
+                    "timeout": self.paypal_timeout
                 }
             ),
             "revolut": PaymentProviderConfig(
@@ -51,10 +235,37 @@ class Settings(BaseSettings):
                 config={
                     "public_key": self.revolut_public_key,
                     "secret_key": self.revolut_secret_key,
-                    "mode": self.revolut_mode
+                    "mode": self.revolut_mode,
+                    "pool_size": self.revolut_pool_size,
+                    "keepalive_expiry": self.revolut_keepalive_expiry,
+                    "connect_timeout": self.revolut_connect_timeout,
+                    "read_timeout": self.revolut_read_timeout,
+                    "http2": self.revolut_http2,
+                    "api_base": self.revolut_api_base
                 }
             )
         }
+        enabled = {provider_key: all(credentials) if flag is None else flag for provider_key, flag, credentials in self._provider_credentials()}
+        providers = {provider_key: provider_config for provider_key, provider_config in providers.items() if enabled[provider_key]}
+        if self.local_provider_enabled:
+            providers["local"] = PaymentProviderConfig(
+                name="Local",
+                class_path="providers.local.LocalProvider",
+                config={
+                    "latency_distribution": self.local_latency_distribution,
+                    "latency_ms": self.local_latency_ms,
+                    "latency_jitter_ms": self.local_latency_jitter_ms,
+                    "failure_rate": self.local_failure_rate,
+                    "decline_rate": self.local_decline_rate,
+                    "settle_after": self.local_settle_after,
+                    "webhook_url": (self.local_webhook_url or f"{self.base_url}/webhook/local") if self.local_webhooks else None
+                }
+            )
+        for provider_key, provider_config in providers.items():
+            provider_config.max_concurrency = self.provider_max_concurrency.get(provider_key, 0)
+            provider_config.max_queued = self.provider_max_queued.get(provider_key, 0)
+            provider_config.queue_timeout = self.provider_queue_timeout
+        return providers
 
     # Configuration pour le chargement des variables d'environnement
     class Config:
@@ -4,5 +4,33 @@ PAYMENT_STATUS = {
     'PROCESSING': 'processing', # En cours de traitement
     'COMPLETED': 'completed',   # Terminé avec succès
     'FAILED': 'failed',         # Échoué
-    'CANCELLED': 'cancelled'    # Annulé
-}
\ No newline at end of file
+    'CANCELLED': 'cancelled',   # Annulé
+    'UNKNOWN': 'unknown'        # Inconnu
+}
+
+# Statuts définitifs : la transaction n'évoluera plus chez le fournisseur
+TERMINAL_PAYMENT_STATUSES = (
+    PAYMENT_STATUS['COMPLETED'],
+    PAYMENT_STATUS['FAILED'],
+    PAYMENT_STATUS['CANCELLED']
+)
+
+# Statuts des événements de webhook en file d'attente
+WEBHOOK_EVENT_STATUS = {
+    'PENDING': 'pending',       # Reçu, en attente de traitement
+    'PROCESSING': 'processing', # Réservé par un worker
+    'PROCESSED': 'processed',   # Appliqué en base
+    'FAILED': 'failed'          # Rejeté ou abandonné après plusieurs tentatives
+}
+# Statuts des clés d'idempotence (en-tête Idempotency-Key)
+IDEMPOTENCY_KEY_STATUS = {
+    'PROCESSING': 'processing', # Requête en cours de traitement
+    'COMPLETED': 'completed'    # Réponse enregistrée, rejouée aux requêtes suivantes
+}
+
+# États du disjoncteur d'un fournisseur de paiement
+CIRCUIT_STATE = {
+    'CLOSED': 'closed',         # Appels transmis normalement
+    'OPEN': 'open',             # Appels refusés immédiatement après des échecs répétés
+    'HALF_OPEN': 'half_open'    # Appel de test autorisé après le délai de récupération
+}
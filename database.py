@@ -1,25 +1,197 @@
 # Importation des modules nécessaires
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from starlette.concurrency import run_in_threadpool
 from config import settings
+from utils.metrics import db_session_duration, instrument_engine, instrument_sessions
+from utils.tracing import trace_engine, trace_sessions
+from utils.deadline import enforce_engine_deadline, enforce_session_deadline, wait_for_deadline
+from utils.sqlite import configure_sqlite_engine, sqlite_engine_options
+import asyncio
+import time
+
+# Pilotes asynchrones supportés et leur équivalent synchrone (utilisé par les scripts)
+ASYNC_DRIVERS = {
+    "sqlite+aiosqlite": "sqlite",
+    "postgresql+asyncpg": "postgresql",
+    "mysql+aiomysql": "mysql+pymysql",
+}
+
+def is_async_url(database_url: str) -> bool:
+    return make_url(database_url).drivername in ASYNC_DRIVERS
+
+def to_sync_url(database_url: str) -> str:
+    url = make_url(database_url)
+    if url.drivername in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[url.drivername])
+    return url.render_as_string(hide_password=False)
 
 # URL de la base de données récupérée depuis les paramètres
 SQLALCHEMY_DATABASE_URL = settings.database_url
 
-# Création du moteur SQLAlchemy
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Le mode asynchrone est activé uniquement par le choix d'un pilote asynchrone dans DATABASE_URL
+ASYNC_MODE = is_async_url(SQLALCHEMY_DATABASE_URL)
+SYNC_DATABASE_URL = to_sync_url(SQLALCHEMY_DATABASE_URL)
+
+# SQLite : la connexion peut être utilisée depuis les threads du pool
+connect_args = {"check_same_thread": False} if SYNC_DATABASE_URL.startswith("sqlite") else {}
+
+# Création du moteur SQLAlchemy synchrone (toujours disponible pour les scripts)
+engine = create_engine(SYNC_DATABASE_URL, connect_args=connect_args, **sqlite_engine_options(settings, SYNC_DATABASE_URL))
 
 # Création d'une session locale
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Sessions utilisées par les routes en mode synchrone : les objets restent lisibles après commit
+ThreadedSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+if ASYNC_MODE:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    # Création du moteur asynchrone (aiosqlite, asyncpg...)
+    async_engine = create_async_engine(SQLALCHEMY_DATABASE_URL, **sqlite_engine_options(settings, SQLALCHEMY_DATABASE_URL, is_async=True))
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+else:
+    async_engine = None
+    AsyncSessionLocal = None
+
+# Mesure des durées des requêtes SQL et des commits (exposées sur /metrics et en spans)
+instrumented_engines = [engine] if async_engine is None else [engine, async_engine.sync_engine]
+for instrumented_engine in instrumented_engines:
+    # Pragmas du profil SQLITE_PROFILE (WAL, busy_timeout...) appliqués à chaque connexion
+    configure_sqlite_engine(instrumented_engine, settings)
+    instrument_engine(instrumented_engine)
+    trace_engine(instrumented_engine)
+    # Requêtes SQL refusées après l'échéance de la requête HTTP en cours
+    enforce_engine_deadline(instrumented_engine)
+instrument_sessions()
+trace_sessions()
+enforce_session_deadline()
+
+def dispose_engines_after_fork() -> None:
+    """À appeler dans chaque worker après le fork : les connexions du pool héritées du
+    processus parent sont abandonnées (sans être fermées) et chaque worker ouvre les siennes."""
+    engine.dispose(close=False)
+    if async_engine is not None:
+        async_engine.sync_engine.dispose(close=False)
+
 # Création de la classe de base pour les modèles déclaratifs
 Base = declarative_base()
 
-# Fonction pour obtenir une session de base de données
-def get_db():
+class ThreadedSession:
+    """Expose l'API awaitable d'AsyncSession au-dessus d'une Session synchrone.
+
+    Utilisée lorsque DATABASE_URL désigne un pilote synchrone : chaque opération
+    d'entrée/sortie est exécutée dans le pool de threads afin de ne pas bloquer
+    la boucle d'événements, et les routes n'ont qu'une seule implémentation.
+    """
+
+    def __init__(self, session, slots=None):
+        self.sync_session = session
+        self._slots = slots
+        self._holding_slot = False
+
+    async def _run(self, func, *args, **kwargs):
+        # La place dans le pool de connexions est attendue dans la boucle et non dans un
+        # thread : des threads bloqués sur le pool empêcheraient les sessions qui détiennent
+        # les connexions de faire leur commit (interblocage sous forte concurrence)
+        if self._slots is not None and not self._holding_slot:
+            await wait_for_deadline(self._slots.acquire(), "db.connection")
+            self._holding_slot = True
+        return await run_in_threadpool(func, *args, **kwargs)
+
+    def _release_slot(self):
+        if self._holding_slot:
+            self._holding_slot = False
+            self._slots.release()
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    async def execute(self, statement, *args, **kwargs):
+        # Résultat mis en mémoire dans le thread pour ne pas lire le curseur depuis la boucle
+        return await self._run(lambda: self.sync_session.execute(statement, *args, **kwargs).freeze()())
+
+    async def scalar(self, statement, *args, **kwargs):
+        return await self._run(self.sync_session.scalar, statement, *args, **kwargs)
+
+    async def get(self, entity, ident, **kwargs):
+        return await self._run(self.sync_session.get, entity, ident, **kwargs)
+
+    async def delete(self, instance):
+        await self._run(self.sync_session.delete, instance)
+
+    async def flush(self, objects=None):
+        await self._run(self.sync_session.flush, objects)
+
+    async def commit(self):
+        await self._run(self.sync_session.commit)
+        # La connexion est rendue au pool à la fin de la transaction
+        self._release_slot()
+
+    async def rollback(self):
+        # Sans transaction en cours, aucune connexion n'est nécessaire : pas d'attente de place
+        try:
+            await run_in_threadpool(self.sync_session.rollback)
+        finally:
+            self._release_slot()
+
+    async def refresh(self, instance, attribute_names=None):
+        await self._run(self.sync_session.refresh, instance, attribute_names)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await self._run(fn, self.sync_session, *args, **kwargs)
+
+    async def close(self):
+        # Sans transaction en cours, aucune connexion n'est nécessaire : pas d'attente de place
+        try:
+            await run_in_threadpool(self.sync_session.close)
+        finally:
+            self._release_slot()
+
+def pool_capacity(pool):
+    """Nombre maximal de connexions ouvertes par un QueuePool, None si le pool n'est pas borné."""
+    if not isinstance(pool, QueuePool) or pool._max_overflow < 0:
+        return None
+    return pool.size() + pool._max_overflow
+
+# Places du pool de connexions pour les ThreadedSession, un sémaphore par boucle d'événements
+_slots_state = None
+
+def _connection_slots():
+    global _slots_state
+    capacity = pool_capacity(engine.pool)
+    if capacity is None:
+        return None
+    loop = asyncio.get_running_loop()
+    if _slots_state is None or _slots_state[0] is not loop:
+        _slots_state = (loop, asyncio.Semaphore(capacity))
+    return _slots_state[1]
+
+# Dépendance FastAPI : session awaitable (AsyncSession native ou ThreadedSession)
+async def get_db():
+    started = time.perf_counter()
+    if ASYNC_MODE:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = ThreadedSession(ThreadedSessionLocal(), _connection_slots())
+        try:
+            yield db
+        finally:
+            await db.close()
+    db_session_duration.observe(time.perf_counter() - started)
+
+# Fonction pour obtenir une session synchrone (scripts, tâches hors des routes)
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,34 @@
+# Configuration de gunicorn pour la production : gunicorn -c gunicorn.conf.py main:app
+import multiprocessing
+from config import settings
+
+bind = settings.server_bind
+# Un worker par cœur par défaut, chacun avec sa propre boucle d'événements uvicorn
+workers = settings.server_workers or multiprocessing.cpu_count()
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# L'application (et les migrations) est chargée une seule fois dans le processus maître,
+# puis les workers sont créés par fork
+preload_app = True
+
+timeout = settings.server_timeout
+# Délai laissé aux workers pour terminer leurs requêtes et arrêter la file des webhooks
+graceful_timeout = settings.server_graceful_timeout
+keepalive = settings.server_keepalive
+max_requests = settings.server_max_requests
+max_requests_jitter = settings.server_max_requests_jitter
+
+# Les journaux de l'application sont écrits par utils/log.py ; gunicorn ne garde que les siens
+accesslog = None
+errorlog = "-"
+
+def post_fork(server, worker):
+    # Ressources à recréer dans chaque worker : le fork ne copie ni les threads ni les
+    # connexions utilisables du processus maître
+    from database import dispose_engines_after_fork
+    from utils.log import reinit_logging_after_fork
+    from utils.provider_loader import init_payment_providers
+
+    reinit_logging_after_fork(settings)
+    dispose_engines_after_fork()
+    init_payment_providers()
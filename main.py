@@ -1,37 +1,142 @@
 # Importation des modules nécessaires
-from fastapi import FastAPI
-from routes import transactions, subscriptions, customers, products
-from database import engine, Base
-from utils.provider_loader import load_payment_providers
-from typing import Dict
-from providers.base import PaymentProvider
+from utils.startup import startup_timer
+from fastapi import Depends, FastAPI
+from config import settings
+from utils.log import setup_logging, get_logger
+
+# Journalisation configurée avant le chargement des fournisseurs
+setup_logging(settings)
+
+from routes import transactions, subscriptions, customers, products, providers, metrics, admin, exports
+from migrations import run_migrations
+from utils.provider_loader import async_payment_providers, provider_registry
+from utils.webhook_queue import webhook_queue
+from utils.reconciliation import reconciliation_loop
+from utils.idempotency import idempotency_store, purge_loop
+from utils.sqlite import is_sqlite_file, sqlite_maintenance_loop, sqlite_pragmas
+from database import engine
+from utils.metrics import MetricsMiddleware
+from utils.tracing import TracingMiddleware
+from utils.deadline import DeadlineExceededError, DeadlineMiddleware, deadline_exceeded_handler, route_timeout_dependency
+from utils.leader import LeaderLease, run_as_leader
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List
 import uvicorn
 
-# Création des tables dans la base de données
-Base.metadata.create_all(bind=engine)
+log = get_logger("main")
+startup_timer.mark("imports")
+
+# Modules des fournisseurs chargés au démarrage (PROVIDER_PRELOAD) : importés ici, une seule
+# fois dans le processus maître de gunicorn, les autres le sont à leur première utilisation
+provider_registry.import_modules(settings.provider_preload)
+startup_timer.mark("provider_imports")
+
+# Application des migrations du schéma de la base de données
+run_migrations()
+startup_timer.mark("migrations")
+
+async def warm_price_registry(provider_key: str, async_provider) -> None:
+    try:
+        added = await async_provider.warm_price_registry()
+        log.info("price_registry.warmed", provider=provider_key, added=added)
+    except Exception as e:
+        log.warning("price_registry.warmup_failed", provider=provider_key, error=str(e))
+
+def start_background_jobs(tasks: List[asyncio.Task]) -> None:
+    """Démarre les tâches à n'exécuter que dans un seul processus (voir utils/leader.py)."""
+    if is_sqlite_file(str(engine.url)) and settings.sqlite_profile == "wal" and settings.sqlite_checkpoint_interval > 0:
+        tasks.append(asyncio.create_task(sqlite_maintenance_loop(engine, settings.sqlite_checkpoint_interval, settings.sqlite_analyze_interval)))
+    if not settings.webhook_drain_all_workers:
+        webhook_queue.start()
+    # Préchargement en arrière-plan des prix Stripe existants, pour les fournisseurs chargés au
+    # démarrage ; les autres chargent leurs prix enregistrés à leur premier abonnement
+    tasks.extend(
+        asyncio.create_task(warm_price_registry(provider_key, async_provider))
+        for provider_key, async_provider in async_payment_providers.loaded().items()
+        if settings.price_registry_warmup and hasattr(async_provider, "warm_price_registry")
+    )
+    if settings.reconciliation_interval > 0:
+        tasks.append(asyncio.create_task(reconciliation_loop(
+            async_payment_providers,
+            settings.reconciliation_interval,
+            settings.reconciliation_concurrency,
+            settings.reconciliation_lookback_hours,
+            settings.reconciliation_batch_size
+        )))
+    if settings.idempotency_purge_interval > 0:
+        tasks.append(asyncio.create_task(purge_loop(idempotency_store, settings.idempotency_purge_interval)))
+
+async def stop_background_jobs(tasks: List[asyncio.Task]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    tasks.clear()
+    if not settings.webhook_drain_all_workers:
+        await asyncio.to_thread(webhook_queue.stop)
+
+# Cycle de vie de l'application : tâches de fond, workers des webhooks et pools des fournisseurs
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Réglages effectifs de la base (profil SQLITE_PROFILE), relus sur une connexion du worker
+    if is_sqlite_file(str(engine.url)):
+        log.info("database.configured", profile=settings.sqlite_profile, **await asyncio.to_thread(sqlite_pragmas, engine))
+    with startup_timer.phase("provider_init"):
+        provider_registry.preload(settings.provider_preload)
+    if settings.webhook_drain_all_workers:
+        webhook_queue.start()
+    # Tâches de fond dans le seul processus détenant le bail, créé après le fork du worker
+    background_tasks: List[asyncio.Task] = []
+    leader_task = None
+    if settings.background_jobs_enabled:
+        leader_task = asyncio.create_task(run_as_leader(
+            LeaderLease("background_jobs", settings.leader_lease_ttl),
+            lambda: start_background_jobs(background_tasks),
+            lambda: stop_background_jobs(background_tasks),
+            settings.leader_lease_ttl / 3
+        ))
+    startup_timer.ready()
+    log.info("startup.completed", **startup_timer.report(), providers=provider_registry.report())
+    yield
+    if leader_task:
+        leader_task.cancel()
+        await asyncio.gather(leader_task, return_exceptions=True)
+    if settings.webhook_drain_all_workers:
+        webhook_queue.stop()
+    for async_provider in async_payment_providers.loaded().values():
+        await async_provider.aclose()
 
 # Initialisation de l'application FastAPI
 app = FastAPI(
     title="API de Paiement",
     description="Une API flexible pour gérer les transactions de paiement avec différents fournisseurs.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # Délai propre à certaines routes (REQUEST_TIMEOUTS), appliqué une fois la route résolue
+    dependencies=[Depends(route_timeout_dependency(settings.request_timeouts))]
 )
 
-# Chargement des fournisseurs de paiement
-payment_providers = load_payment_providers()
-
 # Inclusion des routeurs pour différentes fonctionnalités
 app.include_router(transactions.router)
 app.include_router(subscriptions.router)
 app.include_router(customers.router)
 app.include_router(products.router)
+app.include_router(providers.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
+app.include_router(exports.router)
+
+# Échéance de chaque requête (en-tête X-Request-Timeout ou délai de la route), réponse 504 une fois atteinte
+app.add_middleware(DeadlineMiddleware, default_timeout=settings.request_timeout, max_timeout=settings.request_timeout_max)
+app.add_exception_handler(DeadlineExceededError, deadline_exceeded_handler)
 
-# Configuration de la dépendance pour les fournisseurs de paiement
-def get_payment_providers() -> Dict[str, PaymentProvider]:
-    return payment_providers
+# Mesure de la durée des requêtes HTTP par route
+app.add_middleware(MetricsMiddleware)
 
-app.dependency_overrides[get_payment_providers] = lambda: payment_providers
+# Découpage de chaque requête en spans : en-tête Server-Timing et requêtes lentes sur /admin/slow-requests
+if settings.tracing_enabled:
+    app.add_middleware(TracingMiddleware, slow_requests=admin.slow_requests)
 
-# Point d'entrée pour l'exécution de l'application
+# Point d'entrée pour le développement (un seul processus) ; en production : gunicorn -c gunicorn.conf.py main:app
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,191 @@
+# Migrations versionnées du schéma de la base de données
+from datetime import datetime
+from typing import Callable, List, Tuple
+from sqlalchemy import JSON, Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, case, func, inspect, insert, select, update
+from sqlalchemy.engine import Connection, Engine
+from database import engine
+from utils.log import get_logger
+from models.transaction import Transaction
+from models.subscription import Subscription
+from models.stripe_price import StripePrice
+from models.paypal_plan import PayPalPlan
+from models.idempotency_key import IdempotencyKey
+from models.job_lease import JobLease
+
+log = get_logger(__name__)
+
+class MigrationError(Exception):
+    """Migration impossible sur les données existantes : à corriger avant de relancer l'application."""
+
+# Table de suivi des versions appliquées (hors des modèles de l'application)
+schema_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    schema_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String),
+    Column("applied_at", DateTime),
+)
+
+def _create_index(connection: Connection, table, name: str) -> None:
+    index = next(index for index in table.indexes if index.name == name)
+    index.create(connection, checkfirst=True)
+
+# Schéma de la migration 1, figé : les tables telles qu'elles étaient à sa publication, sans
+# dépendre des modèles, qui évoluent (index et tables ajoutés par les migrations suivantes)
+baseline_metadata = MetaData()
+Table(
+    "customers",
+    baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("provider_customer_id", String, unique=True, index=True),
+    Column("email", String),
+    Column("name", String),
+)
+Table(
+    "transactions",
+    baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("amount", Float),
+    Column("currency", String),
+    Column("status", String),
+    Column("provider", String),
+    Column("provider_transaction_id", String),
+    Column("created_at", DateTime),
+    Column("checkout_url", String, nullable=True),
+    Column("success_url", String),
+    Column("cancel_url", String),
+    Column("custom_metadata", JSON, nullable=True),
+    Column("description", String, nullable=True),
+)
+Table(
+    "subscriptions",
+    baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, index=True),
+    Column("plan_id", String, index=True),
+    Column("status", String),
+    Column("amount", Float),
+    Column("currency", String),
+    Column("interval", String),
+    Column("interval_count", Integer),
+    Column("start_date", DateTime),
+    Column("end_date", DateTime, nullable=True),
+    Column("provider", String),
+    Column("provider_subscription_id", String),
+    Column("transaction_id", Integer, ForeignKey("transactions.id")),
+)
+Table(
+    "webhook_events",
+    baseline_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("provider", String),
+    Column("payload", JSON),
+    Column("status", String, index=True),
+    Column("attempts", Integer, default=0),
+    Column("claim_token", String, nullable=True, index=True),
+    Column("received_at", DateTime),
+    Column("claimed_at", DateTime, nullable=True),
+    Column("processed_at", DateTime, nullable=True),
+    Column("error", String, nullable=True),
+)
+
+def _initial_schema(connection: Connection) -> None:
+    # Tables existantes conservées : checkfirst évite de recréer une base déjà initialisée
+    baseline_metadata.create_all(connection, checkfirst=True)
+
+# Nom de classe enregistré autrefois dans la colonne provider des transactions, et clé qui le remplace
+LEGACY_PROVIDER_NAMES = {"StripeProvider": "stripe", "PayPalProvider": "paypal", "RevolutProvider": "revolut"}
+
+def _find_duplicates(connection: Connection, table, provider, provider_id) -> List[Tuple[str, str, int]]:
+    rows = connection.execute(
+        select(provider, provider_id, func.count())
+        .where(provider_id.isnot(None))
+        .group_by(provider, provider_id)
+        .having(func.count() > 1)
+    ).all()
+    return [(table.name, f"{row[0]}/{row[1]}", row[2]) for row in rows]
+
+def _provider_lookup_indexes(connection: Connection) -> None:
+    transactions = Transaction.__table__
+    subscriptions = Subscription.__table__
+
+    # Les index uniques échoueraient sur des doublons : ils sont recherchés avant toute modification,
+    # en tenant compte du renommage des fournisseurs, et signalés ensemble
+    normalized_provider = case(LEGACY_PROVIDER_NAMES, value=transactions.c.provider, else_=transactions.c.provider)
+    duplicates = (
+        _find_duplicates(connection, transactions, normalized_provider, transactions.c.provider_transaction_id)
+        + _find_duplicates(connection, subscriptions, subscriptions.c.provider, subscriptions.c.provider_subscription_id)
+    )
+    if duplicates:
+        log.error("migration.duplicates", version=2, duplicates=[f"{table} {key} ({count} lignes)" for table, key, count in duplicates[:50]], total=len(duplicates))
+        examples = ", ".join(f"{table} {key} ×{count}" for table, key, count in duplicates[:10])
+        raise MigrationError(f"Migration 2 : {len(duplicates)} identifiants fournisseur en double à corriger avant de créer les index uniques ({examples})")
+
+    # Les transactions enregistraient le nom de la classe du fournisseur : on utilise désormais sa clé
+    for class_name, provider_key in LEGACY_PROVIDER_NAMES.items():
+        connection.execute(update(transactions).where(transactions.c.provider == class_name).values(provider=provider_key))
+
+    _create_index(connection, transactions, "ix_transactions_provider_provider_transaction_id")
+    _create_index(connection, transactions, "ix_transactions_status_created_at")
+    _create_index(connection, Subscription.__table__, "ix_subscriptions_provider_provider_subscription_id")
+
+def _stripe_price_registry(connection: Connection) -> None:
+    StripePrice.__table__.create(connection, checkfirst=True)
+
+def _paypal_plan_registry(connection: Connection) -> None:
+    PayPalPlan.__table__.create(connection, checkfirst=True)
+
+def _idempotency_keys(connection: Connection) -> None:
+    IdempotencyKey.__table__.create(connection, checkfirst=True)
+
+def _transaction_listing_indexes(connection: Connection) -> None:
+    transactions = Transaction.__table__
+    _create_index(connection, transactions, "ix_transactions_created_at_id")
+    _create_index(connection, transactions, "ix_transactions_provider_created_at_id")
+
+def _job_leases(connection: Connection) -> None:
+    JobLease.__table__.create(connection, checkfirst=True)
+
+# Liste ordonnée des migrations : ne jamais modifier une migration déjà publiée, en ajouter une nouvelle
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "initial_schema", _initial_schema),
+    (2, "provider_lookup_indexes", _provider_lookup_indexes),
+    (3, "stripe_price_registry", _stripe_price_registry),
+    (4, "paypal_plan_registry", _paypal_plan_registry),
+    (5, "idempotency_keys", _idempotency_keys),
+    (6, "transaction_listing_indexes", _transaction_listing_indexes),
+    (7, "job_leases", _job_leases),
+]
+
+def current_version(bind: Engine = engine) -> int:
+    if not inspect(bind).has_table("schema_migrations"):
+        return 0
+    with bind.connect() as connection:
+        versions = connection.execute(select(schema_migrations.c.version)).scalars().all()
+    return max(versions, default=0)
+
+def run_migrations(bind: Engine = engine) -> List[int]:
+    """Applique les migrations manquantes, chacune dans sa propre transaction."""
+    schema_metadata.create_all(bind, checkfirst=True)
+    with bind.connect() as connection:
+        applied = set(connection.execute(select(schema_migrations.c.version)).scalars().all())
+
+    newly_applied = []
+    for version, name, migration in MIGRATIONS:
+        if version in applied:
+            continue
+        with bind.begin() as connection:
+            migration(connection)
+            connection.execute(insert(schema_migrations).values(version=version, name=name, applied_at=datetime.utcnow()))
+        log.info("migration.applied", version=version, name=name)
+        newly_applied.append(version)
+    return newly_applied
+
+# Point d'entrée en ligne de commande : python migrations.py
+if __name__ == "__main__":
+    from config import settings
+    from utils.log import setup_logging
+    setup_logging(settings)
+    run_migrations()
+    print(f"Schéma à jour (version {current_version()})")
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Index
+from database import Base
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        Index("ix_idempotency_keys_scope_key", "scope", "key", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String)  # Route concernée, ex: 'POST /transactions/'
+    key = Column(String)  # Valeur de l'en-tête Idempotency-Key
+    fingerprint = Column(String)  # Empreinte SHA-256 de la requête (fournisseur et corps)
+    status = Column(String)  # 'processing' puis 'completed'
+    response_code = Column(Integer, nullable=True)
+    response_body = Column(JSON, nullable=True)
+    created_at = Column(DateTime, index=True)
+    completed_at = Column(DateTime, nullable=True)
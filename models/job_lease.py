@@ -0,0 +1,9 @@
+from sqlalchemy import Column, String, DateTime
+from database import Base
+
+class JobLease(Base):
+    __tablename__ = "job_leases"
+
+    name = Column(String, primary_key=True)  # Groupe de tâches, ex: 'background_jobs'
+    holder = Column(String)  # Processus détenteur : hôte, pid et identifiant aléatoire
+    expires_at = Column(DateTime)  # Au-delà, le bail peut être repris par un autre processus
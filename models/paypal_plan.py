@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from database import Base
+
+class PayPalPlan(Base):
+    __tablename__ = "paypal_plans"
+    __table_args__ = (
+        Index("ix_paypal_plans_terms", "amount", "currency", "frequency", "frequency_interval", "return_url", "cancel_url", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    amount = Column(Integer)  # En centimes
+    currency = Column(String)
+    frequency = Column(String)  # 'MONTH', 'YEAR', etc.
+    frequency_interval = Column(Integer)
+    return_url = Column(String)
+    cancel_url = Column(String)
+    plan_id = Column(String, unique=True)
+    state = Column(String)  # 'CREATED' puis 'ACTIVE' au premier accord
+    created_at = Column(DateTime)
+    activated_at = Column(DateTime, nullable=True)
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, DateTime, Index
+from database import Base
+
+class StripePrice(Base):
+    __tablename__ = "stripe_prices"
+    __table_args__ = (
+        Index("ix_stripe_prices_amount_currency_interval", "unit_amount", "currency", "interval", "interval_count", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    unit_amount = Column(Integer)  # En centimes, comme chez Stripe
+    currency = Column(String)
+    interval = Column(String)  # 'month', 'year', etc.
+    interval_count = Column(Integer)
+    price_id = Column(String, unique=True)
+    product_id = Column(String)
+    created_at = Column(DateTime)
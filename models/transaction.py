@@ -1,9 +1,16 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_provider_provider_transaction_id", "provider", "provider_transaction_id", unique=True),
+        Index("ix_transactions_status_created_at", "status", "created_at"),
+        # Pagination par curseur de GET /transactions/ : tri (created_at, id), avec ou sans filtre sur le fournisseur
+        Index("ix_transactions_created_at_id", "created_at", "id"),
+        Index("ix_transactions_provider_created_at_id", "provider", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     amount = Column(Float)
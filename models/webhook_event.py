@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from database import Base
+
+class WebhookEvent(Base):
+    __tablename__ = "webhook_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String)
+    payload = Column(JSON)
+    status = Column(String, index=True)  # 'pending', 'processing', 'processed', 'failed'
+    attempts = Column(Integer, default=0)
+    claim_token = Column(String, nullable=True, index=True)
+    received_at = Column(DateTime)
+    claimed_at = Column(DateTime, nullable=True)
+    processed_at = Column(DateTime, nullable=True)
+    error = Column(String, nullable=True)
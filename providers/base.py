@@ -1,9 +1,34 @@
+import asyncio
+import contextvars
+import functools
+import inspect
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional
+
+class ProviderUnavailableError(ValueError):
+    """Échec transitoire d'un fournisseur (réseau, surcharge, erreur 5xx) : l'appel peut être retenté."""
+
+# Erreurs transitoires reconnues pour tous les fournisseurs
+TRANSIENT_ERRORS = (ProviderUnavailableError, ConnectionError, TimeoutError, asyncio.TimeoutError)
+
+def error_chain(error: BaseException) -> Iterator[BaseException]:
+    """L'erreur puis celles qu'elle enveloppe : les fournisseurs convertissent les erreurs des SDK en ValueError."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
 
 class PaymentProvider(ABC):
+    # Le fournisseur applique la clé d'idempotence : une création peut être retentée sans doublon
+    supports_idempotency_keys: bool = False
+
+    # idempotency_key : clé Idempotency-Key du client, transmise aux fournisseurs qui gèrent
+    # nativement l'idempotence (Stripe, PayPal) et ignorée par les autres
     @abstractmethod
-    def create_payment(self, amount: float, currency: str, payment_details: Dict[str, Any], success_url: str, cancel_url: str, metadata: Optional[Dict[str, Any]] = None, description: Optional[str] = None) -> Dict[str, Any]:
+    def create_payment(self, amount: float, currency: str, payment_details: Dict[str, Any], success_url: str, cancel_url: str, metadata: Optional[Dict[str, Any]] = None, description: Optional[str] = None, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
         pass
 
     @abstractmethod
@@ -15,7 +40,7 @@ class PaymentProvider(ABC):
         pass
 
     @abstractmethod
-    def create_subscription(self, amount: float, currency: str, interval: str, interval_count: int, payment_details: Dict[str, Any]) -> Dict[str, Any]:
+    def create_subscription(self, amount: float, currency: str, interval: str, interval_count: int, payment_details: Dict[str, Any], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
         pass
 
     @abstractmethod
@@ -24,4 +49,188 @@ class PaymentProvider(ABC):
 
     @abstractmethod
     def update_subscription(self, provider_subscription_id: str, new_plan: Dict[str, Any]) -> Dict[str, Any]:
-        pass
\ No newline at end of file
+        pass
+
+    def list_payment_statuses(self, provider_transaction_ids: List[str], created_after: datetime) -> Dict[str, Dict[str, Any]]:
+        """Statuts de plusieurs paiements via un endpoint de liste, si le fournisseur en dispose.
+
+        Retourne uniquement les identifiants trouvés ; les autres sont vérifiés un par un
+        avec check_payment_status. Par défaut, aucun endpoint de liste n'est utilisé.
+        """
+        return {}
+
+    def is_transient_error(self, error: Exception) -> bool:
+        """Indique si l'échec est transitoire : seules ces erreurs comptent pour le disjoncteur et sont retentées.
+
+        Les fournisseurs complètent la détection avec les erreurs réseau et serveur de leur SDK.
+        """
+        return any(isinstance(cause, TRANSIENT_ERRORS) for cause in error_chain(error))
+
+    def as_async(self, max_workers: int = 8) -> "AsyncPaymentProvider":
+        """Retourne la version asynchrone du fournisseur.
+
+        Par défaut, les appels synchrones sont exécutés dans un pool de threads borné.
+        Un fournisseur disposant d'un client asynchrone natif peut surcharger cette méthode.
+        """
+        return ThreadPoolProviderAdapter(self, max_workers=max_workers)
+
+class AsyncPaymentProvider(ABC):
+    """Équivalent asynchrone de PaymentProvider, utilisé par les routes."""
+
+    name: str = ""
+    supports_idempotency_keys: bool = False
+
+    @abstractmethod
+    async def create_payment(self, amount: float, currency: str, payment_details: Dict[str, Any], success_url: str, cancel_url: str, metadata: Optional[Dict[str, Any]] = None, description: Optional[str] = None, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    async def check_payment_status(self, provider_transaction_id: str) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    async def process_webhook(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    async def create_subscription(self, amount: float, currency: str, interval: str, interval_count: int, payment_details: Dict[str, Any], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    async def cancel_subscription(self, provider_subscription_id: str) -> Dict[str, Any]:
+        pass
+
+    @abstractmethod
+    async def update_subscription(self, provider_subscription_id: str, new_plan: Dict[str, Any]) -> Dict[str, Any]:
+        pass
+
+    async def list_payment_statuses(self, provider_transaction_ids: List[str], created_after: datetime) -> Dict[str, Dict[str, Any]]:
+        return {}
+
+    async def aclose(self) -> None:
+        pass
+
+    def is_transient_error(self, error: Exception) -> bool:
+        return any(isinstance(cause, TRANSIENT_ERRORS) for cause in error_chain(error))
+
+class ThreadPoolProviderAdapter(AsyncPaymentProvider):
+    """Adapte un PaymentProvider synchrone en exécutant ses appels dans un pool de threads dédié.
+
+    Le pool est borné : au-delà de `max_workers` appels simultanés, les appels suivants
+    attendent qu'un thread se libère au lieu de bloquer la boucle d'événements.
+    Les méthodes spécifiques au fournisseur (create_customer, create_product_and_price...)
+    sont exposées automatiquement sous forme de coroutines.
+    """
+
+    def __init__(self, provider: PaymentProvider, max_workers: int = 8):
+        self.provider = provider
+        self.name = provider.__class__.__name__
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{self.name}-worker")
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Contexte copié dans le thread, comme run_in_threadpool : l'échéance de la requête y reste lisible
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, functools.partial(context.run, func, *args, **kwargs))
+
+    async def create_payment(self, amount: float, currency: str, payment_details: Dict[str, Any], success_url: str, cancel_url: str, metadata: Optional[Dict[str, Any]] = None, description: Optional[str] = None, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        return await self._run(self.provider.create_payment, amount, currency, payment_details, success_url, cancel_url, metadata, description, idempotency_key=idempotency_key)
+
+    async def check_payment_status(self, provider_transaction_id: str) -> Dict[str, Any]:
+        return await self._run(self.provider.check_payment_status, provider_transaction_id)
+
+    async def process_webhook(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._run(self.provider.process_webhook, data)
+
+    async def create_subscription(self, amount: float, currency: str, interval: str, interval_count: int, payment_details: Dict[str, Any], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        return await self._run(self.provider.create_subscription, amount, currency, interval, interval_count, payment_details, idempotency_key=idempotency_key)
+
+    async def cancel_subscription(self, provider_subscription_id: str) -> Dict[str, Any]:
+        return await self._run(self.provider.cancel_subscription, provider_subscription_id)
+
+    async def update_subscription(self, provider_subscription_id: str, new_plan: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._run(self.provider.update_subscription, provider_subscription_id, new_plan)
+
+    async def list_payment_statuses(self, provider_transaction_ids: List[str], created_after: datetime) -> Dict[str, Dict[str, Any]]:
+        return await self._run(self.provider.list_payment_statuses, provider_transaction_ids, created_after)
+
+    async def aclose(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    @property
+    def supports_idempotency_keys(self) -> bool:
+        return self.provider.supports_idempotency_keys
+
+    def is_transient_error(self, error: Exception) -> bool:
+        return self.provider.is_transient_error(error)
+
+    def __getattr__(self, name: str):
+        # Appelé uniquement pour les attributs absents de l'adaptateur
+        if name == "provider":
+            raise AttributeError(name)
+        attribute = getattr(self.provider, name)
+        if not callable(attribute):
+            return attribute
+
+        async def call(*args, **kwargs):
+            return await self._run(attribute, *args, **kwargs)
+        return call
+
+class ProviderWrapper(AsyncPaymentProvider):
+    """Fournisseur asynchrone qui délègue à un autre en faisant passer chaque appel par `_call`.
+
+    Les sous-classes surchargent `_call` pour mesurer, limiter ou protéger les appels
+    sans modifier les fournisseurs ; les méthodes spécifiques (coroutines) du
+    fournisseur délégué passent aussi par `_call`.
+    """
+
+    def __init__(self, inner: AsyncPaymentProvider):
+        self.inner = inner
+        self.name = inner.name
+
+    async def _call(self, method: str, func, *args, **kwargs):
+        return await func(*args, **kwargs)
+
+    async def create_payment(self, amount: float, currency: str, payment_details: Dict[str, Any], success_url: str, cancel_url: str, metadata: Optional[Dict[str, Any]] = None, description: Optional[str] = None, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        return await self._call("create_payment", self.inner.create_payment, amount, currency, payment_details, success_url, cancel_url, metadata, description, idempotency_key=idempotency_key)
+
+    async def check_payment_status(self, provider_transaction_id: str) -> Dict[str, Any]:
+        return await self._call("check_payment_status", self.inner.check_payment_status, provider_transaction_id)
+
+    async def process_webhook(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._call("process_webhook", self.inner.process_webhook, data)
+
+    async def create_subscription(self, amount: float, currency: str, interval: str, interval_count: int, payment_details: Dict[str, Any], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        return await self._call("create_subscription", self.inner.create_subscription, amount, currency, interval, interval_count, payment_details, idempotency_key=idempotency_key)
+
+    async def cancel_subscription(self, provider_subscription_id: str) -> Dict[str, Any]:
+        return await self._call("cancel_subscription", self.inner.cancel_subscription, provider_subscription_id)
+
+    async def update_subscription(self, provider_subscription_id: str, new_plan: Dict[str, Any]) -> Dict[str, Any]:
+        return await self._call("update_subscription", self.inner.update_subscription, provider_subscription_id, new_plan)
+
+    async def list_payment_statuses(self, provider_transaction_ids: List[str], created_after: datetime) -> Dict[str, Dict[str, Any]]:
+        return await self._call("list_payment_statuses", self.inner.list_payment_statuses, provider_transaction_ids, created_after)
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+    @property
+    def supports_idempotency_keys(self) -> bool:
+        return self.inner.supports_idempotency_keys
+
+    def is_transient_error(self, error: Exception) -> bool:
+        return self.inner.is_transient_error(error)
+
+    def __getattr__(self, name: str):
+        # Appelé uniquement pour les attributs absents du wrapper
+        if name == "inner":
+            raise AttributeError(name)
+        attribute = getattr(self.inner, name)
+        if not inspect.iscoroutinefunction(attribute):
+            return attribute
+
+        async def call(*args, **kwargs):
+            return await self._call(name, attribute, *args, **kwargs)
+        return call
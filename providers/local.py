@@ -0,0 +1,314 @@
+import heapq
+import math
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+import httpx
+from .base import PaymentProvider, ProviderUnavailableError
+from constants import PAYMENT_STATUS
+from utils.deadline import remaining
+from utils.log import get_logger
+
+log = get_logger(__name__)
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+class LocalProvider(PaymentProvider):
+    """Fournisseur simulé en mémoire, pour mesurer la capacité du service sans fournisseur réel.
+
+    Chaque paiement est en attente (`pending`) jusqu'à `settle_after` secondes après
+    sa création, puis réussi ou refusé selon `decline_rate`. Les appels attendent une
+    latence tirée de la distribution choisie et échouent avec une probabilité
+    `failure_rate`. Si `webhook_url` est renseignée, un webhook est envoyé au
+    service à chaque changement de statut.
+    """
+
+    def __init__(self, latency_distribution: str = "fixed", latency_ms: float = 0.0, latency_jitter_ms: float = 0.0, failure_rate: float = 0.0, decline_rate: float = 0.0, settle_after: float = 1.0, webhook_url: Optional[str] = None, max_records: int = 100000):
+        if latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Distribution de latence inconnue : {latency_distribution} (attendu : {', '.join(LATENCY_DISTRIBUTIONS)})")
+        self.latency_distribution = latency_distribution
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.failure_rate = failure_rate
+        self.decline_rate = decline_rate
+        self.settle_after = settle_after
+        self.max_records = max_records
+        self._lock = threading.Lock()
+        self._payments: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._subscriptions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._customers: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._webhooks = WebhookEmitter(webhook_url) if webhook_url else None
+
+    def _simulate_call(self, operation: str) -> None:
+        """Latence simulée, puis échec éventuel de l'appel."""
+        delay = self._latency() / 1000
+        # Comme un client HTTP dont le délai est réduit au temps restant de la requête
+        left = remaining()
+        if left is not None and delay > left:
+            time.sleep(max(left, 0))
+            raise TimeoutError(f"Délai dépassé lors de l'appel au fournisseur local ({operation})")
+        if delay > 0:
+            time.sleep(delay)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ProviderUnavailableError(f"Échec simulé du fournisseur local ({operation})")
+
+    def _latency(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        if self.latency_distribution == "uniform":
+            return max(random.uniform(self.latency_ms - self.latency_jitter_ms, self.latency_ms + self.latency_jitter_ms), 0.0)
+        if self.latency_distribution == "exponential":
+            return random.expovariate(1 / self.latency_ms)
+        if self.latency_distribution == "lognormal":
+            # Médiane égale à latency_ms ; la dispersion croît avec le jitter
+            return random.lognormvariate(math.log(self.latency_ms), self.latency_jitter_ms / self.latency_ms)
+        return self.latency_ms
+
+    def _store(self, records: "OrderedDict[str, Dict[str, Any]]", record_id: str, record: Dict[str, Any]) -> None:
+        with self._lock:
+            records[record_id] = record
+            # État borné : les plus anciens enregistrements sont oubliés
+            while len(records) > self.max_records:
+                records.popitem(last=False)
+
+    def _payment_status(self, payment: Dict[str, Any]) -> str:
+        if payment["status"] == PAYMENT_STATUS['PENDING'] and time.time() >= payment["settles_at"]:
+            return payment["outcome"]
+        return payment["status"]
+
+    def create_payment(self, amount: float, currency: str, payment_details: Dict[str, Any], success_url: str, cancel_url: str, metadata: Optional[Dict[str, Any]] = None, description: Optional[str] = None, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        self._simulate_call("create_payment")
+        payment_id = f"loc_pay_{uuid.uuid4().hex}"
+        now = time.time()
+        outcome = PAYMENT_STATUS['FAILED'] if random.random() < self.decline_rate else PAYMENT_STATUS['COMPLETED']
+        self._store(self._payments, payment_id, {
+            "id": payment_id,
+            "amount": amount,
+            "currency": currency,
+            "status": PAYMENT_STATUS['PENDING'],
+            "outcome": outcome,
+            "created_at": now,
+            "settles_at": now + self.settle_after,
+            "metadata": metadata or {},
+            "description": description
+        })
+        if self._webhooks:
+            self._webhooks.schedule(now + self.settle_after, {
+                "event": f"payment.{outcome}",
+                "payment": {"id": payment_id, "status": outcome}
+            })
+        return {
+            "provider_transaction_id": payment_id,
+            "status": PAYMENT_STATUS['PENDING'],
+            "checkout_url": f"{success_url}?local_payment_id={payment_id}",
+            "client_secret": ""
+        }
+
+    def check_payment_status(self, provider_transaction_id: str) -> Dict[str, Any]:
+        self._simulate_call("check_payment_status")
+        with self._lock:
+            payment = self._payments.get(provider_transaction_id)
+        if payment is None:
+            raise ValueError(f"Paiement local non trouvé : {provider_transaction_id}")
+        status = self._payment_status(payment)
+        return {
+            'status': status,
+            'provider_status': status,
+            'details': {
+                'id': provider_transaction_id,
+                'amount': payment["amount"],
+                'currency': payment["currency"],
+                'created_at': datetime.utcfromtimestamp(payment["created_at"]).isoformat()
+            }
+        }
+
+    def list_payment_statuses(self, provider_transaction_ids: List[str], created_after: datetime) -> Dict[str, Dict[str, Any]]:
+        self._simulate_call("list_payment_statuses")
+        with self._lock:
+            payments = [self._payments.get(transaction_id) for transaction_id in provider_transaction_ids]
+        return {
+            payment["id"]: {'status': self._payment_status(payment), 'provider_status': self._payment_status(payment), 'details': {'id': payment["id"]}}
+            for payment in payments if payment is not None
+        }
+
+    def process_webhook(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            event_type = data["event"]
+            if event_type.startswith("payment."):
+                resource = data["payment"]
+                return {
+                    "type": "transaction",
+                    "provider_transaction_id": resource["id"],
+                    "status": resource["status"]
+                }
+            elif event_type.startswith("subscription."):
+                resource = data["subscription"]
+                return {
+                    "type": "subscription",
+                    "provider_subscription_id": resource["id"],
+                    "status": resource["status"]
+                }
+            else:
+                raise ValueError(f"Type d'événement local non pris en charge : {event_type}")
+        except KeyError as e:
+            raise ValueError(f"Données de webhook local invalides : {str(e)}")
+
+    def create_subscription(self, amount: float, currency: str, interval: str, interval_count: int, payment_details: Dict[str, Any], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        self._simulate_call("create_subscription")
+        subscription_id = f"loc_sub_{uuid.uuid4().hex}"
+        start_date = datetime.utcnow()
+        self._store(self._subscriptions, subscription_id, {
+            "id": subscription_id,
+            "amount": amount,
+            "currency": currency,
+            "interval": interval,
+            "interval_count": interval_count,
+            "status": "active",
+            "start_date": start_date
+        })
+        return {
+            "provider_subscription_id": subscription_id,
+            "status": "active",
+            "start_date": start_date
+        }
+
+    def _get_subscription(self, provider_subscription_id: str) -> Dict[str, Any]:
+        with self._lock:
+            subscription = self._subscriptions.get(provider_subscription_id)
+        if subscription is None:
+            raise ValueError(f"Abonnement local non trouvé : {provider_subscription_id}")
+        return subscription
+
+    def cancel_subscription(self, provider_subscription_id: str) -> Dict[str, Any]:
+        self._simulate_call("cancel_subscription")
+        subscription = self._get_subscription(provider_subscription_id)
+        if subscription["status"] == "cancelled":
+            raise ValueError(f"Abonnement local déjà annulé : {provider_subscription_id}")
+        subscription["status"] = "cancelled"
+        if self._webhooks:
+            self._webhooks.schedule(time.time(), {
+                "event": "subscription.cancelled",
+                "subscription": {"id": provider_subscription_id, "status": "cancelled"}
+            })
+        return {
+            "status": "cancelled",
+            "provider_subscription_id": provider_subscription_id
+        }
+
+    def update_subscription(self, provider_subscription_id: str, new_plan: Dict[str, Any]) -> Dict[str, Any]:
+        self._simulate_call("update_subscription")
+        subscription = self._get_subscription(provider_subscription_id)
+        if subscription["status"] == "cancelled":
+            raise ValueError(f"Abonnement local annulé : {provider_subscription_id}")
+        for field in ("amount", "currency", "interval", "interval_count"):
+            if field in new_plan:
+                subscription[field] = new_plan[field]
+        return {
+            "status": subscription["status"],
+            "provider_subscription_id": provider_subscription_id
+        }
+
+    def create_customer(self, customer_data: Dict[str, Any]) -> Dict[str, Any]:
+        self._simulate_call("create_customer")
+        customer_id = f"loc_cus_{uuid.uuid4().hex}"
+        self._store(self._customers, customer_id, {
+            "id": customer_id,
+            "email": customer_data.get('email'),
+            "name": customer_data.get('name'),
+            "payment_method_ready_at": None
+        })
+        return {
+            "provider_customer_id": customer_id,
+            "email": customer_data.get('email'),
+            "name": customer_data.get('name')
+        }
+
+    def _get_customer(self, customer_id: str) -> Dict[str, Any]:
+        with self._lock:
+            customer = self._customers.get(customer_id)
+        if customer is None:
+            raise ValueError(f"Client local non trouvé : {customer_id}")
+        return customer
+
+    def customer_has_payment_method(self, customer_id: str) -> bool:
+        self._simulate_call("customer_has_payment_method")
+        ready_at = self._get_customer(customer_id)["payment_method_ready_at"]
+        return ready_at is not None and time.time() >= ready_at
+
+    def create_payment_setup_session(self, customer_id: str, success_url: str, cancel_url: str) -> Dict[str, Any]:
+        self._simulate_call("create_payment_setup_session")
+        customer = self._get_customer(customer_id)
+        # Le client « enregistre » sa carte au bout de settle_after secondes
+        customer["payment_method_ready_at"] = time.time() + self.settle_after
+        session_id = f"loc_setup_{uuid.uuid4().hex}"
+        return {
+            "id": session_id,
+            "url": f"{success_url}?local_setup_id={session_id}"
+        }
+
+    def set_default_payment_method(self, customer_id: str) -> bool:
+        return self.customer_has_payment_method(customer_id)
+
+    def create_product_and_price(self, product_data: dict) -> dict:
+        self._simulate_call("create_product_and_price")
+        return {
+            "product_id": f"loc_prod_{uuid.uuid4().hex}",
+            "price_id": f"loc_price_{uuid.uuid4().hex}"
+        }
+
+    def close(self) -> None:
+        if self._webhooks:
+            self._webhooks.stop()
+
+class WebhookEmitter:
+    """Envoie les webhooks du fournisseur local à leur date d'échéance, depuis un thread dédié."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self._queue: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.sent = 0
+        self.failed = 0
+
+    def schedule(self, due_at: float, payload: Dict[str, Any]) -> None:
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="local-webhook-emitter", daemon=True)
+                self._thread.start()
+            self._sequence += 1
+            heapq.heappush(self._queue, (due_at, self._sequence, payload))
+            self._condition.notify()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+
+    def _next_due(self) -> Optional[Dict[str, Any]]:
+        with self._condition:
+            while not self._stopping:
+                if self._queue and self._queue[0][0] <= time.time():
+                    return heapq.heappop(self._queue)[2]
+                timeout = self._queue[0][0] - time.time() if self._queue else None
+                self._condition.wait(timeout)
+            return None
+
+    def _run(self) -> None:
+        with httpx.Client(timeout=10.0) as client:
+            while True:
+                payload = self._next_due()
+                if payload is None:
+                    return
+                try:
+                    client.post(self.url, json=payload).raise_for_status()
+                    self.sent += 1
+                except httpx.HTTPError as e:
+                    self.failed += 1
+                    log.warning("local.webhook_failed", url=self.url, error=str(e))
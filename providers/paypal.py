@@ -1,20 +1,51 @@
 import paypalrestsdk
-from .base import PaymentProvider
+import requests
+from .base import PaymentProvider, error_chain
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 import json
 from constants import PAYMENT_STATUS
+from utils.plan_registry import BillingPlanRegistry, plan_key
+from utils.deadline import timeout_for
+from utils.log import get_logger
+
+log = get_logger(__name__)
+
+# Erreurs serveur de l'API PayPal et erreurs réseau de requests (utilisé par le SDK)
+PAYPAL_TRANSIENT_ERRORS = (paypalrestsdk.exceptions.ServerError, requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+class DeadlineApi(paypalrestsdk.Api):
+    """API du SDK PayPal dont chaque appel HTTP (jeton OAuth compris) a un délai, réduit au
+    temps restant de la requête en cours : le SDK appelle requests sans délai par défaut."""
+
+    def __init__(self, options: Dict[str, Any], timeout: float = 30.0):
+        super().__init__(options)
+        self.default_timeout = timeout
+
+    def http_call(self, url, method, **kwargs):
+        kwargs.setdefault("timeout", timeout_for(self.default_timeout))
+        return super().http_call(url, method, **kwargs)
 
 class PayPalProvider(PaymentProvider):
-    def __init__(self, client_id: str, client_secret: str, mode: str = "sandbox"):
-        paypalrestsdk.configure({
+    supports_idempotency_keys = True
+
+    def __init__(self, client_id: str, client_secret: str, mode: str = "sandbox", api_base: Optional[str] = None, timeout: float = 30.0):
+        options = {
             "mode": mode,
             "client_id": client_id,
             "client_secret": client_secret
-        })
+        }
+        if api_base:
+            options["endpoint"] = api_base
+        # Équivalent de paypalrestsdk.configure(options) : API par défaut de toutes les ressources du SDK
+        paypalrestsdk.api.__api__ = DeadlineApi(options, timeout=timeout)
+        self.plan_registry = BillingPlanRegistry()
 
-    def create_payment(self, amount: float, currency: str, payment_details: Dict[str, Any], success_url: str, cancel_url: str, metadata: Optional[Dict[str, Any]] = None, description: Optional[str] = None) -> Dict[str, Any]:
-        print(f"Tentative de création d'un paiement PayPal : montant={amount}, devise={currency}")
+    def is_transient_error(self, error: Exception) -> bool:
+        return super().is_transient_error(error) or any(isinstance(cause, PAYPAL_TRANSIENT_ERRORS) for cause in error_chain(error))
+
+    def create_payment(self, amount: float, currency: str, payment_details: Dict[str, Any], success_url: str, cancel_url: str, metadata: Optional[Dict[str, Any]] = None, description: Optional[str] = None, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        log.debug("paypal.payment.creating", amount=amount, currency=currency)
         try:
             payment = paypalrestsdk.Payment({
                 "intent": "sale",
@@ -34,11 +65,11 @@ class PayPalProvider(PaymentProvider):
                     "custom": json.dumps(metadata) if metadata else ""
                 }]
             })
-
-            print(f"Configuration du paiement PayPal : {payment}")
+            # Envoyé dans l'en-tête PayPal-Request-Id : PayPal renvoie le paiement déjà créé
+            payment.request_id = idempotency_key
 
             if payment.create():
-                print(f"Paiement PayPal créé avec succès : ID={payment.id}")
+                log.info("paypal.payment.created", payment_id=payment.id)
                 approval_url = next((link.href for link in payment.links if link.rel == "approval_url"), None)
                 if approval_url:
                     return {
@@ -54,16 +85,16 @@ class PayPalProvider(PaymentProvider):
                 else:
                     raise ValueError("URL d'approbation PayPal non trouvée")
             else:
-                print(f"Échec de la création du paiement PayPal : {payment.error}")
+                log.warning("paypal.payment.failed", error=payment.error)
                 raise ValueError(f"Erreur PayPal : {payment.error}")
         except paypalrestsdk.exceptions.ConnectionError as e:
-            print(f"Erreur de connexion PayPal : {str(e)}")
+            log.error("paypal.connection_error", error=str(e))
             raise ValueError("Erreur de connexion avec PayPal")
         except paypalrestsdk.exceptions.MissingConfig as e:
-            print(f"Erreur de configuration PayPal : {str(e)}")
+            log.error("paypal.config_error", error=str(e))
             raise ValueError("Configuration PayPal manquante ou incorrecte")
         except Exception as e:
-            print(f"Erreur inattendue lors de la création du paiement PayPal : {str(e)}")
+            log.exception("paypal.payment.error", error=str(e))
             raise ValueError(f"Erreur inattendue : {str(e)}")
 
     def _map_paypal_status(self, paypal_status: str) -> str:
@@ -115,86 +146,102 @@ class PayPalProvider(PaymentProvider):
         except Exception as e:
             raise ValueError(f"Erreur lors de la vérification du statut PayPal : {str(e)}")
 
-    def create_subscription(self, amount: float, currency: str, interval: str, interval_count: int, payment_details: Dict[str, Any]) -> Dict[str, Any]:
-        print(f"Création d'un abonnement PayPal : {amount} {currency} tous les {interval_count} {interval}(s)")
+    def create_subscription(self, amount: float, currency: str, interval: str, interval_count: int, payment_details: Dict[str, Any], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        log.debug("paypal.subscription.creating", amount=amount, currency=currency, interval=interval, interval_count=interval_count)
         try:
-            plan = paypalrestsdk.BillingPlan({
-                "name": f"Plan {amount} {currency} every {interval_count} {interval}",
-                "description": "Subscription plan",
-                "type": "INFINITE",
-                "payment_definitions": [{
-                    "name": "Regular payment definition",
-                    "type": "REGULAR",
-                    "frequency": interval.upper(),
-                    "frequency_interval": str(interval_count),
-                    "amount": {
-                        "value": str(amount),
-                        "currency": currency
-                    },
-                    "cycles": "0"
-                }],
-                "merchant_preferences": {
-                    "setup_fee": {
-                        "value": "0",
-                        "currency": currency
-                    },
-                    "return_url": payment_details.get("success_url", "http://example.com/success"),
-                    "cancel_url": payment_details.get("cancel_url", "http://example.com/cancel"),
-                    "auto_bill_amount": "YES",
-                    "initial_fail_amount_action": "CONTINUE",
-                    "max_fail_attempts": "3"
+            return_url = payment_details.get("success_url", "http://example.com/success")
+            cancel_url = payment_details.get("cancel_url", "http://example.com/cancel")
+            # Un plan actif existant est réutilisé : un seul appel à PayPal (l'accord) par souscription
+            plan_id = self.plan_registry.get_active_plan(
+                plan_key(amount, currency, interval, interval_count, return_url, cancel_url),
+                lambda: self._create_billing_plan(amount, currency, interval, interval_count, return_url, cancel_url),
+                self._activate_billing_plan
+            )
+
+            agreement = paypalrestsdk.BillingAgreement({
+                "name": "Subscription Agreement",
+                "description": "Subscription agreement for the plan",
+                "start_date": (datetime.utcnow() + timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "plan": {
+                    "id": plan_id
+                },
+                "payer": {
+                    "payment_method": "paypal"
                 }
             })
+            agreement.request_id = idempotency_key
 
-            print("Tentative de création du plan PayPal...")
-            if plan.create():
-                print(f"Plan PayPal créé avec succès. ID: {plan.id}")
-                
-                agreement = paypalrestsdk.BillingAgreement({
-                    "name": "Subscription Agreement",
-                    "description": "Subscription agreement for the plan",
-                    "start_date": (datetime.utcnow() + timedelta(minutes=5)).strftime("%Y-%m-%dT%H:%M:%SZ"),
-                    "plan": {
-                        "id": plan.id
-                    },
-                    "payer": {
-                        "payment_method": "paypal"
-                    }
-                })
-
-                print("Tentative de création de l'accord de facturation PayPal...")
-                if agreement.create():
-                    print(f"Accord de facturation PayPal créé avec succès. ID: {agreement.id}")
-                    for link in agreement.links:
-                        if link.rel == "approval_url":
-                            print(f"URL d'approbation PayPal trouvée : {link.href}")
-                            return {
-                                "provider_subscription_id": agreement.id,
-                                "status": "pending_user_action",
-                                "checkout_url": link.href,
-                                "provider_metadata": {
-                                    "paypal_status": agreement.state,
-                                    "payment_method": "to_be_determined"
-                                }
+            if agreement.create():
+                log.info("paypal.agreement.created", agreement_id=agreement.id, plan_id=plan_id)
+                for link in agreement.links:
+                    if link.rel == "approval_url":
+                        return {
+                            "provider_subscription_id": agreement.id,
+                            "status": "pending_user_action",
+                            "checkout_url": link.href,
+                            "provider_metadata": {
+                                "paypal_status": agreement.state,
+                                "payment_method": "to_be_determined"
                             }
-                    print("Erreur : URL d'approbation non trouvée dans la réponse PayPal")
-                    raise ValueError("URL d'approbation non trouvée dans la réponse PayPal")
-                else:
-                    print(f"Erreur lors de la création de l'accord de facturation : {agreement.error}")
-                    raise ValueError(f"Erreur PayPal lors de la création de l'accord : {agreement.error}")
+                        }
+                log.warning("paypal.agreement.no_approval_url", agreement_id=agreement.id)
+                raise ValueError("URL d'approbation non trouvée dans la réponse PayPal")
             else:
-                print(f"Erreur lors de la création du plan : {plan.error}")
-                raise ValueError(f"Erreur PayPal lors de la création du plan : {plan.error}")
+                log.warning("paypal.agreement.failed", error=agreement.error)
+                raise ValueError(f"Erreur PayPal lors de la création de l'accord : {agreement.error}")
         except paypalrestsdk.exceptions.ConnectionError as e:
-            print(f"Erreur de connexion PayPal : {str(e)}")
+            log.error("paypal.connection_error", error=str(e))
             raise ValueError("Erreur de connexion avec PayPal")
         except paypalrestsdk.exceptions.MissingConfig as e:
-            print(f"Erreur de configuration PayPal : {str(e)}")
+            log.error("paypal.config_error", error=str(e))
             raise ValueError("Configuration PayPal manquante ou incorrecte")
         except Exception as e:
-            print(f"Erreur inattendue lors de la création de l'abonnement PayPal : {str(e)}")
+            log.exception("paypal.subscription.error", error=str(e))
             raise ValueError(f"Erreur inattendue lors de la création de l'abonnement PayPal : {str(e)}")
 
+    def _create_billing_plan(self, amount: float, currency: str, interval: str, interval_count: int, return_url: str, cancel_url: str) -> str:
+        plan = paypalrestsdk.BillingPlan({
+            "name": f"Plan {amount} {currency} every {interval_count} {interval}",
+            "description": "Subscription plan",
+            "type": "INFINITE",
+            "payment_definitions": [{
+                "name": "Regular payment definition",
+                "type": "REGULAR",
+                "frequency": interval.upper(),
+                "frequency_interval": str(interval_count),
+                "amount": {
+                    "value": str(amount),
+                    "currency": currency
+                },
+                "cycles": "0"
+            }],
+            "merchant_preferences": {
+                "setup_fee": {
+                    "value": "0",
+                    "currency": currency
+                },
+                "return_url": return_url,
+                "cancel_url": cancel_url,
+                "auto_bill_amount": "YES",
+                "initial_fail_amount_action": "CONTINUE",
+                "max_fail_attempts": "3"
+            }
+        })
+
+        if not plan.create():
+            log.warning("paypal.plan.failed", error=plan.error)
+            raise ValueError(f"Erreur PayPal lors de la création du plan : {plan.error}")
+        log.info("paypal.plan.created", plan_id=plan.id)
+        return plan.id
+
+    def _activate_billing_plan(self, plan_id: str) -> None:
+        # Activation différée : effectuée une seule fois, au premier accord sur ce plan
+        plan = paypalrestsdk.BillingPlan({"id": plan_id})
+        if not plan.activate():
+            log.warning("paypal.plan.activation_failed", plan_id=plan_id, error=plan.error)
+            raise ValueError(f"Erreur PayPal lors de l'activation du plan : {plan.error}")
+        log.info("paypal.plan.activated", plan_id=plan_id)
+
     def cancel_subscription(self, provider_subscription_id: str) -> Dict[str, Any]:
         try:
             agreement = paypalrestsdk.BillingAgreement.find(provider_subscription_id)
@@ -208,16 +255,16 @@ class PayPalProvider(PaymentProvider):
                     }
                 }
             else:
-                print(f"Échec de l'annulation de l'abonnement PayPal : {agreement.error}")
+                log.warning("paypal.subscription.cancel_failed", subscription_id=provider_subscription_id, error=agreement.error)
                 raise ValueError(f"Erreur PayPal lors de l'annulation de l'abonnement : {agreement.error}")
         except paypalrestsdk.exceptions.ResourceNotFound:
-            print(f"Abonnement PayPal non trouvé : {provider_subscription_id}")
+            log.warning("paypal.subscription.not_found", subscription_id=provider_subscription_id)
             raise ValueError(f"Abonnement PayPal non trouvé : {provider_subscription_id}")
         except paypalrestsdk.exceptions.ConnectionError as e:
-            print(f"Erreur de connexion PayPal : {str(e)}")
+            log.error("paypal.connection_error", error=str(e))
             raise ValueError("Erreur de connexion avec PayPal")
         except Exception as e:
-            print(f"Erreur inattendue lors de l'annulation de l'abonnement PayPal : {str(e)}")
+            log.exception("paypal.subscription.cancel_error", error=str(e))
             raise ValueError(f"Erreur inattendue : {str(e)}")
 
     def process_webhook(self, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -263,6 +310,8 @@ class PayPalProvider(PaymentProvider):
             raise ValueError(f"Erreur lors du traitement du webhook PayPal : {str(e)}")
         
     def update_subscription(self, provider_subscription_id: str, new_plan: Dict[str, Any]) -> Dict[str, Any]:
+        # Les accords PayPal ne permettent pas de changer de plan : annulation puis nouvel accord,
+        # sur un plan réutilisé depuis le registre
         # Annuler l'ancien abonnement
         cancellation_result = self.cancel_subscription(provider_subscription_id)
         
@@ -1,38 +1,214 @@
-import requests
+import httpx
 from typing import Dict, Any, Optional
-from .base import PaymentProvider
+from .base import PaymentProvider, AsyncPaymentProvider, error_chain
 from config import settings
 from constants import PAYMENT_STATUS
+from utils.deadline import timeout_for
 import hmac
 import hashlib
 import base64
+import importlib.util
+import threading
+from utils.log import get_logger
+
+log = get_logger(__name__)
+
+def _http2_available() -> bool:
+    # HTTP/2 nécessite le paquet optionnel `h2` (pip install httpx[http2])
+    return importlib.util.find_spec("h2") is not None
+
+class _PoolCounter:
+    """Requêtes confiées au transport httpx, comptées par le client lui-même.
+
+    httpx n'expose pas l'état de son pool de connexions : une requête est comptée de son entrée
+    dans le transport jusqu'à la fermeture de sa réponse, le temps où elle occupe ou attend une connexion.
+    """
+
+    def __init__(self, pool_size: int, http2: bool):
+        self.pool_size = pool_size
+        self.http2 = http2
+        self.requests_total = 0
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            self.requests_total += 1
+            self.in_flight += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Statistiques du pool, utiles pour dimensionner `pool_size`."""
+        with self._lock:
+            in_flight, requests_total = self.in_flight, self.requests_total
+        if self.http2:
+            # Les requêtes HTTP/2 se partagent une connexion : l'occupation du pool ne se déduit pas des requêtes
+            active, queued = "unavailable", "unavailable"
+        else:
+            # En HTTP/1.1, chaque requête en cours occupe une connexion ou en attend une
+            active, queued = min(in_flight, self.pool_size), max(in_flight - self.pool_size, 0)
+        return {
+            "pool_size": self.pool_size,
+            "active_connections": active,
+            "idle_connections": "unavailable",
+            "queued_requests": queued,
+            "in_flight_requests": in_flight,
+            "requests_total": requests_total,
+        }
+
+class _CountedStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, counter: _PoolCounter):
+        self._stream = stream
+        self._counter = counter
+        self._released = False
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            if not self._released:
+                self._released = True
+                self._counter.release()
+
+class _AsyncCountedStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, counter: _PoolCounter):
+        self._stream = stream
+        self._counter = counter
+        self._released = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._released:
+                self._released = True
+                self._counter.release()
+
+class _CountingTransport(httpx.BaseTransport):
+    """Transport httpx standard qui tient à jour un _PoolCounter."""
+
+    def __init__(self, transport: httpx.BaseTransport, counter: _PoolCounter):
+        self._transport = transport
+        self.counter = counter
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.counter.acquire()
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            self.counter.release()
+            raise
+        return httpx.Response(response.status_code, headers=response.headers, stream=_CountedStream(response.stream, self.counter), extensions=response.extensions)
+
+    def close(self) -> None:
+        self._transport.close()
+
+class _AsyncCountingTransport(httpx.AsyncBaseTransport):
+    """Version asynchrone de _CountingTransport."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, counter: _PoolCounter):
+        self._transport = transport
+        self.counter = counter
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.counter.acquire()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self.counter.release()
+            raise
+        return httpx.Response(response.status_code, headers=response.headers, stream=_AsyncCountedStream(response.stream, self.counter), extensions=response.extensions)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+def _is_transient_http_error(error: BaseException) -> bool:
+    # Erreurs réseau (connexion, délai dépassé) et réponses 429 ou 5xx de l'API
+    if isinstance(error, httpx.TransportError):
+        return True
+    return isinstance(error, httpx.HTTPStatusError) and (error.response.status_code == 429 or error.response.status_code >= 500)
 
 class RevolutProvider(PaymentProvider):
-    def __init__(self, public_key: str, secret_key: str, mode: str = "sandbox"):
+    def __init__(self, public_key: str, secret_key: str, mode: str = "sandbox", pool_size: int = 10, keepalive_expiry: float = 30.0, connect_timeout: float = 5.0, read_timeout: float = 15.0, http2: bool = False, api_base: Optional[str] = None):
         self.public_key = public_key
         self.secret_key = secret_key
         self.mode = mode
-        self.base_url = "https://sandbox-merchant.revolut.com/api" if mode == "sandbox" else "https://merchant.revolut.com/api"
+        self.base_url = api_base or ("https://sandbox-merchant.revolut.com/api" if mode == "sandbox" else "https://merchant.revolut.com/api")
         self.api_version = "2024-09-01"
+        self.pool_size = pool_size
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        if http2 and not _http2_available():
+            log.warning("revolut.http2_unavailable")
+            http2 = False
+        self.http2 = http2
+        self._pool_counter = _PoolCounter(pool_size, http2)
+        # Client HTTP persistant : les connexions TCP+TLS sont réutilisées entre les appels
+        self._client = httpx.Client(transport=_CountingTransport(httpx.HTTPTransport(**self._transport_options()), self._pool_counter), **self._client_options())
 
-    def _make_request(self, method: str, endpoint: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        headers = {
-            "Authorization": f"Bearer {self.secret_key}",
-            "Revolut-Api-Version": self.api_version,
-            "Content-Type": "application/json"
+    def _transport_options(self) -> Dict[str, Any]:
+        return {
+            "limits": httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            "http2": self.http2
+        }
+
+    def _client_options(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "headers": {
+                "Authorization": f"Bearer {self.secret_key}",
+                "Revolut-Api-Version": self.api_version,
+                "Content-Type": "application/json"
+            },
+            "timeout": httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
         }
-        url = f"{self.base_url}{endpoint}"
-        response = requests.request(method, url, headers=headers, json=data)
+
+    def _request_timeout(self) -> httpx.Timeout:
+        # Délais du client réduits au temps restant de la requête en cours
+        return httpx.Timeout(timeout_for(self.read_timeout), connect=timeout_for(self.connect_timeout))
+
+    def _make_request(self, method: str, endpoint: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        response = self._client.request(method, endpoint, json=data, timeout=self._request_timeout())
+        return self._handle_response(response)
+
+    @staticmethod
+    def _handle_response(response: httpx.Response) -> Dict[str, Any]:
         try:
             response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            print(f"Erreur HTTP: {e}")
-            print(f"Contenu de la réponse: {response.text}")
+        except httpx.HTTPStatusError as e:
+            log.warning("revolut.http_error", status_code=response.status_code, url=str(response.request.url), body=response.text)
             raise
         return response.json()
 
-    def create_payment(self, amount: float, currency: str, payment_details: Dict[str, Any], success_url: str, cancel_url: str, metadata: Optional[Dict[str, Any]] = None, description: Optional[str] = None, capture_mode: str = "automatic"):
-        data = {
+    def pool_stats(self) -> Dict[str, Any]:
+        return self._pool_counter.stats()
+
+    def is_transient_error(self, error: Exception) -> bool:
+        return super().is_transient_error(error) or any(_is_transient_http_error(cause) for cause in error_chain(error))
+
+    def close(self) -> None:
+        self._client.close()
+
+    def as_async(self, max_workers: int = 8) -> AsyncPaymentProvider:
+        return AsyncRevolutProvider(self)
+
+    def _build_order(self, amount: float, currency: str, payment_details: Dict[str, Any], success_url: str, cancel_url: str, metadata: Optional[Dict[str, Any]], description: Optional[str], capture_mode: str) -> Dict[str, Any]:
+        return {
             "amount": int(amount * 100),  # Revolut utilise les centimes
             "currency": currency,
             "capture_mode": capture_mode,
@@ -46,42 +222,52 @@ class RevolutProvider(PaymentProvider):
                 "failure_url": cancel_url
             }
         }
-        
+
+    @staticmethod
+    def _payment_result(response: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "provider_transaction_id": response["id"],
+            "status": "pending",
+            "checkout_url": response["checkout_url"],
+            "client_secret": "",  # Revolut n'utilise pas de client_secret
+            "provider_metadata": response
+        }
+
+    @staticmethod
+    def _status_result(response: Dict[str, Any]) -> Dict[str, Any]:
+        revolut_status = response["state"]
+
+        # Mapper le statut Revolut à notre statut unifié
+        if revolut_status == "COMPLETED":
+            unified_status = PAYMENT_STATUS['COMPLETED']
+        elif revolut_status in ["PROCESSING", "AUTHORISED"]:
+            unified_status = PAYMENT_STATUS['PROCESSING']
+        elif revolut_status == "PENDING":
+            unified_status = PAYMENT_STATUS['PENDING']
+        elif revolut_status == "CANCELLED":
+            unified_status = PAYMENT_STATUS['CANCELLED']
+        else:
+            unified_status = PAYMENT_STATUS['FAILED']
+
+        return {
+            'status': unified_status,
+            'provider_status': revolut_status,
+            'details': response
+        }
+
+    def create_payment(self, amount: float, currency: str, payment_details: Dict[str, Any], success_url: str, cancel_url: str, metadata: Optional[Dict[str, Any]] = None, description: Optional[str] = None, capture_mode: str = "automatic", idempotency_key: Optional[str] = None):
+        data = self._build_order(amount, currency, payment_details, success_url, cancel_url, metadata, description, capture_mode)
         try:
             response = self._make_request("POST", "/orders", data)
-            return {
-                "provider_transaction_id": response["id"],
-                "status": "pending",
-                "checkout_url": response["checkout_url"],
-                "client_secret": "",  # Revolut n'utilise pas de client_secret
-                "provider_metadata": response
-            }
-        except requests.exceptions.RequestException as e:
+            return self._payment_result(response)
+        except httpx.HTTPError as e:
             raise ValueError(f"Erreur Revolut : {str(e)}")
 
     def check_payment_status(self, provider_transaction_id: str) -> Dict[str, Any]:
         try:
             response = self._make_request("GET", f"/orders/{provider_transaction_id}")
-            revolut_status = response["state"]
-            
-            # Mapper le statut Revolut à notre statut unifié
-            if revolut_status == "COMPLETED":
-                unified_status = PAYMENT_STATUS['COMPLETED']
-            elif revolut_status in ["PROCESSING", "AUTHORISED"]:
-                unified_status = PAYMENT_STATUS['PROCESSING']
-            elif revolut_status == "PENDING":
-                unified_status = PAYMENT_STATUS['PENDING']
-            elif revolut_status == "CANCELLED":
-                unified_status = PAYMENT_STATUS['CANCELLED']
-            else:
-                unified_status = PAYMENT_STATUS['FAILED']
-            
-            return {
-                'status': unified_status,
-                'provider_status': revolut_status,
-                'details': response
-            }
-        except requests.exceptions.RequestException as e:
+            return self._status_result(response)
+        except httpx.HTTPError as e:
             raise ValueError(f"Erreur lors de la vérification du statut Revolut : {str(e)}")
 
     def process_webhook(self, data: Dict[str, Any]) -> Dict[str, Any]:
@@ -114,7 +300,7 @@ class RevolutProvider(PaymentProvider):
         except Exception as e:
             raise ValueError(f"Erreur lors du traitement du webhook Revolut : {str(e)}")
 
-    def create_subscription(self, amount: float, currency: str, interval: str, interval_count: int, payment_details: Dict[str, Any]) -> Dict[str, Any]:
+    def create_subscription(self, amount: float, currency: str, interval: str, interval_count: int, payment_details: Dict[str, Any], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
         # Note: Revolut ne semble pas avoir d'API pour les abonnements récurrents.
         # Cette méthode est un placeholder et devrait être implémentée si Revolut ajoute le support des abonnements.
         raise NotImplementedError("Les abonnements ne sont pas encore supportés par l'API Revolut.")
@@ -130,4 +316,55 @@ class RevolutProvider(PaymentProvider):
     def verify_webhook_signature(self, payload: str, signature: str, webhook_secret: str) -> bool:
         # Implémentation de la vérification de signature HMAC pour les webhooks Revolut
         expected_signature = base64.b64encode(hmac.new(webhook_secret.encode(), payload.encode(), hashlib.sha256).digest()).decode()
-        return hmac.compare_digest(signature, expected_signature)
\ No newline at end of file
+        return hmac.compare_digest(signature, expected_signature)
+
+class AsyncRevolutProvider(AsyncPaymentProvider):
+    """Client Revolut asynchrone natif, avec son propre pool de connexions keep-alive."""
+
+    def __init__(self, provider: RevolutProvider):
+        self.provider = provider
+        self.name = provider.__class__.__name__
+        self._pool_counter = _PoolCounter(provider.pool_size, provider.http2)
+        self._client = httpx.AsyncClient(transport=_AsyncCountingTransport(httpx.AsyncHTTPTransport(**provider._transport_options()), self._pool_counter), **provider._client_options())
+
+    async def _make_request(self, method: str, endpoint: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        response = await self._client.request(method, endpoint, json=data, timeout=self.provider._request_timeout())
+        return self.provider._handle_response(response)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return self._pool_counter.stats()
+
+    def is_transient_error(self, error: Exception) -> bool:
+        return self.provider.is_transient_error(error)
+
+    async def create_payment(self, amount: float, currency: str, payment_details: Dict[str, Any], success_url: str, cancel_url: str, metadata: Optional[Dict[str, Any]] = None, description: Optional[str] = None, capture_mode: str = "automatic", idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        data = self.provider._build_order(amount, currency, payment_details, success_url, cancel_url, metadata, description, capture_mode)
+        try:
+            response = await self._make_request("POST", "/orders", data)
+            return self.provider._payment_result(response)
+        except httpx.HTTPError as e:
+            raise ValueError(f"Erreur Revolut : {str(e)}")
+
+    async def check_payment_status(self, provider_transaction_id: str) -> Dict[str, Any]:
+        try:
+            response = await self._make_request("GET", f"/orders/{provider_transaction_id}")
+            return self.provider._status_result(response)
+        except httpx.HTTPError as e:
+            raise ValueError(f"Erreur lors de la vérification du statut Revolut : {str(e)}")
+
+    async def process_webhook(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        # Traitement purement local, sans appel réseau
+        return self.provider.process_webhook(data)
+
+    async def create_subscription(self, amount: float, currency: str, interval: str, interval_count: int, payment_details: Dict[str, Any], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        return self.provider.create_subscription(amount, currency, interval, interval_count, payment_details)
+
+    async def cancel_subscription(self, provider_subscription_id: str) -> Dict[str, Any]:
+        return self.provider.cancel_subscription(provider_subscription_id)
+
+    async def update_subscription(self, provider_subscription_id: str, new_plan: Dict[str, Any]) -> Dict[str, Any]:
+        return self.provider.update_subscription(provider_subscription_id, new_plan)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+        self.provider.close()
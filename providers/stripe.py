@@ -1,17 +1,51 @@
 import stripe
 from config import settings
-from .base import PaymentProvider
-from typing import Dict, Any, Optional
+from .base import PaymentProvider, error_chain
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from constants import PAYMENT_STATUS
+from utils.price_registry import PriceRegistry, price_key
+from utils.deadline import timeout_for
+from utils.log import get_logger
+
+log = get_logger(__name__)
+
+# Erreurs réseau, limitation de débit et erreurs serveur de l'API Stripe
+STRIPE_TRANSIENT_ERRORS = (stripe.error.APIConnectionError, stripe.error.RateLimitError, stripe.error.APIError)
+
+class DeadlineRequestsClient(stripe.RequestsClient):
+    """Client HTTP du SDK Stripe dont le délai de chaque appel est réduit au temps restant
+    de la requête en cours. Le délai est lu à chaque appel (le client est partagé entre les threads)."""
+
+    def __init__(self, timeout: float = 30.0, **kwargs):
+        self.default_timeout = timeout
+        super().__init__(timeout=timeout, **kwargs)
+
+    @property
+    def _timeout(self) -> float:
+        return timeout_for(self.default_timeout)
+
+    @_timeout.setter
+    def _timeout(self, timeout: float) -> None:
+        self.default_timeout = timeout
 
 class StripeProvider(PaymentProvider):
-    def __init__(self, public_key: str, secret_key: str):
+    supports_idempotency_keys = True
+
+    def __init__(self, public_key: str, secret_key: str, api_base: Optional[str] = None, timeout: float = 30.0):
         self.public_key = public_key
         stripe.api_key = secret_key
-        print(f"Stripe API Key: {stripe.api_key[:5]}...{stripe.api_key[-5:]}")
+        if api_base:
+            stripe.api_base = api_base
+        # Sans client explicite, le SDK attend jusqu'à 80 s chaque réponse
+        stripe.default_http_client = DeadlineRequestsClient(timeout=timeout)
+        self.price_registry = PriceRegistry()
+        log.debug("stripe.configured", api_key=f"{secret_key[:5]}...{secret_key[-5:]}")
 
-    def create_payment(self, amount: float, currency: str, payment_details: Dict[str, Any], success_url: str, cancel_url: str, metadata: Optional[Dict[str, Any]] = None, description: Optional[str] = None) -> Dict[str, Any]:
+    def is_transient_error(self, error: Exception) -> bool:
+        return super().is_transient_error(error) or any(isinstance(cause, STRIPE_TRANSIENT_ERRORS) for cause in error_chain(error))
+
+    def create_payment(self, amount: float, currency: str, payment_details: Dict[str, Any], success_url: str, cancel_url: str, metadata: Optional[Dict[str, Any]] = None, description: Optional[str] = None, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
         try:
             session = stripe.checkout.Session.create(
                 payment_method_types=['card'],
@@ -28,7 +62,8 @@ class StripeProvider(PaymentProvider):
                 mode='payment',
                 success_url=success_url,
                 cancel_url=cancel_url,
-                metadata=metadata
+                metadata=metadata,
+                idempotency_key=idempotency_key
             )
             return {
                 "provider_transaction_id": session.id,
@@ -59,30 +94,59 @@ class StripeProvider(PaymentProvider):
             else:
                 raise ValueError(f"ID de transaction non reconnu : {provider_transaction_id}")
 
-            # Mapper le statut Stripe à notre statut unifié
-            if stripe_status == 'succeeded':
-                unified_status = PAYMENT_STATUS['COMPLETED']
-            elif stripe_status in ['processing', 'requires_action', 'requires_confirmation']:
-                unified_status = PAYMENT_STATUS['PROCESSING']
-            elif stripe_status in ['requires_payment_method', 'requires_capture']:
-                unified_status = PAYMENT_STATUS['PENDING']
-            elif stripe_status == 'canceled':
-                unified_status = PAYMENT_STATUS['CANCELLED']
-            else:
-                unified_status = PAYMENT_STATUS['FAILED']
+            return self._status_result(provider_transaction_id, stripe_status, details)
 
-            return {
-                'status': unified_status,
-                'provider_status': stripe_status,
-                'details': {
-                    'id': provider_transaction_id,
-                    'amount': details.get('amount') or getattr(details, 'amount', None),
-                    'currency': details.get('currency') or getattr(details, 'currency', None),
-                    'payment_method': details.get('payment_method') or getattr(details, 'payment_method', None),
-                    'customer': details.get('customer') or getattr(details, 'customer', None),
-                }
+        except stripe.error.StripeError as e:
+            raise ValueError(f"Erreur Stripe : {str(e)}")
+
+    def _status_result(self, provider_transaction_id: str, stripe_status: str, details: Any) -> Dict[str, Any]:
+        # Mapper le statut Stripe à notre statut unifié
+        if stripe_status == 'succeeded':
+            unified_status = PAYMENT_STATUS['COMPLETED']
+        elif stripe_status in ['processing', 'requires_action', 'requires_confirmation']:
+            unified_status = PAYMENT_STATUS['PROCESSING']
+        elif stripe_status in ['requires_payment_method', 'requires_capture']:
+            unified_status = PAYMENT_STATUS['PENDING']
+        elif stripe_status == 'canceled':
+            unified_status = PAYMENT_STATUS['CANCELLED']
+        else:
+            unified_status = PAYMENT_STATUS['FAILED']
+
+        return {
+            'status': unified_status,
+            'provider_status': stripe_status,
+            'details': {
+                'id': provider_transaction_id,
+                'amount': getattr(details, 'amount', None),
+                'currency': getattr(details, 'currency', None),
+                'payment_method': getattr(details, 'payment_method', None),
+                'customer': getattr(details, 'customer', None),
             }
+        }
 
+    def list_payment_statuses(self, provider_transaction_ids: List[str], created_after: datetime) -> Dict[str, Dict[str, Any]]:
+        """Récupère en une pagination les statuts des sessions et PaymentIntents créés depuis `created_after`."""
+        wanted = set(provider_transaction_ids)
+        created = {"gte": int(created_after.timestamp())}
+        statuses = {}
+        try:
+            if any(transaction_id.startswith('cs_') for transaction_id in wanted):
+                sessions = stripe.checkout.Session.list(created=created, limit=100, expand=['data.payment_intent'])
+                for session in sessions.auto_paging_iter():
+                    if session.id not in wanted:
+                        continue
+                    # Le PaymentIntent est inclus dans la liste : pas de second appel par session
+                    payment_intent = session.payment_intent
+                    if payment_intent and not isinstance(payment_intent, str):
+                        statuses[session.id] = self._status_result(session.id, payment_intent.status, payment_intent)
+                    elif not payment_intent:
+                        statuses[session.id] = self._status_result(session.id, session.status, session)
+            if any(transaction_id.startswith('pi_') for transaction_id in wanted):
+                payment_intents = stripe.PaymentIntent.list(created=created, limit=100)
+                for payment_intent in payment_intents.auto_paging_iter():
+                    if payment_intent.id in wanted:
+                        statuses[payment_intent.id] = self._status_result(payment_intent.id, payment_intent.status, payment_intent)
+            return statuses
         except stripe.error.StripeError as e:
             raise ValueError(f"Erreur Stripe : {str(e)}")
 
@@ -111,22 +175,21 @@ class StripeProvider(PaymentProvider):
         except Exception as e:
             raise ValueError(f"Erreur lors du traitement du webhook : {str(e)}")
         
-    def create_subscription(self, amount: float, currency: str, interval: str, interval_count: int, payment_details: Dict[str, Any]) -> Dict[str, Any]:
+    def create_subscription(self, amount: float, currency: str, interval: str, interval_count: int, payment_details: Dict[str, Any], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
         try:
             customer_id = payment_details.get('customer_id')
             if not customer_id:
                 raise ValueError("customer_id est requis pour créer un abonnement")
 
-            product = stripe.Product.create(name=f"Subscription {amount} {currency} every {interval_count} {interval}")
-            price = stripe.Price.create(
-                unit_amount=int(amount * 100),
-                currency=currency,
-                recurring={"interval": interval, "interval_count": interval_count},
-                product=product.id,
+            # Un prix existant est réutilisé : un seul appel à Stripe par souscription
+            price_id = self.price_registry.get_or_create(
+                price_key(amount, currency, interval, interval_count),
+                lambda: self._create_recurring_price(amount, currency, interval, interval_count)
             )
             subscription = stripe.Subscription.create(
                 customer=customer_id,
-                items=[{"price": price.id}],
+                items=[{"price": price_id}],
+                idempotency_key=idempotency_key,
             )
             return {
                 "provider_subscription_id": subscription.id,
@@ -136,6 +199,33 @@ class StripeProvider(PaymentProvider):
         except stripe.error.StripeError as e:
             raise ValueError(f"Erreur Stripe : {str(e)}")
 
+    def _create_recurring_price(self, amount: float, currency: str, interval: str, interval_count: int) -> Tuple[str, str]:
+        product = stripe.Product.create(name=f"Subscription {amount} {currency} every {interval_count} {interval}")
+        price = stripe.Price.create(
+            unit_amount=int(round(amount * 100)),
+            currency=currency,
+            recurring={"interval": interval, "interval_count": interval_count},
+            product=product.id,
+        )
+        return price.id, product.id
+
+    def warm_price_registry(self) -> int:
+        """Charge les prix persistés puis enregistre les prix récurrents actifs existant chez Stripe."""
+        self.price_registry.load()
+        try:
+            prices = stripe.Price.list(active=True, type="recurring", limit=100)
+            return self.price_registry.warm(
+                (
+                    price_key(price.unit_amount / 100, price.currency, price.recurring.interval, price.recurring.interval_count),
+                    price.id,
+                    price.product
+                )
+                for price in prices.auto_paging_iter()
+                if price.unit_amount is not None
+            )
+        except stripe.error.StripeError as e:
+            raise ValueError(f"Erreur Stripe : {str(e)}")
+
     def cancel_subscription(self, provider_subscription_id: str) -> Dict[str, Any]:
         try:
             subscription = stripe.Subscription.delete(provider_subscription_id)
@@ -219,19 +309,22 @@ class StripeProvider(PaymentProvider):
         
     def create_product_and_price(self, product_data: dict) -> dict:
         try:
+            # Montant en centimes arrondi une seule fois : le prix créé et sa clé dans le registre concordent
+            key = price_key(product_data["amount"], product_data["currency"], product_data["interval"], product_data["interval_count"])
             product = stripe.Product.create(
                 name=product_data["name"],
                 description=product_data["description"]
             )
             price = stripe.Price.create(
                 product=product.id,
-                unit_amount=int(product_data["amount"] * 100),
+                unit_amount=key[0],
                 currency=product_data["currency"],
                 recurring={
                     "interval": product_data["interval"],
                     "interval_count": product_data["interval_count"]
                 }
             )
+            self.price_registry.register(key, price.id, product.id)
             return {
                 "product_id": product.id,
                 "price_id": price.id
@@ -0,0 +1,49 @@
+import secrets
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Any, Dict, List, Optional
+from config import settings
+from utils.profiler import ProfilerBusy, collapsed, sample_stacks
+from utils.provider_loader import provider_registry
+from utils.startup import startup_timer
+from utils.tracing import SlowRequestBuffer, TracedRoute
+
+# Requêtes lentes conservées par le middleware de traçage
+slow_requests = SlowRequestBuffer(size=settings.tracing_buffer_size, threshold=settings.tracing_slow_threshold_ms / 1000)
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)) -> None:
+    # Sans ADMIN_TOKEN, les endpoints d'administration et d'export restent fermés
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Endpoints d'administration désactivés : ADMIN_TOKEN n'est pas défini")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token.encode(), settings.admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Jeton d'administration invalide")
+
+router = APIRouter(prefix="/admin", tags=["admin"], route_class=TracedRoute, dependencies=[Depends(require_admin_token)])
+
+@router.get("/slow-requests", response_model=List[Dict[str, Any]],
+            summary="Requêtes les plus lentes",
+            response_description="Requêtes récentes ayant dépassé le seuil, avec le détail de leurs spans")
+async def get_slow_requests(limit: int = Query(20, ge=1, le=1000, description="Nombre maximal de requêtes retournées")):
+    return slow_requests.slowest(limit)
+
+@router.get("/startup", response_model=Dict[str, Any],
+            summary="Rapport de démarrage du worker",
+            response_description="Durée des étapes du démarrage, fournisseurs activés et chargés, durées d'import et d'initialisation de chaque fournisseur")
+async def get_startup_report():
+    return {**startup_timer.report(), "providers": provider_registry.report()}
+
+@router.post("/profile", response_class=PlainTextResponse,
+             summary="Profiler le worker",
+             response_description="Piles échantillonnées au format collapsed (flamegraph.pl, speedscope)")
+async def profile(
+    seconds: float = Query(10.0, gt=0, description="Durée du profil en secondes"),
+    interval_ms: float = Query(5.0, ge=1, description="Intervalle entre deux échantillons en millisecondes")
+):
+    if seconds > settings.profiler_max_seconds:
+        raise HTTPException(status_code=400, detail=f"Durée maximale : {settings.profiler_max_seconds} secondes")
+    try:
+        stacks = await run_in_threadpool(sample_stacks, seconds, interval_ms / 1000)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(collapsed(stacks))
@@ -0,0 +1,35 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
+from fastapi.responses import StreamingResponse
+from config import settings
+from routes.admin import require_admin_token
+from utils.export import EXPORT_FORMATS, EXPORT_TABLES, iter_export
+from utils.pagination import naive_utc
+from utils.tracing import TracedRoute
+
+router = APIRouter(prefix="/exports", tags=["exports"], route_class=TracedRoute, dependencies=[Depends(require_admin_token)])
+
+@router.get("/{table}",
+            summary="Exporter une table",
+            response_description="Le contenu de la table en NDJSON ou en CSV, envoyé au fil de la lecture",
+            description="Exporte les transactions ou les abonnements (y compris custom_metadata) sans charger la table en mémoire : les lignes sont lues par paquets avec un curseur côté serveur et envoyées au fur et à mesure, éventuellement compressées en gzip.")
+async def export_table(
+    table: str = Path(..., description=f"Table à exporter : {', '.join(EXPORT_TABLES)}"),
+    format: str = Query("ndjson", description=f"Format de sortie : {', '.join(EXPORT_FORMATS)}"),
+    gzip: bool = Query(False, description="Compresse l'export au format gzip"),
+    created_after: Optional[datetime] = Query(None, description="Date minimale incluse (created_at des transactions, start_date des abonnements)"),
+    created_before: Optional[datetime] = Query(None, description="Date maximale exclue")
+):
+    if table not in EXPORT_TABLES:
+        raise HTTPException(status_code=404, detail=f"Table non exportable : {table}")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format d'export inconnu : {format}")
+
+    filename = f"{table}.{format}" + (".gz" if gzip else "")
+    # Itérateur synchrone : Starlette lit chaque morceau dans le pool de threads
+    return StreamingResponse(
+        iter_export(table, format, gzip, naive_utc(created_after), naive_utc(created_before), settings.export_chunk_size),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -0,0 +1,54 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from utils.metrics import registry, Counter, Gauge
+from utils.webhook_queue import webhook_queue
+from utils.status_cache import status_cache
+from utils.log import logging_stats
+from utils.provider_loader import async_payment_providers, provider_router
+from constants import CIRCUIT_STATE
+from utils.tracing import TracedRoute
+
+router = APIRouter(tags=["metrics"], route_class=TracedRoute)
+
+webhook_queue_depth = registry.register(Gauge("webhook_queue_depth", "Webhooks en attente ou en cours de traitement"))
+webhook_queue_lag = registry.register(Gauge("webhook_queue_drain_lag_seconds", "Âge du plus ancien webhook non traité"))
+status_cache_entries = registry.register(Gauge("status_cache_entries", "Entrées du cache des statuts de paiement"))
+status_cache_lookups = registry.register(Counter("status_cache_lookups_total", "Consultations du cache des statuts depuis le démarrage", ("result",)))
+log_records_dropped = registry.register(Counter("log_records_dropped_total", "Entrées de journal abandonnées (file pleine)"))
+provider_latency_ewma = registry.register(Gauge("provider_create_latency_ewma_seconds", "Durée moyenne (EWMA) des créations de paiement, utilisée par le routage", ("provider",)))
+provider_error_rate = registry.register(Gauge("provider_error_rate", "Taux d'erreur transitoire (EWMA) des créations de paiement, utilisé par le routage", ("provider",)))
+provider_in_flight = registry.register(Gauge("provider_in_flight_calls", "Appels en cours auprès du fournisseur", ("provider",)))
+provider_queued = registry.register(Gauge("provider_queued_calls", "Appels en attente d'une place auprès du fournisseur (cloisonnement)", ("provider",)))
+provider_circuit_state = registry.register(Gauge("provider_circuit_state", "État du disjoncteur du fournisseur (0 fermé, 1 appel de test, 2 ouvert)", ("provider",)))
+
+CIRCUIT_STATE_VALUES = {CIRCUIT_STATE['CLOSED']: 0, CIRCUIT_STATE['HALF_OPEN']: 1, CIRCUIT_STATE['OPEN']: 2}
+
+def collect() -> None:
+    queue_stats = webhook_queue.stats()
+    webhook_queue_depth.set(queue_stats["depth"])
+    webhook_queue_lag.set(queue_stats["drain_lag_seconds"])
+    cache_stats = status_cache.stats()
+    status_cache_entries.set(cache_stats["size"])
+    status_cache_lookups.set_total(cache_stats["hits"], "hit")
+    status_cache_lookups.set_total(cache_stats["misses"], "miss")
+    log_records_dropped.set_total(logging_stats()["dropped"])
+    # Fournisseurs déjà chargés : l'export ne déclenche pas le chargement des autres
+    for provider_key, provider in async_payment_providers.loaded().items():
+        provider_circuit_state.set(CIRCUIT_STATE_VALUES[provider.breaker.state], provider_key)
+        provider_in_flight.set(provider.bulkhead.in_flight, provider_key)
+        provider_queued.set(provider.bulkhead.queued, provider_key)
+        health = provider_router.health(provider_key)
+        if health.latency is not None:
+            provider_latency_ewma.set(health.latency, provider_key)
+        provider_error_rate.set(health.error_rate(), provider_key)
+
+registry.add_collector(collect)
+
+@router.get("/metrics", response_class=PlainTextResponse,
+            summary="Métriques au format Prometheus",
+            response_description="Métriques au format texte Prometheus")
+async def get_metrics():
+    # L'export interroge la base (profondeur de la file) : exécuté hors de la boucle d'événements
+    content = await run_in_threadpool(registry.render)
+    return PlainTextResponse(content, media_type="text/plain; version=0.0.4; charset=utf-8")
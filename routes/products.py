@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from providers.base import PaymentProvider
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from providers.base import AsyncPaymentProvider
 from database import get_db
 from utils.provider_loader import get_payment_provider
+from utils.resilience import provider_http_error
 from pydantic import BaseModel
+from utils.tracing import TracedRoute
 
-router = APIRouter(tags=["products"])
+router = APIRouter(tags=["products"], route_class=TracedRoute)
 
 class ProductCreate(BaseModel):
     name: str
@@ -19,14 +21,14 @@ class ProductCreate(BaseModel):
 async def create_product_and_price(
     product: ProductCreate,
     provider: str = "stripe",
-    db: Session = Depends(get_db),
-    payment_provider: PaymentProvider = Depends(get_payment_provider)
+    db: AsyncSession = Depends(get_db),
+    payment_provider: AsyncPaymentProvider = Depends(get_payment_provider)
 ):
     try:
-        result = payment_provider.create_product_and_price(product.dict())
+        result = await payment_provider.create_product_and_price(product.dict())
         return {
             "product_id": result["product_id"],
             "price_id": result["price_id"]
         }
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise provider_http_error(e)
\ No newline at end of file
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException, Path
+from typing import Dict, Any
+from providers.base import AsyncPaymentProvider
+from utils.provider_loader import async_payment_providers, get_payment_provider_from_path, provider_router
+from utils.tracing import TracedRoute
+
+router = APIRouter(tags=["providers"], route_class=TracedRoute)
+
+@router.get("/providers/{provider}/pool", response_model=Dict[str, Any],
+            summary="Statistiques du pool de connexions d'un fournisseur",
+            response_description="Occupation du pool de connexions HTTP du fournisseur")
+async def get_provider_pool_stats(
+    provider: str = Path(..., description="Le fournisseur de paiement (ex: 'revolut')"),
+    payment_provider: AsyncPaymentProvider = Depends(get_payment_provider_from_path)
+):
+    if not hasattr(payment_provider, "pool_stats"):
+        raise HTTPException(status_code=404, detail=f"Le fournisseur {provider} n'utilise pas de pool de connexions")
+    return {
+        "async": payment_provider.pool_stats(),
+        "sync": payment_provider.provider.pool_stats()
+    }
+
+@router.get("/providers/breakers", response_model=Dict[str, Dict[str, Any]],
+            summary="État des disjoncteurs des fournisseurs",
+            response_description="État du disjoncteur de chaque fournisseur déjà chargé, pour ce processus")
+async def get_provider_breakers():
+    return {provider_key: provider.breaker.snapshot() for provider_key, provider in async_payment_providers.loaded().items()}
+
+@router.get("/providers/bulkheads", response_model=Dict[str, Dict[str, Any]],
+            summary="Cloisonnement des fournisseurs",
+            response_description="Appels en cours et en attente de chaque fournisseur déjà chargé, pour ce processus")
+async def get_provider_bulkheads():
+    return {provider_key: provider.bulkhead.snapshot() for provider_key, provider in async_payment_providers.loaded().items()}
+
+@router.get("/providers/{provider}/bulkhead", response_model=Dict[str, Any],
+            summary="Cloisonnement d'un fournisseur",
+            response_description="Appels en cours et en attente, limites et appels refusés")
+async def get_provider_bulkhead(
+    payment_provider: AsyncPaymentProvider = Depends(get_payment_provider_from_path)
+):
+    return payment_provider.bulkhead.snapshot()
+
+@router.get("/providers/routing", response_model=Dict[str, Dict[str, Any]],
+            summary="Mesures du routage provider=auto",
+            response_description="Latence moyenne des créations, taux d'erreur, poids et coût de chaque fournisseur déjà chargé, pour ce processus")
+async def get_provider_routing():
+    return provider_router.snapshot(async_payment_providers.loaded())
+
+@router.get("/providers/{provider}/breaker", response_model=Dict[str, Any],
+            summary="État du disjoncteur d'un fournisseur",
+            response_description="État du disjoncteur (closed, open, half_open), échecs consécutifs et appels refusés")
+async def get_provider_breaker(
+    payment_provider: AsyncPaymentProvider = Depends(get_payment_provider_from_path)
+):
+    return payment_provider.breaker.snapshot()
@@ -1,26 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Query, Path
-from sqlalchemy.orm import Session
-from typing import Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Path, Header
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Any, Optional
 from database import get_db
 from models.subscription import Subscription
 from schemas.subscription import SubscriptionCreate, SubscriptionResponse
-from providers.base import PaymentProvider
+from providers.base import AsyncPaymentProvider
 from datetime import datetime
+from utils.provider_loader import get_payment_provider
+from utils.resilience import provider_http_error
+from utils.idempotency import idempotency_store, request_fingerprint
+from constants import IDEMPOTENCY_KEY_STATUS
+from utils.log import get_logger
+from utils.tracing import TracedRoute
 
-router = APIRouter(tags=["subscriptions"])
+log = get_logger(__name__)
 
-def get_payment_provider(
-    provider: str,
-    payment_providers: Dict[str, PaymentProvider] = Depends()
-) -> PaymentProvider:
-    if provider not in payment_providers:
-        raise HTTPException(status_code=400, detail=f"Fournisseur de paiement non supporté: {provider}")
-    return payment_providers[provider]
+router = APIRouter(tags=["subscriptions"], route_class=TracedRoute)
 
 @router.post("/subscriptions/", response_model=SubscriptionResponse, status_code=201,
              summary="Créer un nouvel abonnement",
              response_description="L'abonnement créé",
-             description="Crée un nouvel abonnement récurrent avec le fournisseur spécifié.")
+             description="Crée un nouvel abonnement récurrent avec le fournisseur spécifié. Avec un en-tête Idempotency-Key, une requête rejouée reçoit la réponse d'origine sans nouvel appel au fournisseur.")
 async def create_subscription(
     subscription: SubscriptionCreate = Body(..., example={
         "user_id": 1,
@@ -36,15 +37,18 @@ async def create_subscription(
         }
     }),
     provider: str = Query("stripe", description="Le fournisseur de paiement à utiliser (par défaut: stripe)"),
-    db: Session = Depends(get_db),
-    payment_provider: PaymentProvider = Depends(get_payment_provider)
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255, description="Clé unique par opération, réutilisée par le client lors de ses nouvelles tentatives"),
+    db: AsyncSession = Depends(get_db),
+    payment_provider: AsyncPaymentProvider = Depends(get_payment_provider)
 ):
+    record = await idempotency_store.begin(db, "POST /subscriptions/", idempotency_key, request_fingerprint(provider, subscription.model_dump(mode="json")))
+    if record is not None and record.status == IDEMPOTENCY_KEY_STATUS['COMPLETED']:
+        return idempotency_store.replay(record)
+
     try:
         if provider == "revolut":
             raise HTTPException(status_code=400, detail="Revolut ne supporte pas actuellement les abonnements")
         
-        print(f"Création d'abonnement pour {provider}: {subscription.dict()}")
-
         # Adapter les données en fonction du fournisseur
         if provider == "paypal":
             subscription_data = {
@@ -67,9 +71,9 @@ async def create_subscription(
                 "payment_details": subscription.payment_details
             }
 
-        result = payment_provider.create_subscription(**subscription_data)
+        result = await payment_provider.create_subscription(**subscription_data, idempotency_key=idempotency_key)
         
-        print(f"Résultat de la création d'abonnement: {result}")
+        log.info("subscription.created", provider=provider, provider_subscription_id=result["provider_subscription_id"], status=result["status"])
 
         # Assurez-vous que start_date est une datetime valide ou None
         start_date = result.get("start_date")
@@ -89,10 +93,9 @@ async def create_subscription(
             start_date=start_date
         )
         db.add(db_subscription)
-        db.commit()
-        db.refresh(db_subscription)
+        await db.flush()
         
-        return SubscriptionResponse(
+        response = SubscriptionResponse(
             id=db_subscription.id,
             provider_subscription_id=db_subscription.provider_subscription_id,
             status=db_subscription.status,
@@ -105,9 +108,13 @@ async def create_subscription(
             plan_id=db_subscription.plan_id,
             provider=provider
         )
+        # L'abonnement et la réponse associée à la clé d'idempotence sont validés ensemble
+        await idempotency_store.complete(db, record, 201, response.model_dump(mode="json"))
+        return response
     except Exception as e:
-        print(f"Erreur lors de la création de l'abonnement : {str(e)}")
-        raise HTTPException(status_code=400, detail=str(e))
+        await idempotency_store.release(db, record)
+        log.warning("subscription.create_failed", provider=provider, error=str(e))
+        raise provider_http_error(e)
 
 @router.delete("/subscriptions/{subscription_id}", 
                summary="Annuler un abonnement",
@@ -115,20 +122,21 @@ async def create_subscription(
                description="Annule un abonnement existant.")
 async def cancel_subscription(
     subscription_id: int = Path(..., description="L'ID de l'abonnement à annuler"),
-    db: Session = Depends(get_db),
-    payment_provider: PaymentProvider = Depends(get_payment_provider)
+    db: AsyncSession = Depends(get_db),
+    payment_provider: AsyncPaymentProvider = Depends(get_payment_provider)
 ):
-    subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+    result = await db.execute(select(Subscription).where(Subscription.id == subscription_id))
+    subscription = result.scalars().first()
     if not subscription:
         raise HTTPException(status_code=404, detail="Abonnement non trouvé")
     
     try:
-        result = payment_provider.cancel_subscription(subscription.provider_subscription_id)
+        result = await payment_provider.cancel_subscription(subscription.provider_subscription_id)
         subscription.status = result["status"]
-        db.commit()
+        await db.commit()
         return {"message": "Abonnement annulé avec succès"}
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        raise provider_http_error(e)
 
 @router.put("/subscriptions/{subscription_id}",
             summary="Mettre à jour un abonnement",
@@ -140,19 +148,20 @@ async def update_subscription(
         "plan_id": "new_plan_id",
         "price_id": "new_price_id"
     }),
-    db: Session = Depends(get_db),
-    payment_provider: PaymentProvider = Depends(get_payment_provider)
+    db: AsyncSession = Depends(get_db),
+    payment_provider: AsyncPaymentProvider = Depends(get_payment_provider)
 ):
-    subscription = db.query(Subscription).filter(Subscription.id == subscription_id).first()
+    result = await db.execute(select(Subscription).where(Subscription.id == subscription_id))
+    subscription = result.scalars().first()
     if not subscription:
         raise HTTPException(status_code=404, detail="Abonnement non trouvé")
     
     try:
-        result = payment_provider.update_subscription(subscription.provider_subscription_id, new_plan)
+        result = await payment_provider.update_subscription(subscription.provider_subscription_id, new_plan)
         subscription.status = result["status"]
         subscription.plan_id = new_plan.get("plan_id", subscription.plan_id)
-        db.commit()
-        db.refresh(subscription)
+        await db.commit()
+        await db.refresh(subscription)
         return SubscriptionResponse.from_orm(subscription)
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise provider_http_error(e)
\ No newline at end of file
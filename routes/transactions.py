@@ -1,29 +1,88 @@
-from fastapi import APIRouter, Depends, HTTPException, Path, Request, Body, Query
+from fastapi import APIRouter, Depends, HTTPException, Path, Request, Body, Query, Header
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.transaction import Transaction
-from schemas.transaction import TransactionCreate, TransactionResponse
-from typing import Dict, Any
-from providers.base import PaymentProvider
+from schemas.transaction import TransactionCreate, TransactionResponse, TransactionBatchCreate, TransactionBatchItemResult, TransactionBatchResponse, TransactionPage
+from typing import Dict, Any, List, Optional, Tuple
+from providers.base import AsyncPaymentProvider
 from database import get_db
 from datetime import datetime
+from config import settings
+import asyncio
 from models.subscription import Subscription
-from constants import PAYMENT_STATUS
+from models.webhook_event import WebhookEvent
+from constants import PAYMENT_STATUS, TERMINAL_PAYMENT_STATUSES, WEBHOOK_EVENT_STATUS, IDEMPOTENCY_KEY_STATUS
+from starlette.concurrency import run_in_threadpool
+from utils.webhook_queue import webhook_queue
+from utils.status_cache import status_cache
+from utils.idempotency import idempotency_store, request_fingerprint
+from utils.pagination import encode_cursor, decode_cursor, naive_utc
+from utils.provider_loader import AUTO_PROVIDER, create_payment_with_failover, get_payment_provider, get_payment_provider_from_path, provider_names, resolve_provider_key, select_payment_provider
+from utils.resilience import provider_http_error
+from utils.deadline import DeadlineExceededError
+from utils.log import get_logger
+from utils.tracing import TracedRoute
 
-router = APIRouter(tags=["transactions"])
+router = APIRouter(tags=["transactions"], route_class=TracedRoute)
+log = get_logger(__name__)
 
-def get_payment_provider(
-    provider: str,
-    payment_providers: Dict[str, PaymentProvider] = Depends()
-) -> PaymentProvider:
-    if provider not in payment_providers:
-        raise HTTPException(status_code=400, detail=f"Fournisseur de paiement non supporté: {provider}")
-    return payment_providers[provider]
+# Colonnes pouvant être demandées avec le paramètre `fields` de GET /transactions/
+TRANSACTION_LIST_FIELDS = ("id", "amount", "currency", "status", "provider", "provider_transaction_id", "created_at", "checkout_url", "success_url", "cancel_url", "custom_metadata", "description")
+
+async def find_transaction(db: AsyncSession, transaction_ref: str, provider: Optional[str] = None) -> Optional[Transaction]:
+    """Résout une référence de transaction selon sa nature.
+
+    Une référence numérique désigne l'ID interne (clé primaire) ; toute autre valeur
+    est un ID du fournisseur, recherché via l'index unique (provider, provider_transaction_id)
+    lorsque `provider` est indiqué, parmi tous les fournisseurs sinon.
+    """
+    if transaction_ref.isdigit():
+        statement = select(Transaction).where(Transaction.id == int(transaction_ref))
+    else:
+        statement = select(Transaction).where(Transaction.provider_transaction_id == transaction_ref)
+        if provider is not None and provider != AUTO_PROVIDER:
+            statement = statement.where(Transaction.provider.in_(provider_names(provider)))
+        statement = statement.order_by(Transaction.id)
+    result = await db.execute(statement)
+    return result.scalars().first()
+
+def transaction_provider(transaction: Transaction) -> Tuple[str, AsyncPaymentProvider]:
+    """Clé et fournisseur ayant enregistré la transaction (choisi par le routage ou la bascule
+    lors de la création, il n'est pas forcément connu du client)."""
+    provider_key = resolve_provider_key(transaction.provider)
+    if provider_key is None:
+        raise HTTPException(status_code=400, detail=f"Fournisseur de paiement non supporté: {transaction.provider}")
+    return provider_key, get_payment_provider(provider_key)
+
+async def get_cached_payment_status(provider: str, payment_provider: AsyncPaymentProvider, transaction: Transaction) -> Dict[str, Any]:
+    """Statut d'une transaction via le cache, sans appel au fournisseur pour un statut définitif.
+
+    Un statut définitif en base prévaut sur le cache : l'entrée d'un worker qui n'a pas traité le
+    webhook peut encore indiquer pending jusqu'à son expiration.
+    """
+    if transaction.status in TERMINAL_PAYMENT_STATUSES:
+        cached = status_cache.get(provider, transaction.provider_transaction_id)
+        if cached is not None and cached.get("status") == transaction.status:
+            return cached
+        return {"status": transaction.status}
+    return await status_cache.check_payment_status(provider, payment_provider, transaction.provider_transaction_id)
+
+def apply_provider_status(transaction: Transaction, status_info: Dict[str, Any]) -> bool:
+    """Reporte sur la transaction le statut retourné par le fournisseur ; retourne True si elle a changé.
+
+    Un statut définitif n'est jamais remplacé par un statut non définitif.
+    """
+    status = status_info.get('status', PAYMENT_STATUS['UNKNOWN'])
+    if status == transaction.status or (transaction.status in TERMINAL_PAYMENT_STATUSES and status not in TERMINAL_PAYMENT_STATUSES):
+        return False
+    transaction.status = status
+    return True
 
 @router.post("/transactions/", response_model=TransactionResponse, status_code=201,
              summary="Créer une nouvelle transaction",
              response_description="La transaction créée",
-             description="Crée une nouvelle transaction de paiement avec le fournisseur spécifié.")
+             description="Crée une nouvelle transaction de paiement avec le fournisseur spécifié. Avec `provider=auto`, le fournisseur est choisi parmi ceux configurés pour la devise selon leur latence et leur taux d'erreur récents ; il est indiqué dans la réponse. Avec un en-tête Idempotency-Key, une requête rejouée reçoit la réponse d'origine sans nouvel appel au fournisseur.")
 async def create_transaction(
     transaction: TransactionCreate = Body(..., example={
         "amount": 100.0,
@@ -34,41 +93,50 @@ async def create_transaction(
         "description": "Achat de produit XYZ",
         "custom_metadata": {"order_id": "ORD-12345"}
     }),
-    provider: str = Query("stripe", description="Le fournisseur de paiement à utiliser (par défaut: stripe)"),
-    db: Session = Depends(get_db),
-    payment_provider: PaymentProvider = Depends(get_payment_provider)
+    provider: str = Query("stripe", description="Le fournisseur de paiement à utiliser (par défaut: stripe), ou `auto` pour le choisir selon sa latence et son taux d'erreur"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255, description="Clé unique par opération, réutilisée par le client lors de ses nouvelles tentatives"),
+    db: AsyncSession = Depends(get_db)
 ):
-    print(f"Création de transaction : {transaction}")
     try:
-        payment_result = payment_provider.create_payment(
+        provider_key, payment_provider = select_payment_provider(provider, transaction.currency)
+    except ValueError as e:
+        raise provider_http_error(e)
+
+    record = await idempotency_store.begin(db, "POST /transactions/", idempotency_key, request_fingerprint(provider, transaction.model_dump(mode="json")))
+    if record is not None and record.status == IDEMPOTENCY_KEY_STATUS['COMPLETED']:
+        return idempotency_store.replay(record)
+
+    try:
+        # Le fournisseur de secours éventuel (PROVIDER_FAILOVER) est enregistré sur la transaction
+        used_provider, payment_result = await create_payment_with_failover(
+            provider_key,
+            payment_provider,
             transaction.amount,
             transaction.currency,
             transaction.payment_details,
             transaction.success_url,
             transaction.cancel_url,
-            transaction.custom_metadata
+            transaction.custom_metadata,
+            idempotency_key=idempotency_key
         )
-        print(f"Résultat du paiement : {payment_result}")
-        
+
         db_transaction = Transaction(
             amount=transaction.amount,
             currency=transaction.currency,
             status=payment_result["status"],
-            provider=payment_provider.__class__.__name__,
+            provider=used_provider,
             provider_transaction_id=payment_result["provider_transaction_id"],
             success_url=transaction.success_url,
             cancel_url=transaction.cancel_url,
             created_at=datetime.utcnow(),
             checkout_url=payment_result["checkout_url"],
-            metadata=transaction.custom_metadata,
+            custom_metadata=transaction.custom_metadata,
             description=transaction.description
         )
         db.add(db_transaction)
-        db.commit()
-        db.refresh(db_transaction)
-        print(f"Transaction créée : {db_transaction}")
-        
-        return TransactionResponse(
+        await db.flush()
+
+        response = TransactionResponse(
             id=db_transaction.id,
             amount=db_transaction.amount,
             currency=db_transaction.currency,
@@ -78,41 +146,207 @@ async def create_transaction(
             client_secret=payment_result.get("client_secret", ""),
             checkout_url=payment_result["checkout_url"],
             created_at=db_transaction.created_at,
-            metadata=db_transaction.custom_metadata,
+            custom_metadata=db_transaction.custom_metadata,
             description=db_transaction.description
         )
+        # La transaction et la réponse associée à la clé d'idempotence sont validées ensemble
+        await idempotency_store.complete(db, record, 201, response.model_dump(mode="json"))
+        log.info("transaction.created", provider=used_provider, transaction_id=db_transaction.id, provider_transaction_id=db_transaction.provider_transaction_id, status=db_transaction.status)
+        return response
     except Exception as e:
-        print(f"Erreur lors de la création de la transaction : {str(e)}")
+        await idempotency_store.release(db, record)
+        log.warning("transaction.create_failed", provider=provider_key, error=str(e))
+        raise provider_http_error(e)
+
+@router.post("/transactions/batch", response_model=TransactionBatchResponse,
+             summary="Créer des transactions par lot",
+             response_description="Le résultat de chaque élément du lot",
+             description="Crée plusieurs transactions avec le même fournisseur, ou en choisissant le fournisseur de chaque élément avec `provider=auto`. Les appels au fournisseur sont effectués en parallèle avec une concurrence bornée, puis toutes les transactions créées sont insérées en une seule requête et un seul commit. Un élément en échec n'empêche pas la création des autres : le résultat est indiqué pour chaque élément.")
+async def create_transactions_batch(
+    batch: TransactionBatchCreate = Body(..., example={
+        "items": [
+            {"amount": 40.0, "currency": "EUR", "success_url": "https://example.com/success", "cancel_url": "https://example.com/cancel", "custom_metadata": {"order_id": "ORD-12345-1"}},
+            {"amount": 60.0, "currency": "EUR", "success_url": "https://example.com/success", "cancel_url": "https://example.com/cancel", "custom_metadata": {"order_id": "ORD-12345-2"}}
+        ]
+    }),
+    provider: str = Query("stripe", description="Le fournisseur de paiement à utiliser pour tout le lot (par défaut: stripe), ou `auto` pour le choisir élément par élément"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255, description="Clé unique par lot, réutilisée par le client lors de ses nouvelles tentatives"),
+    db: AsyncSession = Depends(get_db)
+):
+    if len(batch.items) > settings.transaction_batch_max_items:
+        raise HTTPException(status_code=422, detail=f"Un lot contient au plus {settings.transaction_batch_max_items} transactions")
+    # Fournisseur inconnu : refusé avant tout appel
+    if provider != AUTO_PROVIDER:
+        get_payment_provider(provider)
+
+    record = await idempotency_store.begin(db, "POST /transactions/batch", idempotency_key, request_fingerprint(provider, batch.model_dump(mode="json")))
+    if record is not None and record.status == IDEMPOTENCY_KEY_STATUS['COMPLETED']:
+        return idempotency_store.replay(record)
+
+    semaphore = asyncio.Semaphore(settings.transaction_batch_concurrency)
+
+    async def create_payment(index: int, transaction: TransactionCreate):
+        async with semaphore:
+            try:
+                # Avec provider=auto, chaque élément est routé selon sa devise et les mesures les plus récentes
+                item_provider, payment_provider = select_payment_provider(provider, transaction.currency)
+                return await create_payment_with_failover(
+                    item_provider,
+                    payment_provider,
+                    transaction.amount,
+                    transaction.currency,
+                    transaction.payment_details,
+                    transaction.success_url,
+                    transaction.cancel_url,
+                    transaction.custom_metadata,
+                    # Une clé par élément, dérivée de celle du lot
+                    idempotency_key=f"{idempotency_key}:{index}" if idempotency_key else None
+                )
+            except Exception as e:
+                log.warning("transaction.create_failed", provider=provider, batch_index=index, error=str(e))
+                return e
+
+    payment_results = await asyncio.gather(*(create_payment(index, transaction) for index, transaction in enumerate(batch.items)))
+
+    try:
+        created_at = datetime.utcnow()
+        # Chaque élément créé indique le fournisseur utilisé (celui du lot ou son fournisseur de secours)
+        created = []
+        for index, (transaction, outcome) in enumerate(zip(batch.items, payment_results)):
+            if not isinstance(outcome, Exception):
+                used_provider, payment_result = outcome
+                created.append((index, transaction, used_provider, payment_result))
+        transaction_ids: Dict[Tuple[str, str], int] = {}
+        if created:
+            # Un seul INSERT pour tout le lot ; les ID générés sont associés aux éléments par (fournisseur, ID fournisseur)
+            result = await db.execute(
+                insert(Transaction).returning(Transaction.provider, Transaction.provider_transaction_id, Transaction.id),
+                [
+                    {
+                        "amount": transaction.amount,
+                        "currency": transaction.currency,
+                        "status": payment_result["status"],
+                        "provider": used_provider,
+                        "provider_transaction_id": payment_result["provider_transaction_id"],
+                        "success_url": transaction.success_url,
+                        "cancel_url": transaction.cancel_url,
+                        "created_at": created_at,
+                        "checkout_url": payment_result["checkout_url"],
+                        "custom_metadata": transaction.custom_metadata,
+                        "description": transaction.description
+                    }
+                    for _, transaction, used_provider, payment_result in created
+                ]
+            )
+            transaction_ids = {(used_provider, provider_transaction_id): transaction_id for used_provider, provider_transaction_id, transaction_id in result.tuples().all()}
+
+        results = [
+            TransactionBatchItemResult(index=index, success=False, error=str(payment_result))
+            for index, payment_result in enumerate(payment_results)
+            if isinstance(payment_result, Exception)
+        ]
+        for index, transaction, used_provider, payment_result in created:
+            results.append(TransactionBatchItemResult(index=index, success=True, transaction=TransactionResponse(
+                id=transaction_ids[(used_provider, payment_result["provider_transaction_id"])],
+                amount=transaction.amount,
+                currency=transaction.currency,
+                status=payment_result["status"],
+                provider=used_provider,
+                provider_transaction_id=payment_result["provider_transaction_id"],
+                client_secret=payment_result.get("client_secret", ""),
+                checkout_url=payment_result["checkout_url"],
+                created_at=created_at,
+                custom_metadata=transaction.custom_metadata,
+                description=transaction.description
+            )))
+        results.sort(key=lambda item: item.index)
+
+        response = TransactionBatchResponse(created=len(created), failed=len(results) - len(created), results=results)
+        await idempotency_store.complete(db, record, 200, response.model_dump(mode="json"))
+        log.info("transaction.batch_created", provider=provider, created=response.created, failed=response.failed)
+        return response
+    except Exception as e:
+        await idempotency_store.release(db, record)
+        log.warning("transaction.batch_failed", provider=provider, items=len(batch.items), error=str(e))
+        if isinstance(e, DeadlineExceededError):
+            # Aucune transaction du lot n'est enregistrée : réponse 504
+            raise
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.get("/transactions/", response_model=TransactionPage,
+            summary="Lister les transactions",
+            response_description="Une page de transactions, de la plus récente à la plus ancienne",
+            description="Liste les transactions avec des filtres optionnels. La pagination se fait par curseur sur (created_at, id) : la durée d'une page ne dépend pas de sa position dans la liste. Le paramètre `fields` limite les colonnes retournées.")
+async def list_transactions(
+    status: Optional[str] = Query(None, description="Statut unifié (pending, completed, failed...)"),
+    provider: Optional[str] = Query(None, description="Clé du fournisseur (stripe, paypal, revolut...)"),
+    currency: Optional[str] = Query(None, description="Code de la devise, ex: EUR"),
+    created_after: Optional[datetime] = Query(None, description="Date de création minimale (incluse)"),
+    created_before: Optional[datetime] = Query(None, description="Date de création maximale (exclue)"),
+    limit: int = Query(50, ge=1, le=500, description="Nombre maximal de transactions par page"),
+    cursor: Optional[str] = Query(None, description="Curseur `next_cursor` de la page précédente"),
+    fields: Optional[str] = Query(None, description=f"Colonnes à retourner, séparées par des virgules, parmi : {', '.join(TRANSACTION_LIST_FIELDS)}"),
+    db: AsyncSession = Depends(get_db)
+):
+    selected: List[str] = list(TRANSACTION_LIST_FIELDS)
+    if fields:
+        selected = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+        unknown = [name for name in selected if name not in TRANSACTION_LIST_FIELDS]
+        if unknown or not selected:
+            raise HTTPException(status_code=400, detail=f"Colonnes inconnues : {', '.join(unknown)}" if unknown else "Aucune colonne demandée")
+
+    # created_at et id sont toujours lus : ils forment le curseur de la page suivante
+    columns = selected + [name for name in ("created_at", "id") if name not in selected]
+    statement = select(*(getattr(Transaction, name) for name in columns))
+    if status:
+        statement = statement.where(Transaction.status == status)
+    if provider:
+        statement = statement.where(Transaction.provider == provider)
+    if currency:
+        statement = statement.where(Transaction.currency == currency)
+    if created_after:
+        statement = statement.where(Transaction.created_at >= naive_utc(created_after))
+    if created_before:
+        statement = statement.where(Transaction.created_at < naive_utc(created_before))
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        statement = statement.where(tuple_(Transaction.created_at, Transaction.id) < tuple_(cursor_created_at, cursor_id))
+    # Une ligne de plus que la page pour savoir s'il existe une page suivante
+    statement = statement.order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(limit + 1)
+
+    rows = (await db.execute(statement)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return TransactionPage(
+        items=[{name: getattr(row, name) for name in selected} for row in rows],
+        next_cursor=next_cursor
+    )
+
 @router.get("/transactions/{transaction_id}", response_model=TransactionResponse,
             summary="Obtenir les détails d'une transaction",
             response_description="Les détails de la transaction")
 async def get_transaction(
     transaction_id: int = Path(..., title="L'ID de la transaction à récupérer", ge=1),
-    provider: str = Query("stripe", description="Le fournisseur de paiement à utiliser"),
-    db: Session = Depends(get_db),
-    payment_provider: PaymentProvider = Depends(get_payment_provider)
+    provider: Optional[str] = Query(None, description="Ignoré : le statut est demandé au fournisseur ayant enregistré la transaction"),
+    db: AsyncSession = Depends(get_db)
 ):
-    # Essayez d'abord de trouver la transaction par ID interne
-    transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first()
-    
-    # Si non trouvé, essayez de trouver par ID de fournisseur
-    if transaction is None:
-        transaction = db.query(Transaction).filter(Transaction.provider_transaction_id == transaction_id).first()
+    transaction = await find_transaction(db, str(transaction_id))
     
     if transaction is None:
         raise HTTPException(status_code=404, detail="Transaction non trouvée")
+    provider, payment_provider = transaction_provider(transaction)
     
     try:
-        current_status = payment_provider.check_payment_status(transaction.provider_transaction_id)
-        if current_status != transaction.status:
-            transaction.status = current_status
-            db.commit()
-        
-        return {"status": current_status}
+        status_info = await get_cached_payment_status(provider, payment_provider, transaction)
+        if apply_provider_status(transaction, status_info):
+            await db.commit()
     except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        raise provider_http_error(e)
     
     return TransactionResponse(
         id=transaction.id,
@@ -131,7 +365,7 @@ async def get_transaction(
             response_description="L'URL de paiement pour la transaction")
 async def get_payment_url(
     transaction_id: int = Path(..., title="L'ID de la transaction à payer", ge=1, example=1),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Obtient l'URL de paiement pour une transaction spécifique.
@@ -141,7 +375,8 @@ async def get_payment_url(
     Retourne l'URL de paiement pour rediriger l'utilisateur.
     Si la transaction n'est pas trouvée, une erreur 404 est renvoyée.
     """
-    transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first()
+    result = await db.execute(select(Transaction).where(Transaction.id == transaction_id))
+    transaction = result.scalars().first()
     if transaction is None:
         raise HTTPException(status_code=404, detail="Transaction non trouvée")
     
@@ -152,31 +387,25 @@ async def get_payment_url(
 
 @router.get("/transactions/{transaction_id}/status", response_model=Dict[str, Any])
 async def get_transaction_status(
-    transaction_id: str = Path(..., title="L'ID de la transaction à vérifier"),
-    provider: str = Query(..., description="Le fournisseur de paiement à utiliser"),
-    db: Session = Depends(get_db),
-    payment_provider: PaymentProvider = Depends(get_payment_provider)
+    transaction_id: str = Path(..., title="L'ID interne de la transaction, ou son ID chez le fournisseur"),
+    provider: Optional[str] = Query(None, description="Fournisseur de l'ID indiqué, pour une référence non numérique ; le statut est toujours demandé au fournisseur ayant enregistré la transaction"),
+    db: AsyncSession = Depends(get_db)
 ):
-    print(f"Recherche de la transaction avec l'ID : {transaction_id}")
-    transaction = db.query(Transaction).filter(
-        (Transaction.id == transaction_id) | (Transaction.provider_transaction_id == transaction_id)
-    ).first()
+    transaction = await find_transaction(db, transaction_id, provider)
     
     if transaction is None:
-        print(f"Transaction non trouvée")
         raise HTTPException(status_code=404, detail="Transaction non trouvée")
+    provider, payment_provider = transaction_provider(transaction)
     
-    print(f"Transaction trouvée : {transaction}")
     try:
-        status_info = payment_provider.check_payment_status(transaction.provider_transaction_id)
-        print(f"Informations de statut reçues : {status_info}")
+        status_info = await get_cached_payment_status(provider, payment_provider, transaction)
+        log.debug("transaction.status_checked", provider=provider, transaction_id=transaction.id, status=status_info.get("status"))
         
-        if status_info.get('status') != transaction.status:
-            transaction.status = status_info.get('status', PAYMENT_STATUS.UNKNOWN)
-            db.commit()
+        if apply_provider_status(transaction, status_info):
+            await db.commit()
         
         response = {
-            "status": status_info.get('status', PAYMENT_STATUS.UNKNOWN),
+            "status": transaction.status,
             "provider_status": status_info.get('provider_status', 'Inconnu'),
             "provider": provider,
             "transaction_id": str(transaction.id),
@@ -186,31 +415,36 @@ async def get_transaction_status(
         
         return response
     except ValueError as e:
-        print(f"Erreur lors de la vérification du statut : {str(e)}")
-        raise HTTPException(status_code=400, detail=str(e))
+        log.warning("transaction.status_failed", provider=provider, transaction_id=transaction.id, error=str(e))
+        raise provider_http_error(e)
 
 @router.post("/webhook/{provider}", 
-             summary="Traiter un webhook",
-             response_description="Statut de traitement du webhook",
-             description="Traite les webhooks envoyés par les fournisseurs de paiement pour mettre à jour le statut des transactions et des abonnements.")
+             summary="Recevoir un webhook",
+             response_description="Accusé de réception du webhook",
+             description="Enregistre le webhook envoyé par le fournisseur de paiement dans une file durable et l'acquitte immédiatement. Les statuts des transactions et des abonnements sont mis à jour en arrière-plan.")
 async def webhook(
     provider: str = Path(..., description="Le fournisseur de paiement (ex: 'stripe', 'paypal')"),
     data: Dict[str, Any] = Body(...),
-    payment_provider: PaymentProvider = Depends(get_payment_provider),
-    db: Session = Depends(get_db)
+    payment_provider: AsyncPaymentProvider = Depends(get_payment_provider_from_path),
+    db: AsyncSession = Depends(get_db)
 ):
     try:
-        result = payment_provider.process_webhook(data)
-        if result["type"] == "transaction":
-            transaction = db.query(Transaction).filter(Transaction.provider_transaction_id == result["provider_transaction_id"]).first()
-            if transaction:
-                transaction.status = result["status"]
-                db.commit()
-        elif result["type"] == "subscription":
-            subscription = db.query(Subscription).filter(Subscription.provider_subscription_id == result["provider_subscription_id"]).first()
-            if subscription:
-                subscription.status = result["status"]
-                db.commit()
-        return {"status": "success"}
+        event = WebhookEvent(
+            provider=provider,
+            payload=data,
+            status=WEBHOOK_EVENT_STATUS['PENDING'],
+            attempts=0,
+            received_at=datetime.utcnow()
+        )
+        db.add(event)
+        await db.commit()
+        webhook_queue.notify()
+        return {"status": "success", "event_id": event.id}
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/webhooks/queue", response_model=Dict[str, Any],
+            summary="État de la file des webhooks",
+            response_description="Profondeur de la file et retard de traitement")
+async def get_webhook_queue_stats():
+    return await run_in_threadpool(webhook_queue.stats)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 class TransactionCreate(BaseModel):
     amount: float
@@ -25,4 +25,22 @@ class TransactionResponse(BaseModel):
     description: Optional[str] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class TransactionBatchCreate(BaseModel):
+    items: List[TransactionCreate] = Field(..., min_length=1)
+
+class TransactionBatchItemResult(BaseModel):
+    index: int  # Position de l'élément dans la requête
+    success: bool
+    transaction: Optional[TransactionResponse] = None
+    error: Optional[str] = None
+
+class TransactionBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[TransactionBatchItemResult]
+
+class TransactionPage(BaseModel):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None  # À passer dans `cursor` pour obtenir la page suivante
@@ -0,0 +1,144 @@
+import asyncio
+import unittest
+import requests
+import time
+from config import settings
+from providers.local import LocalProvider
+from constants import PAYMENT_STATUS
+from models.transaction import Transaction
+from routes.transactions import apply_provider_status, get_cached_payment_status
+from utils.status_cache import status_cache
+
+BASE_URL = settings.base_url
+
+def print_step(step, message):
+    print(f"\n🔹 Étape {step}: {message}")
+
+def print_success(message):
+    print(f"✅ {message}")
+
+def print_error(message):
+    print(f"❌ {message}")
+
+class TestLocalProvider(unittest.TestCase):
+    def setUp(self):
+        self.local_provider = LocalProvider(latency_distribution="uniform", latency_ms=5, latency_jitter_ms=2, settle_after=0.5)
+
+    def test_local_provider_payment_lifecycle(self):
+        print_step(1, "Création d'un paiement local et passage à l'état définitif")
+        payment_data = self.local_provider.create_payment(
+            amount=10.00,
+            currency="EUR",
+            payment_details={"email": "test@example.com"},
+            success_url="https://example.com/success",
+            cancel_url="https://example.com/cancel",
+            metadata={"custom_field": "value"},
+            description="Test payment description"
+        )
+        self.assertIn("provider_transaction_id", payment_data)
+        self.assertEqual(payment_data["status"], PAYMENT_STATUS['PENDING'])
+        status_data = self.local_provider.check_payment_status(payment_data["provider_transaction_id"])
+        self.assertEqual(status_data["status"], PAYMENT_STATUS['PENDING'])
+        time.sleep(0.6)
+        status_data = self.local_provider.check_payment_status(payment_data["provider_transaction_id"])
+        self.assertEqual(status_data["status"], PAYMENT_STATUS['COMPLETED'])
+        print_success(f"Paiement {payment_data['provider_transaction_id']} : {status_data['status']}")
+
+    def test_local_provider_failure_injection(self):
+        print_step(2, "Injection d'échecs et de refus")
+        failing_provider = LocalProvider(failure_rate=1.0)
+        with self.assertRaises(ValueError):
+            failing_provider.create_payment(10.00, "EUR", {}, "https://example.com/success", "https://example.com/cancel")
+        declining_provider = LocalProvider(decline_rate=1.0, settle_after=0)
+        payment_data = declining_provider.create_payment(10.00, "EUR", {}, "https://example.com/success", "https://example.com/cancel")
+        status_data = declining_provider.check_payment_status(payment_data["provider_transaction_id"])
+        self.assertEqual(status_data["status"], PAYMENT_STATUS['FAILED'])
+        print_success("Échecs et refus simulés correctement")
+
+    def test_local_provider_subscription_and_customer(self):
+        print_step(3, "Abonnement et client locaux")
+        subscription = self.local_provider.create_subscription(19.99, "EUR", "month", 1, {})
+        self.assertEqual(subscription["status"], "active")
+        self.local_provider.update_subscription(subscription["provider_subscription_id"], {"amount": 29.99})
+        cancellation = self.local_provider.cancel_subscription(subscription["provider_subscription_id"])
+        self.assertEqual(cancellation["status"], "cancelled")
+        customer = self.local_provider.create_customer({"email": "test@example.com", "name": "Test"})
+        self.assertFalse(self.local_provider.customer_has_payment_method(customer["provider_customer_id"]))
+        self.local_provider.create_payment_setup_session(customer["provider_customer_id"], "https://example.com/success", "https://example.com/cancel")
+        time.sleep(0.6)
+        self.assertTrue(self.local_provider.set_default_payment_method(customer["provider_customer_id"]))
+        print_success("Abonnement et client gérés avec succès")
+
+    def test_local_provider_process_webhook(self):
+        print_step(4, "Traitement d'un webhook local")
+        result = self.local_provider.process_webhook({
+            "event": "payment.completed",
+            "payment": {"id": "loc_pay_test", "status": PAYMENT_STATUS['COMPLETED']}
+        })
+        self.assertEqual(result["type"], "transaction")
+        self.assertEqual(result["provider_transaction_id"], "loc_pay_test")
+        self.assertEqual(result["status"], PAYMENT_STATUS['COMPLETED'])
+        print_success("Webhook traité avec succès")
+
+    def test_local_transaction_via_api(self):
+        print_step(5, "Transaction locale via l'API (LOCAL_PROVIDER_ENABLED=true)")
+        response = requests.post(f"{BASE_URL}/transactions/", params={"provider": "local"}, json={
+            "amount": 10.00,
+            "currency": "EUR",
+            "payment_details": {},
+            "success_url": "https://example.com/success",
+            "cancel_url": "https://example.com/cancel",
+            "description": "Test de paiement local"
+        })
+        if response.status_code != 201:
+            print_error(f"Échec de la création de la transaction : {response.status_code} - {response.text}")
+        self.assertEqual(response.status_code, 201)
+        transaction = response.json()
+        response = requests.get(f"{BASE_URL}/transactions/{transaction['provider_transaction_id']}/status", params={"provider": "local"})
+        self.assertEqual(response.status_code, 200)
+        print_success(f"Transaction {transaction['id']} : {response.json()['status']}")
+
+class TestTerminalStatusCache(unittest.TestCase):
+    """Un statut définitif en base ne doit pas être remplacé par une entrée de cache périmée."""
+
+    def setUp(self):
+        self.provider_transaction_id = f"loc_pay_cache_{time.monotonic_ns()}"
+        self.local_provider = LocalProvider(settle_after=60).as_async()
+
+    def tearDown(self):
+        status_cache.invalidate("local", self.provider_transaction_id)
+
+    def test_terminal_status_not_downgraded_by_cache(self):
+        print_step(6, "Statut définitif en base face à une entrée pending en cache")
+        # Entrée mise en cache par une consultation antérieure, dans un worker qui n'a pas traité le webhook
+        status_cache.set("local", self.provider_transaction_id, {"status": PAYMENT_STATUS['PENDING']})
+        transaction = Transaction(provider="local", provider_transaction_id=self.provider_transaction_id, status=PAYMENT_STATUS['COMPLETED'])
+
+        status_info = asyncio.run(get_cached_payment_status("local", self.local_provider, transaction))
+        self.assertEqual(status_info["status"], PAYMENT_STATUS['COMPLETED'])
+        self.assertFalse(apply_provider_status(transaction, {"status": PAYMENT_STATUS['PENDING']}))
+        self.assertEqual(transaction.status, PAYMENT_STATUS['COMPLETED'])
+        print_success("Le statut définitif est conservé")
+
+    def test_pending_status_updated(self):
+        print_step(7, "Statut non définitif mis à jour par le fournisseur")
+        transaction = Transaction(provider="local", provider_transaction_id=self.provider_transaction_id, status=PAYMENT_STATUS['PENDING'])
+        self.assertTrue(apply_provider_status(transaction, {"status": PAYMENT_STATUS['COMPLETED']}))
+        self.assertEqual(transaction.status, PAYMENT_STATUS['COMPLETED'])
+        print_success("Le statut définitif du fournisseur est appliqué")
+
+def run_local_tests():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(TestLocalProvider('test_local_provider_payment_lifecycle'))
+    test_suite.addTest(TestLocalProvider('test_local_provider_failure_injection'))
+    test_suite.addTest(TestLocalProvider('test_local_provider_subscription_and_customer'))
+    test_suite.addTest(TestLocalProvider('test_local_provider_process_webhook'))
+    test_suite.addTest(TestLocalProvider('test_local_transaction_via_api'))
+    test_suite.addTest(TestTerminalStatusCache('test_terminal_status_not_downgraded_by_cache'))
+    test_suite.addTest(TestTerminalStatusCache('test_pending_status_updated'))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(test_suite)
+
+if __name__ == "__main__":
+    run_local_tests()
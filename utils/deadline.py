@@ -0,0 +1,152 @@
+# Échéance de chaque requête HTTP, propagée aux appels des fournisseurs et à la base de données
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from utils.log import get_logger
+
+log = get_logger(__name__)
+
+# En-tête par lequel le client indique le temps qu'il accorde à la requête, en secondes
+DEADLINE_HEADER = "x-request-timeout"
+# Instant de réception d'une requête sans en-tête, pour le délai propre à sa route
+STARTED_SCOPE_KEY = "deadline_started"
+
+# Délai minimal transmis aux clients HTTP : un délai nul désactiverait leur limite
+MIN_TIMEOUT = 0.001
+
+# Instant (time.monotonic) au-delà duquel la requête en cours est abandonnée ; None sans échéance.
+# Copié dans les threads du pool (run_in_threadpool, ThreadPoolProviderAdapter) avec le contexte.
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+class DeadlineExceededError(ValueError):
+    """Le temps accordé à la requête est écoulé : elle est abandonnée par une réponse 504."""
+
+    def __init__(self, operation: str):
+        super().__init__(f"Délai de la requête dépassé ({operation})")
+        self.operation = operation
+
+def remaining() -> Optional[float]:
+    """Secondes restantes avant l'échéance de la requête en cours, None sans échéance."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+def timeout_for(timeout: float) -> float:
+    """Délai d'un appel réseau : `timeout`, réduit au temps restant de la requête en cours."""
+    left = remaining()
+    if left is None:
+        return timeout
+    return max(min(timeout, left), MIN_TIMEOUT)
+
+def check_deadline(operation: str) -> None:
+    if expired():
+        raise DeadlineExceededError(operation)
+
+@contextmanager
+def deadline_scope(timeout: Optional[float]):
+    """Fixe l'échéance du bloc à `timeout` secondes ; avec None, le bloc s'exécute sans échéance
+    (nettoyage après un échec, qui doit aboutir même si le temps de la requête est écoulé)."""
+    token = _deadline.set(None if timeout is None else time.monotonic() + timeout)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+async def wait_for_deadline(awaitable, operation: str):
+    """Attend `awaitable` au plus jusqu'à l'échéance de la requête en cours.
+
+    L'attente est interrompue à l'échéance même si l'appel ignore son propre délai ;
+    un appel exécuté dans un thread se termine alors en arrière-plan.
+    """
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(left, 0))
+    except asyncio.TimeoutError:
+        # Un TimeoutError levé par l'appel lui-même avant l'échéance est remonté tel quel
+        if not expired():
+            raise
+        raise DeadlineExceededError(operation) from None
+
+class DeadlineMiddleware:
+    """Middleware ASGI : fixe l'échéance de chaque requête, dès sa réception.
+
+    Le délai vient de l'en-tête X-Request-Timeout du client (plafonné à `max_timeout`),
+    sinon de `default_timeout` ; un délai nul désactive l'échéance. Sans en-tête, le délai
+    propre à la route est appliqué une fois la route résolue (`route_timeout_dependency`).
+    """
+
+    def __init__(self, app, default_timeout: float = 30.0, max_timeout: float = 120.0):
+        self.app = app
+        self.default_timeout = default_timeout
+        self.max_timeout = max_timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = dict(scope["headers"]).get(DEADLINE_HEADER.encode())
+        if header is None:
+            timeout = self.default_timeout
+            scope[STARTED_SCOPE_KEY] = time.monotonic()
+        else:
+            try:
+                timeout = float(header)
+                if not 0 < timeout < float("inf"):
+                    raise ValueError
+            except ValueError:
+                response = JSONResponse({"detail": "En-tête X-Request-Timeout invalide : durée positive en secondes attendue"}, status_code=400)
+                await response(scope, receive, send)
+                return
+            timeout = min(timeout, self.max_timeout)
+
+        with deadline_scope(timeout if timeout > 0 else None):
+            await self.app(scope, receive, send)
+
+def route_timeout_dependency(route_timeouts: Dict[str, float]):
+    """Dépendance commune aux routes appliquant leur délai propre (clés "POST /transactions/batch"),
+    compté depuis la réception de la requête, lorsque le client n'a pas fixé le sien."""
+
+    async def apply_route_timeout(request: Request) -> None:
+        started = request.scope.get(STARTED_SCOPE_KEY)
+        route = request.scope.get("route")
+        key = f"{request.method} {getattr(route, 'path', '')}"
+        if started is None or key not in route_timeouts:
+            return
+        # Même contexte que le middleware, qui rétablit la valeur précédente en fin de requête
+        _deadline.set(started + route_timeouts[key] if route_timeouts[key] > 0 else None)
+
+    return apply_route_timeout
+
+async def deadline_exceeded_handler(request, error: DeadlineExceededError) -> JSONResponse:
+    log.warning("request.deadline_exceeded", method=request.method, path=request.url.path, operation=error.operation)
+    return JSONResponse({"detail": str(error)}, status_code=504)
+
+def enforce_engine_deadline(engine) -> None:
+    """Refuse toute requête SQL d'un moteur synchrone (ou du `sync_engine` d'un moteur
+    asynchrone) lancée après l'échéance de la requête HTTP en cours."""
+    from sqlalchemy import event
+
+    # En tête des écouteurs : les mesures (/metrics, spans) ne démarrent pas pour une requête refusée
+    @event.listens_for(engine, "before_cursor_execute", insert=True)
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _deadline.get() is not None:
+            check_deadline(f"db.{statement.lstrip().split(' ', 1)[0].lower()}")
+
+def enforce_session_deadline() -> None:
+    """Refuse le commit d'une session ORM après l'échéance : la transaction est annulée
+    par la fermeture de la session et aucune ligne n'est écrite à moitié."""
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    @event.listens_for(Session, "before_commit")
+    def _before_commit(session):
+        check_deadline("db.commit")
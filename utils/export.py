@@ -0,0 +1,116 @@
+# Export en flux des transactions et des abonnements (NDJSON ou CSV, compression gzip optionnelle)
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+from sqlalchemy import select
+from database import SessionLocal
+from models.transaction import Transaction
+from models.subscription import Subscription
+from config import settings
+
+# Tables exportables et colonne de date utilisée pour filtrer la période
+EXPORT_TABLES = {
+    "transactions": (Transaction, "created_at"),
+    "subscriptions": (Subscription, "start_date"),
+}
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+def iter_rows(table: str, created_after: Optional[datetime] = None, created_before: Optional[datetime] = None, chunk_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+    """Lit la table par paquets de `chunk_size` lignes avec un curseur côté serveur.
+
+    Seul le paquet en cours est en mémoire, quel que soit le nombre de lignes exportées.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Table non exportable : {table} (attendu : {', '.join(EXPORT_TABLES)})")
+    model, date_column = EXPORT_TABLES[table]
+    columns = list(model.__table__.columns)
+    statement = select(*columns).order_by(model.id)
+    if created_after:
+        statement = statement.where(getattr(model, date_column) >= created_after)
+    if created_before:
+        statement = statement.where(getattr(model, date_column) < created_before)
+
+    with SessionLocal() as db:
+        result = db.execute(statement.execution_options(stream_results=True, yield_per=chunk_size))
+        for partition in result.partitions():
+            yield [row._asdict() for row in partition]
+
+def export_columns(table: str) -> List[str]:
+    model, _ = EXPORT_TABLES[table]
+    return [column.name for column in model.__table__.columns]
+
+def _ndjson_chunk(rows: Sequence[Dict[str, Any]]) -> str:
+    return "".join(json.dumps(row, default=_json_default, ensure_ascii=False) + "\n" for row in rows)
+
+def _csv_chunk(rows: Sequence[Dict[str, Any]], columns: List[str], header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    for row in rows:
+        # Les colonnes JSON (custom_metadata) sont écrites sous forme de texte JSON
+        writer.writerow([
+            json.dumps(row[name], ensure_ascii=False) if isinstance(row[name], (dict, list))
+            else row[name].isoformat() if isinstance(row[name], (datetime, date))
+            else row[name]
+            for name in columns
+        ])
+    return buffer.getvalue()
+
+def iter_export(table: str, export_format: str = "ndjson", compress: bool = False, created_after: Optional[datetime] = None, created_before: Optional[datetime] = None, chunk_size: int = 1000) -> Iterator[bytes]:
+    """Produit l'export par morceaux d'octets, un morceau par paquet de lignes."""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Table non exportable : {table} (attendu : {', '.join(EXPORT_TABLES)})")
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Format d'export inconnu : {export_format} (attendu : {', '.join(EXPORT_FORMATS)})")
+    columns = export_columns(table)
+    # wbits=31 : flux au format gzip, compressé au fil de l'eau
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def encode(text: str) -> bytes:
+        data = text.encode()
+        return compressor.compress(data) if compressor else data
+
+    if export_format == "csv":
+        yield encode(_csv_chunk([], columns, header=True))
+    for rows in iter_rows(table, created_after, created_before, chunk_size):
+        data = encode(_csv_chunk(rows, columns, header=False) if export_format == "csv" else _ndjson_chunk(rows))
+        if data:
+            yield data
+    if compressor:
+        yield compressor.flush()
+
+# Point d'entrée en ligne de commande : python -m utils.export transactions --format csv --gzip -o transactions.csv.gz
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporte les transactions ou les abonnements en NDJSON ou en CSV, sans charger la table en mémoire.")
+    parser.add_argument("table", choices=list(EXPORT_TABLES), help="Table à exporter")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="ndjson", help="Format de sortie")
+    parser.add_argument("--gzip", action="store_true", help="Compresse la sortie au format gzip")
+    parser.add_argument("--created-after", type=datetime.fromisoformat, help="Date minimale incluse (created_at des transactions, start_date des abonnements)")
+    parser.add_argument("--created-before", type=datetime.fromisoformat, help="Date maximale exclue")
+    parser.add_argument("--chunk-size", type=int, default=settings.export_chunk_size, help="Nombre de lignes lues par paquet")
+    parser.add_argument("-o", "--output", help="Fichier de sortie (par défaut : sortie standard)")
+    args = parser.parse_args()
+    from utils.log import setup_logging
+    setup_logging(settings)
+
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in iter_export(args.table, args.format, args.gzip, args.created_after, args.created_before, args.chunk_size):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
@@ -0,0 +1,177 @@
+# Stockage des clés d'idempotence et des réponses associées
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal
+from models.idempotency_key import IdempotencyKey
+from constants import IDEMPOTENCY_KEY_STATUS
+from config import settings
+from utils.deadline import deadline_scope
+from utils.log import get_logger
+
+log = get_logger(__name__)
+
+def request_fingerprint(*parts: Any) -> str:
+    """Empreinte SHA-256 des éléments qui définissent une requête (fournisseur, corps...)."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class IdempotencyStore:
+    """Associe une clé Idempotency-Key à l'empreinte de la requête et à sa réponse.
+
+    La clé est réservée en base (statut `processing`) avant l'appel au fournisseur,
+    puis la réponse est enregistrée dans le même commit que la ligne créée : une
+    requête rejouée avec la même clé reçoit la réponse d'origine sans nouvel appel
+    au fournisseur. Les réponses récentes sont aussi gardées dans un cache LRU borné.
+    Une clé réutilisée avec un autre corps est refusée (422), une clé en cours de
+    traitement aussi (409) ; une réservation plus ancienne que `lock_timeout`
+    est considérée comme abandonnée.
+    """
+
+    def __init__(self, ttl_hours: int = 24, lock_timeout: float = 60.0, cache_size: int = 10000):
+        self.ttl = timedelta(hours=ttl_hours)
+        self.lock_timeout = timedelta(seconds=lock_timeout)
+        self.cache_size = cache_size
+        self._responses: "OrderedDict[Tuple[str, str], Tuple[float, str, int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.replays = 0
+
+    def _cached(self, scope: str, key: str) -> Optional[Tuple[str, int, Any]]:
+        with self._lock:
+            entry = self._responses.get((scope, key))
+            if entry is None:
+                return None
+            expires_at, fingerprint, response_code, response_body = entry
+            if expires_at <= time.time():
+                del self._responses[(scope, key)]
+                return None
+            self._responses.move_to_end((scope, key))
+            return fingerprint, response_code, response_body
+
+    def _remember(self, record: IdempotencyKey) -> None:
+        expires_at = time.time() + self.ttl.total_seconds() - (datetime.utcnow() - record.created_at).total_seconds()
+        with self._lock:
+            self._responses[(record.scope, record.key)] = (expires_at, record.fingerprint, record.response_code, record.response_body)
+            self._responses.move_to_end((record.scope, record.key))
+            while len(self._responses) > self.cache_size:
+                self._responses.popitem(last=False)
+
+    def _check_fingerprint(self, record_fingerprint: str, fingerprint: str) -> None:
+        if record_fingerprint != fingerprint:
+            raise HTTPException(status_code=422, detail="Cette clé d'idempotence a déjà été utilisée pour une requête différente")
+
+    async def begin(self, db, scope: str, key: Optional[str], fingerprint: str) -> Optional[IdempotencyKey]:
+        """Réserve la clé pour la requête en cours.
+
+        Retourne None sans clé, l'enregistrement terminé à rejouer si la requête a déjà
+        été traitée, ou l'enregistrement réservé à passer à `complete` / `release`.
+        """
+        if not key:
+            return None
+
+        cached = self._cached(scope, key)
+        if cached is not None:
+            cached_fingerprint, response_code, response_body = cached
+            self._check_fingerprint(cached_fingerprint, fingerprint)
+            return IdempotencyKey(scope=scope, key=key, fingerprint=fingerprint, status=IDEMPOTENCY_KEY_STATUS['COMPLETED'], response_code=response_code, response_body=response_body)
+
+        result = await db.execute(select(IdempotencyKey).where(IdempotencyKey.scope == scope, IdempotencyKey.key == key))
+        record = result.scalars().first()
+        now = datetime.utcnow()
+        if record is not None:
+            expired = record.created_at <= now - self.ttl
+            abandoned = record.status == IDEMPOTENCY_KEY_STATUS['PROCESSING'] and record.created_at <= now - self.lock_timeout
+            if not expired and not abandoned:
+                self._check_fingerprint(record.fingerprint, fingerprint)
+                if record.status == IDEMPOTENCY_KEY_STATUS['PROCESSING']:
+                    raise HTTPException(status_code=409, detail="Une requête avec cette clé d'idempotence est en cours de traitement", headers={"Retry-After": "1"})
+                self._remember(record)
+                return record
+            # Clé expirée ou réservation abandonnée : la clé est réservée à nouveau
+            record.fingerprint = fingerprint
+            record.status = IDEMPOTENCY_KEY_STATUS['PROCESSING']
+            record.response_code = None
+            record.response_body = None
+            record.created_at = now
+            record.completed_at = None
+        else:
+            record = IdempotencyKey(scope=scope, key=key, fingerprint=fingerprint, status=IDEMPOTENCY_KEY_STATUS['PROCESSING'], created_at=now)
+            db.add(record)
+
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Même clé réservée au même moment par un autre worker
+            await db.rollback()
+            raise HTTPException(status_code=409, detail="Une requête avec cette clé d'idempotence est en cours de traitement", headers={"Retry-After": "1"})
+        return record
+
+    def replay(self, record: IdempotencyKey) -> JSONResponse:
+        """Réponse d'origine d'une requête déjà traitée."""
+        self.replays += 1
+        log.info("idempotency.replayed", scope=record.scope, key=record.key)
+        return JSONResponse(content=record.response_body, status_code=record.response_code, headers={"Idempotent-Replayed": "true"})
+
+    async def complete(self, db, record: Optional[IdempotencyKey], response_code: int, response_body: Any) -> None:
+        """Enregistre la réponse et valide la transaction en cours (ligne créée et clé) en un seul commit."""
+        if record is not None:
+            record.status = IDEMPOTENCY_KEY_STATUS['COMPLETED']
+            record.response_code = response_code
+            record.response_body = response_body
+            record.completed_at = datetime.utcnow()
+        await db.commit()
+        if record is not None:
+            self._remember(record)
+
+    async def release(self, db, record: Optional[IdempotencyKey]) -> None:
+        """Libère la clé après un échec : le client peut relancer la requête avec la même clé.
+
+        Exécuté sans échéance : la clé est libérée même si la requête a échoué faute de temps.
+        """
+        await db.rollback()
+        if record is None:
+            return
+        with deadline_scope(None):
+            try:
+                await db.delete(record)
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                log.warning("idempotency.release_failed", scope=record.scope, key=record.key, error=str(e))
+
+    def purge_expired(self) -> int:
+        """Supprime les clés plus anciennes que la durée de conservation."""
+        with SessionLocal() as db:
+            result = db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < datetime.utcnow() - self.ttl))
+            db.commit()
+        return result.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"cached": len(self._responses), "max_size": self.cache_size, "replays": self.replays}
+
+async def purge_loop(store: IdempotencyStore, interval: int) -> None:
+    """Tâche de fond supprimant les clés expirées toutes les `interval` secondes."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            purged = await asyncio.to_thread(store.purge_expired)
+            log.info("idempotency.purged", purged=purged)
+        except Exception as e:
+            log.exception("idempotency.purge_error", error=str(e))
+
+# Stockage partagé par les routes de création
+idempotency_store = IdempotencyStore(
+    ttl_hours=settings.idempotency_key_ttl_hours,
+    lock_timeout=settings.idempotency_lock_timeout,
+    cache_size=settings.idempotency_cache_size
+)
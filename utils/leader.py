@@ -0,0 +1,79 @@
+# Élection d'un seul processus (parmi les workers et les réplicas) pour les tâches de fond
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+from sqlalchemy import delete, insert, or_, update
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal
+from models.job_lease import JobLease
+from utils.log import get_logger
+
+log = get_logger(__name__)
+
+class LeaderLease:
+    """Bail nommé dans la table `job_leases`, détenu par un seul processus à la fois.
+
+    Le détenteur le renouvelle avant son expiration ; s'il s'arrête sans le libérer
+    (arrêt brutal), un autre processus le reprend une fois `ttl` écoulé. La base étant
+    partagée, l'élection couvre les workers de gunicorn comme les réplicas du service.
+    À créer dans le processus qui exécutera les tâches (après le fork) : l'identifiant
+    du détenteur inclut son pid.
+    """
+
+    def __init__(self, name: str, ttl: float = 30.0):
+        self.name = name
+        self.ttl = timedelta(seconds=ttl)
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def try_acquire(self) -> bool:
+        """Obtient ou renouvelle le bail ; False s'il est détenu par un autre processus."""
+        now = datetime.utcnow()
+        with SessionLocal() as db:
+            result = db.execute(
+                update(JobLease)
+                .where(JobLease.name == self.name, or_(JobLease.holder == self.holder, JobLease.expires_at < now))
+                .values(holder=self.holder, expires_at=now + self.ttl)
+            )
+            if result.rowcount == 0:
+                try:
+                    db.execute(insert(JobLease).values(name=self.name, holder=self.holder, expires_at=now + self.ttl))
+                except IntegrityError:
+                    # Bail en cours détenu par un autre processus
+                    db.rollback()
+                    return False
+            db.commit()
+        return True
+
+    def release(self) -> None:
+        with SessionLocal() as db:
+            db.execute(delete(JobLease).where(JobLease.name == self.name, JobLease.holder == self.holder))
+            db.commit()
+
+async def run_as_leader(lease: LeaderLease, start: Callable[[], None], stop: Callable[[], Awaitable[None]], interval: float) -> None:
+    """Tâche de fond : tente d'obtenir (ou renouvelle) le bail toutes les `interval` secondes,
+    démarre les tâches avec `start` lorsqu'il est obtenu et les arrête avec `stop` s'il est perdu.
+    Le bail est libéré à l'annulation de la tâche (arrêt du worker)."""
+    leading = False
+    try:
+        while True:
+            try:
+                acquired = await asyncio.to_thread(lease.try_acquire)
+            except Exception as e:
+                # Bail non renouvelé : il peut expirer et être repris, les tâches sont arrêtées
+                log.exception("leader.lease_error", lease=lease.name, error=str(e))
+                acquired = False
+            if acquired != leading:
+                leading = acquired
+                log.info("leader.elected" if leading else "leader.demoted", lease=lease.name, holder=lease.holder)
+                if leading:
+                    start()
+                else:
+                    await stop()
+            await asyncio.sleep(interval)
+    finally:
+        if leading:
+            await stop()
+            await asyncio.to_thread(lease.release)
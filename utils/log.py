@@ -0,0 +1,169 @@
+# Journalisation structurée : les enregistrements sont mis en file et écrits par un thread dédié
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+ROOT_LOGGER = "paiement"
+
+# Attributs standards d'un LogRecord, exclus des champs de l'événement
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "event", "fields"}
+
+class EventLogger:
+    """Journal d'événements nommés accompagnés de champs structurés.
+
+    `log.info("transaction.created", provider="stripe", transaction_id=42)` ne
+    construit aucun enregistrement si le niveau est désactivé ou si l'événement
+    est écarté par l'échantillonnage ; la mise en forme des champs est faite
+    par le thread d'écriture.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def isEnabledFor(self, level: int) -> bool:
+        return self.logger.isEnabledFor(level)
+
+    def _log(self, level: int, event: str, fields: Dict[str, Any], exc_info: bool = False) -> None:
+        if not self.logger.isEnabledFor(level) or not _sampler.keep(event):
+            return
+        self.logger.log(level, event, exc_info=exc_info, extra={"event": event, "fields": fields}, stacklevel=3)
+
+    def debug(self, event: str, **fields: Any) -> None:
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields: Any) -> None:
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields: Any) -> None:
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields: Any) -> None:
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event: str, **fields: Any) -> None:
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+class _Sampler:
+    def __init__(self):
+        self.rates: Dict[str, float] = {}
+
+    def keep(self, event: str) -> bool:
+        rate = self.rates.get(event)
+        return rate is None or rate >= 1.0 or random.random() < rate
+
+_sampler = _Sampler()
+
+def get_logger(name: str) -> EventLogger:
+    """Journal d'un module, rattaché à la hiérarchie `paiement`."""
+    return EventLogger(logging.getLogger(f"{ROOT_LOGGER}.{name}"))
+
+def _record_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    fields = dict(getattr(record, "fields", None) or {})
+    # Champs passés via `extra` par un appel logging standard
+    fields.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+    return fields
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": getattr(record, "event", None) or record.getMessage(),
+        }
+        entry.update(_record_fields(record))
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = datetime.fromtimestamp(record.created, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+        event = getattr(record, "event", None) or record.getMessage()
+        fields = " ".join(f"{key}={value}" for key, value in _record_fields(record).items())
+        line = f"{timestamp} {record.levelname:<7} {record.name} {event} {fields}".rstrip()
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler sans mise en forme dans le thread appelant, qui abandonne
+    les enregistrements plutôt que de bloquer lorsque la file est pleine."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Le thread d'écriture met en forme l'enregistrement : rien à faire ici
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+
+def setup_logging(settings) -> None:
+    """Configure la hiérarchie `paiement` à partir des paramètres de l'application.
+
+    Idempotent : un second appel ne fait que mettre à jour les niveaux et l'échantillonnage.
+    """
+    global _listener, _queue_handler
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(settings.log_level.upper())
+    for name, level in settings.log_levels.items():
+        logging.getLogger(f"{ROOT_LOGGER}.{name}").setLevel(level.upper())
+    _sampler.rates = dict(settings.log_sampling)
+
+    if _listener is not None:
+        return
+    log_queue: queue.Queue = queue.Queue(maxsize=settings.log_queue_size)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if settings.log_format == "json" else TextFormatter())
+    _queue_handler = NonBlockingQueueHandler(log_queue)
+    root.addHandler(_queue_handler)
+    root.propagate = False
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def reinit_logging_after_fork(settings) -> None:
+    """Recrée la file et le thread d'écriture dans un processus issu d'un fork.
+
+    Le thread du QueueListener du processus parent n'existe pas dans l'enfant :
+    sans cela, les événements des workers resteraient dans la file sans être écrits.
+    """
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger(ROOT_LOGGER).removeHandler(_queue_handler)
+    _listener = None
+    _queue_handler = None
+    setup_logging(settings)
+
+def shutdown_logging() -> None:
+    """Vide la file et arrête le thread d'écriture."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        if _queue_handler is not None:
+            logging.getLogger(ROOT_LOGGER).removeHandler(_queue_handler)
+
+def logging_stats() -> Dict[str, Any]:
+    return {
+        "queue_depth": _queue_handler.queue.qsize() if _queue_handler else 0,
+        "dropped": _queue_handler.dropped if _queue_handler else 0
+    }
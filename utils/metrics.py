@@ -0,0 +1,257 @@
+# Métriques de l'application exposées au format texte Prometheus
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+from providers.base import AsyncPaymentProvider, ProviderWrapper
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        # Un verrou court par métrique : les séries sont indépendantes d'une métrique à l'autre
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def set_total(self, value: float, *label_values: str) -> None:
+        """Reporte un total cumulé tenu par un autre composant (cache, journalisation), relu à chaque export."""
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Par série : compteurs non cumulés par intervalle (le dernier pour +Inf), somme
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def time(self, *label_values: str) -> "_Timer":
+        return _Timer(self, label_values)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total[0]) for key, (counts, total) in self._series.items()]
+        lines = self._header()
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram: Histogram, label_values: LabelValues):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Fonction appelée avant chaque export, pour mettre à jour des jauges."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+provider_request_duration = registry.register(Histogram(
+    "payment_provider_request_duration_seconds",
+    "Durée des appels aux fournisseurs de paiement",
+    ("provider", "method")
+))
+provider_requests = registry.register(Counter(
+    "payment_provider_requests_total",
+    "Appels aux fournisseurs de paiement par résultat",
+    ("provider", "method", "outcome")
+))
+webhook_events = registry.register(Counter(
+    "webhook_events_total",
+    "Webhooks traités par type et par résultat",
+    ("provider", "type", "outcome")
+))
+webhook_batch_duration = registry.register(Histogram(
+    "webhook_batch_duration_seconds",
+    "Durée d'application d'un lot de webhooks",
+))
+db_query_duration = registry.register(Histogram(
+    "db_query_duration_seconds",
+    "Durée des requêtes SQL par type d'instruction",
+    ("statement",)
+))
+db_commit_duration = registry.register(Histogram(
+    "db_commit_duration_seconds",
+    "Durée des commits de session (flush compris)",
+))
+db_session_duration = registry.register(Histogram(
+    "db_session_duration_seconds",
+    "Durée de vie des sessions ouvertes par les routes",
+))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "Durée des requêtes HTTP par route",
+    ("method", "route", "status")
+))
+
+class MeteredProvider(ProviderWrapper):
+    """Mesure la durée et le résultat de chaque appel au fournisseur délégué."""
+
+    def __init__(self, inner: AsyncPaymentProvider, provider_key: str):
+        super().__init__(inner)
+        self.provider_key = provider_key
+
+    async def _call(self, method: str, func, *args, **kwargs):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await func(*args, **kwargs)
+            outcome = "success"
+            return result
+        finally:
+            provider_request_duration.observe(time.perf_counter() - started, self.provider_key, method)
+            provider_requests.inc(self.provider_key, method, outcome)
+
+class MetricsMiddleware:
+    """Middleware ASGI mesurant la durée des requêtes HTTP, étiquetées par modèle de route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Le modèle de route (/transactions/{transaction_id}) borne le nombre de séries
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            http_request_duration.observe(time.perf_counter() - started, scope["method"], route_path, str(status[0]))
+
+def instrument_engine(engine) -> None:
+    """Mesure la durée des requêtes SQL d'un moteur synchrone (ou du `sync_engine` d'un moteur asynchrone)."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        db_query_duration.observe(time.perf_counter() - started, statement.lstrip().split(" ", 1)[0].upper())
+
+def instrument_sessions() -> None:
+    """Mesure la durée des commits de toutes les sessions ORM (synchrones et asynchrones)."""
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    @event.listens_for(Session, "before_commit")
+    def _before_commit(session):
+        session.info["commit_started"] = time.perf_counter()
+
+    @event.listens_for(Session, "after_commit")
+    def _after_commit(session):
+        started = session.info.pop("commit_started", None)
+        if started is not None:
+            db_commit_duration.observe(time.perf_counter() - started)
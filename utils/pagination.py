@@ -0,0 +1,25 @@
+# Curseurs opaques de la pagination par clé (keyset)
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Encode la position (created_at, id) de la dernière ligne d'une page."""
+    payload = json.dumps([created_at.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Retourne la position encodée dans le curseur ; lève ValueError si le curseur est invalide."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise ValueError("Curseur de pagination invalide")
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Les dates sont stockées en UTC sans fuseau : les dates avec fuseau sont converties."""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
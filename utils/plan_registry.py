@@ -0,0 +1,114 @@
+# Registre local des plans de facturation PayPal
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal
+from models.paypal_plan import PayPalPlan
+
+PlanKey = Tuple[int, str, str, int, str, str]
+
+PLAN_STATE_CREATED = "CREATED"
+PLAN_STATE_ACTIVE = "ACTIVE"
+
+def plan_key(amount: float, currency: str, interval: str, interval_count: int, return_url: str, cancel_url: str) -> PlanKey:
+    return (int(round(amount * 100)), currency.upper(), interval.upper(), int(interval_count), return_url, cancel_url)
+
+class BillingPlanRegistry:
+    """Associe les conditions d'un abonnement PayPal à un plan de facturation existant.
+
+    Le registre est conservé en mémoire et persisté dans la table `paypal_plans`.
+    Un plan est créé une seule fois par jeu de conditions, puis activé au moment
+    de son premier accord ; les souscriptions suivantes ne créent que l'accord.
+    """
+
+    def __init__(self):
+        self._plans: Dict[PlanKey, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[PlanKey, threading.Lock] = {}
+        self._loaded = False
+
+    def load(self) -> int:
+        """Charge les plans persistés en base."""
+        with SessionLocal() as db:
+            rows = db.execute(select(PayPalPlan)).scalars().all()
+        with self._lock:
+            for row in rows:
+                key = (row.amount, row.currency, row.frequency, row.frequency_interval, row.return_url, row.cancel_url)
+                self._plans.setdefault(key, (row.plan_id, row.state))
+            self._loaded = True
+        return len(rows)
+
+    def get(self, key: PlanKey) -> Optional[Tuple[str, str]]:
+        """Retourne (plan_id, état) pour la clé, ou None."""
+        if not self._loaded:
+            self.load()
+        return self._plans.get(key)
+
+    def _key_lock(self, key: PlanKey) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def register(self, key: PlanKey, plan_id: str, state: str = PLAN_STATE_CREATED) -> Tuple[str, str]:
+        """Enregistre un plan s'il n'existe pas déjà pour cette clé et retourne le plan retenu."""
+        with self._lock:
+            existing = self._plans.get(key)
+            if existing:
+                return existing
+            self._plans[key] = (plan_id, state)
+        amount, currency, frequency, frequency_interval, return_url, cancel_url = key
+        now = datetime.utcnow()
+        with SessionLocal() as db:
+            db.add(PayPalPlan(
+                amount=amount,
+                currency=currency,
+                frequency=frequency,
+                frequency_interval=frequency_interval,
+                return_url=return_url,
+                cancel_url=cancel_url,
+                plan_id=plan_id,
+                state=state,
+                created_at=now,
+                activated_at=now if state == PLAN_STATE_ACTIVE else None
+            ))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Déjà enregistré par un autre processus
+                db.rollback()
+        return plan_id, state
+
+    def get_active_plan(self, key: PlanKey, create: Callable[[], str], activate: Callable[[str], None]) -> str:
+        """Retourne l'ID d'un plan actif pour la clé.
+
+        Le plan est créé via `create` s'il n'existe pas, puis activé via `activate`
+        s'il ne l'est pas encore. Les appels simultanés pour une même clé ne
+        créent et n'activent le plan qu'une seule fois.
+        """
+        entry = self.get(key)
+        if entry and entry[1] == PLAN_STATE_ACTIVE:
+            return entry[0]
+        with self._key_lock(key):
+            entry = self.get(key)
+            if entry is None:
+                entry = self.register(key, create())
+            plan_id, state = entry
+            if state != PLAN_STATE_ACTIVE:
+                activate(plan_id)
+                self._mark_active(key, plan_id)
+            return plan_id
+
+    def _mark_active(self, key: PlanKey, plan_id: str) -> None:
+        with self._lock:
+            self._plans[key] = (plan_id, PLAN_STATE_ACTIVE)
+        with SessionLocal() as db:
+            db.execute(
+                update(PayPalPlan)
+                .where(PayPalPlan.plan_id == plan_id)
+                .values(state=PLAN_STATE_ACTIVE, activated_at=datetime.utcnow())
+            )
+            db.commit()
+
+    def __len__(self) -> int:
+        return len(self._plans)
@@ -0,0 +1,96 @@
+# Registre local des prix récurrents Stripe
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal
+from models.stripe_price import StripePrice
+
+PriceKey = Tuple[int, str, str, int]
+
+def price_key(amount: float, currency: str, interval: str, interval_count: int) -> PriceKey:
+    return (int(round(amount * 100)), currency.lower(), interval.lower(), int(interval_count))
+
+class PriceRegistry:
+    """Associe (montant, devise, intervalle, nombre d'intervalles) à un prix Stripe existant.
+
+    Le registre est conservé en mémoire et persisté dans la table `stripe_prices`,
+    afin qu'un abonnement réutilise un prix déjà créé au lieu de recréer un
+    produit et un prix à chaque souscription.
+    """
+
+    def __init__(self):
+        self._prices: Dict[PriceKey, str] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[PriceKey, threading.Lock] = {}
+        self._loaded = False
+
+    def load(self) -> int:
+        """Charge les prix persistés en base."""
+        with SessionLocal() as db:
+            rows = db.execute(select(StripePrice)).scalars().all()
+        with self._lock:
+            for row in rows:
+                self._prices.setdefault((row.unit_amount, row.currency, row.interval, row.interval_count), row.price_id)
+            self._loaded = True
+        return len(rows)
+
+    def get(self, key: PriceKey) -> Optional[str]:
+        if not self._loaded:
+            self.load()
+        return self._prices.get(key)
+
+    def register(self, key: PriceKey, price_id: str, product_id: Optional[str] = None) -> str:
+        """Enregistre un prix s'il n'existe pas déjà pour cette clé et retourne le prix retenu."""
+        with self._lock:
+            existing = self._prices.get(key)
+            if existing:
+                return existing
+            self._prices[key] = price_id
+        unit_amount, currency, interval, interval_count = key
+        with SessionLocal() as db:
+            db.add(StripePrice(
+                unit_amount=unit_amount,
+                currency=currency,
+                interval=interval,
+                interval_count=interval_count,
+                price_id=price_id,
+                product_id=product_id,
+                created_at=datetime.utcnow()
+            ))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Déjà enregistré par un autre processus
+                db.rollback()
+        return price_id
+
+    def get_or_create(self, key: PriceKey, create: Callable[[], Tuple[str, str]]) -> str:
+        """Retourne le prix associé à la clé, ou le crée une seule fois via `create` (price_id, product_id)."""
+        price_id = self.get(key)
+        if price_id:
+            return price_id
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Deux souscriptions simultanées pour un nouveau tarif ne créent qu'un seul prix
+        with key_lock:
+            price_id = self.get(key)
+            if price_id:
+                return price_id
+            price_id, product_id = create()
+            return self.register(key, price_id, product_id)
+
+    def warm(self, prices: Iterable[Tuple[PriceKey, str, str]]) -> int:
+        """Complète le registre avec des prix existants (clé, price_id, product_id)."""
+        if not self._loaded:
+            self.load()
+        added = 0
+        for key, price_id, product_id in prices:
+            if key not in self._prices:
+                self.register(key, price_id, product_id)
+                added += 1
+        return added
+
+    def __len__(self) -> int:
+        return len(self._prices)
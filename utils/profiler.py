@@ -0,0 +1,49 @@
+# Profileur par échantillonnage des piles de tous les threads du processus
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+
+class ProfilerBusy(Exception):
+    """Un profil est déjà en cours dans ce processus."""
+
+_running = threading.Lock()
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+def sample_stacks(duration: float, interval: float = 0.005) -> Dict[str, int]:
+    """Échantillonne les piles pendant `duration` secondes et retourne le nombre
+    d'occurrences de chaque pile, au format « collapsed » (racine;...;feuille).
+
+    Bloquant : à exécuter dans un thread pour profiler la boucle d'événements.
+    """
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy("Un profil est déjà en cours")
+    try:
+        own_thread = threading.get_ident()
+        names = {}
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                labels: List[str] = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(labels))] += 1
+            time.sleep(interval)
+        return dict(stacks)
+    finally:
+        _running.release()
+
+def collapsed(stacks: Dict[str, int]) -> str:
+    """Format accepté par flamegraph.pl et speedscope : une pile et son nombre d'échantillons par ligne."""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
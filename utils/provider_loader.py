@@ -1,25 +1,240 @@
 # Importation des modules nécessaires
+import threading
+import time
+from collections.abc import Mapping
 from importlib import import_module
-from typing import Dict
-from fastapi import Depends
-from providers.base import PaymentProvider
-from config import settings
-
-def load_payment_providers() -> Dict[str, PaymentProvider]:
-    """Charge les fournisseurs de paiement à partir de la configuration."""
-    providers = {}
-    for provider_key, provider_config in settings.payment_providers.items():
-        module_path, class_name = provider_config.class_path.rsplit('.', 1)
+from typing import Dict, Any, Iterable, List, NamedTuple, Optional, Tuple
+from fastapi import HTTPException, Path
+from providers.base import PaymentProvider, AsyncPaymentProvider
+from config import settings, PaymentProviderConfig
+from utils.metrics import MeteredProvider
+from utils.tracing import TracedProvider
+from utils.deadline import DeadlineExceededError
+from utils.resilience import Bulkhead, BulkheadProvider, CircuitBreaker, ResilientProvider
+from utils.routing import HealthTrackingProvider, ProviderRouter
+from utils.log import get_logger
+
+log = get_logger(__name__)
+
+# Valeur du paramètre `provider` confiant le choix du fournisseur au routage
+AUTO_PROVIDER = "auto"
+
+# Mesures de latence et d'erreurs des fournisseurs, propres au processus
+provider_router = ProviderRouter(
+    settings.routing_providers,
+    settings.routing_weights,
+    alpha=settings.routing_ewma_alpha,
+    error_half_life=settings.routing_error_half_life,
+    error_penalty=settings.routing_error_penalty,
+    exploration=settings.routing_exploration
+)
+
+def make_resilient(provider: AsyncPaymentProvider, provider_key: str) -> ResilientProvider:
+    """Place le fournisseur derrière son disjoncteur, avec les nouvelles tentatives configurées."""
+    breaker = CircuitBreaker(
+        provider_key,
+        failure_threshold=settings.provider_breaker_failure_threshold,
+        recovery_timeout=settings.provider_breaker_recovery_timeout
+    )
+    return ResilientProvider(
+        provider,
+        provider_key,
+        breaker,
+        retry_attempts=settings.provider_retry_attempts,
+        retry_base_delay=settings.provider_retry_base_delay,
+        retry_max_delay=settings.provider_retry_max_delay
+    )
+
+def build_async_provider(provider_key: str, provider: PaymentProvider, provider_config: PaymentProviderConfig) -> AsyncPaymentProvider:
+    """Version asynchrone d'un fournisseur, instrumentée pour /metrics et le traçage.
+
+    Chaque tentative est mesurée (MeteredProvider sous le disjoncteur). Le cloisonnement
+    (BulkheadProvider) couvre l'appel complet, nouvelles tentatives comprises, de même que
+    le span et les mesures du routage (HealthTrackingProvider), qui voient aussi les refus.
+    """
+    # Avec une limite de concurrence, le pool de threads dédié du fournisseur est dimensionné à cette limite
+    max_workers = provider_config.max_concurrency or settings.provider_max_workers
+    bulkhead = Bulkhead(
+        provider_key,
+        max_concurrency=provider_config.max_concurrency,
+        max_queued=provider_config.max_queued,
+        queue_timeout=provider_config.queue_timeout
+    )
+    resilient = make_resilient(MeteredProvider(provider.as_async(max_workers=max_workers), provider_key), provider_key)
+    return TracedProvider(HealthTrackingProvider(BulkheadProvider(resilient, bulkhead), provider_router.health(provider_key)))
+
+class LoadedProvider(NamedTuple):
+    provider: PaymentProvider
+    async_provider: AsyncPaymentProvider
+
+class ProviderRegistry:
+    """Fournisseurs de paiement activés, importés et instanciés à leur première utilisation.
+
+    Seuls les fournisseurs activés dans la configuration sont connus ; le module d'un
+    fournisseur (et son SDK : stripe, paypalrestsdk...) n'est importé qu'au premier accès,
+    et le fournisseur instancié une seule fois par processus, même sous des accès
+    simultanés (routes, threads de la file des webhooks, réconciliation). Les durées
+    d'import et d'initialisation de chaque fournisseur alimentent le rapport de démarrage.
+    """
+
+    def __init__(self, configs: Dict[str, PaymentProviderConfig]):
+        self.configs = configs
+        self._locks = {provider_key: threading.Lock() for provider_key in configs}
+        self._loaded: Dict[str, LoadedProvider] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def _import(self, provider_key: str):
+        module_path, class_name = self.configs[provider_key].class_path.rsplit('.', 1)
+        started = time.perf_counter()
         module = import_module(module_path)
-        provider_class = getattr(module, class_name)
-        providers[provider_key] = provider_class(**provider_config.config)
-    return providers
+        # Premier import seulement : un module déjà chargé (processus maître, autre fournisseur) ne coûte rien
+        self.timings.setdefault(provider_key, {}).setdefault("import_ms", round((time.perf_counter() - started) * 1000, 1))
+        return getattr(module, class_name)
+
+    def load(self, provider_key: str) -> LoadedProvider:
+        """Fournisseur `provider_key`, importé et instancié au premier appel ; KeyError s'il n'est pas activé."""
+        loaded = self._loaded.get(provider_key)
+        if loaded is not None:
+            return loaded
+        with self._locks[provider_key]:
+            if provider_key not in self._loaded:
+                provider_config = self.configs[provider_key]
+                provider_class = self._import(provider_key)
+                started = time.perf_counter()
+                provider = provider_class(**provider_config.config)
+                async_provider = build_async_provider(provider_key, provider, provider_config)
+                self.timings[provider_key]["init_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                self._loaded[provider_key] = LoadedProvider(provider, async_provider)
+                log.info("provider.loaded", provider=provider_key, **self.timings[provider_key])
+        return self._loaded[provider_key]
+
+    def _keys(self, provider_keys: Iterable[str]) -> Iterable[str]:
+        return list(self.configs) if "*" in provider_keys else provider_keys
+
+    def import_modules(self, provider_keys: Iterable[str]) -> None:
+        """Importe les modules des fournisseurs désignés ("*" pour tous), sans les instancier."""
+        for provider_key in self._keys(provider_keys):
+            with self._locks[provider_key]:
+                self._import(provider_key)
+
+    def preload(self, provider_keys: Iterable[str]) -> None:
+        """Instancie dès maintenant les fournisseurs désignés ("*" pour tous)."""
+        for provider_key in self._keys(provider_keys):
+            self.load(provider_key)
+
+    def reset(self) -> None:
+        """Oublie les fournisseurs instanciés dans le processus parent, avant un fork.
+
+        Leurs pools de threads, clients HTTP et threads d'arrière-plan ne sont pas utilisables
+        dans le worker, qui crée les siens au premier accès. Les modules déjà importés sont conservés.
+        """
+        # Un verrou tenu par un thread du parent au moment du fork le resterait dans le worker
+        self._locks = {provider_key: threading.Lock() for provider_key in self.configs}
+        self._loaded = {}
+        for timings in self.timings.values():
+            timings.pop("init_ms", None)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "enabled": list(self.configs),
+            "loaded": list(self._loaded),
+            "timings_ms": {provider_key: dict(timings) for provider_key, timings in self.timings.items()}
+        }
 
-# Chargement initial des fournisseurs de paiement
-print("Chargement des fournisseurs de paiement...")
-payment_providers = load_payment_providers()
-print(f"Fournisseurs chargés : {', '.join(payment_providers.keys())}")
+class ProviderMapping(Mapping):
+    """Vue d'un registre en dictionnaire (fournisseurs synchrones ou asynchrones).
 
-def get_payment_provider(provider: str = "stripe") -> PaymentProvider:
+    Les clés sont les fournisseurs activés : `in` et l'itération des clés n'importent aucun
+    fournisseur, l'accès à une valeur le charge. `loaded()` ne retourne que les fournisseurs
+    déjà instanciés (métriques, arrêt de l'application).
+    """
+
+    def __init__(self, registry: ProviderRegistry, field: str):
+        self.registry = registry
+        self.field = field
+
+    def __getitem__(self, provider_key: str):
+        return getattr(self.registry.load(provider_key), self.field)
+
+    def __contains__(self, provider_key) -> bool:
+        return provider_key in self.registry.configs
+
+    def __iter__(self):
+        return iter(self.registry.configs)
+
+    def __len__(self) -> int:
+        return len(self.registry.configs)
+
+    def loaded(self) -> Dict[str, Any]:
+        return {provider_key: getattr(loaded, self.field) for provider_key, loaded in list(self.registry._loaded.items())}
+
+# Fournisseurs activés par la configuration, chargés à leur première utilisation
+provider_registry = ProviderRegistry(settings.payment_providers)
+payment_providers = ProviderMapping(provider_registry, "provider")
+async_payment_providers = ProviderMapping(provider_registry, "async_provider")
+log.info("providers.enabled", providers=list(provider_registry.configs))
+
+def init_payment_providers() -> None:
+    """Prépare les fournisseurs du processus courant (worker issu d'un fork).
+
+    Les vues partagées restent les mêmes objets : la file des webhooks et les routes,
+    qui les ont importées, chargent ainsi les fournisseurs du worker (pools de threads,
+    clients HTTP et threads d'arrière-plan propres au processus) à leur premier accès.
+    """
+    provider_registry.reset()
+
+def provider_names(provider_key: str) -> List[str]:
+    """Valeurs de la colonne provider d'une transaction désignant ce fournisseur : sa clé ou,
+    pour les transactions plus anciennes, le nom de sa classe."""
+    provider_config = provider_registry.configs.get(provider_key)
+    if provider_config is None:
+        return [provider_key]
+    return [provider_key, provider_config.class_path.rsplit('.', 1)[1]]
+
+def resolve_provider_key(stored_provider: str) -> Optional[str]:
+    """Clé du fournisseur ayant enregistré une transaction, None s'il n'est pas activé."""
+    for provider_key in provider_registry.configs:
+        if stored_provider in provider_names(provider_key):
+            return provider_key
+    return None
+
+def get_payment_provider(provider: str = "stripe") -> AsyncPaymentProvider:
     """Récupère un fournisseur de paiement spécifique."""
-    return payment_providers[provider]
\ No newline at end of file
+    if provider not in async_payment_providers:
+        raise HTTPException(status_code=400, detail=f"Fournisseur de paiement non supporté: {provider}")
+    return async_payment_providers[provider]
+
+def select_payment_provider(provider: str, currency: str) -> Tuple[str, AsyncPaymentProvider]:
+    """Clé et fournisseur désignés par le paramètre `provider`, ou choisis par le routage pour `auto`.
+
+    Avec `auto`, lève ValueError si aucun fournisseur n'est configuré pour la devise et
+    ProviderRejectedError (503) si tous les candidats sont indisponibles ou saturés.
+    """
+    if provider == AUTO_PROVIDER:
+        provider = provider_router.choose(currency, async_payment_providers)
+    return provider, get_payment_provider(provider)
+
+def get_payment_provider_from_path(provider: str = Path(..., description="Le fournisseur de paiement (ex: 'stripe', 'paypal')")) -> AsyncPaymentProvider:
+    """Récupère le fournisseur de paiement désigné dans le chemin de la route."""
+    return get_payment_provider(provider)
+
+async def create_payment_with_failover(provider_key: str, payment_provider: AsyncPaymentProvider, *args, **kwargs) -> Tuple[str, Dict[str, Any]]:
+    """Crée un paiement ponctuel, chez le fournisseur de secours (PROVIDER_FAILOVER) si le premier est indisponible.
+
+    La bascule n'a lieu que pour une erreur transitoire ou un disjoncteur ouvert ; les erreurs
+    métier (paramètre invalide...) et l'échéance de la requête atteinte sont remontées telles quelles. Retourne la clé du
+    fournisseur utilisé et le résultat de create_payment.
+
+    La clé d'idempotence est déclinée par fournisseur pour la tentative de secours : une même clé
+    partagée entre deux fournisseurs ne doit pas faire rejouer chez l'un la réponse de l'autre.
+    """
+    try:
+        return provider_key, await payment_provider.create_payment(*args, **kwargs)
+    except Exception as e:
+        fallback = settings.provider_failover.get(provider_key)
+        if fallback is None or fallback not in async_payment_providers or isinstance(e, DeadlineExceededError) or not payment_provider.is_transient_error(e):
+            raise
+        log.warning("provider.failover", provider=provider_key, fallback=fallback, error=str(e))
+        if kwargs.get("idempotency_key"):
+            kwargs = {**kwargs, "idempotency_key": f"{kwargs['idempotency_key']}:{fallback}"}
+        return fallback, await async_payment_providers[fallback].create_payment(*args, **kwargs)
@@ -0,0 +1,170 @@
+# Réconciliation des statuts des transactions non finalisées
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Tuple
+from sqlalchemy import bindparam, select, update
+from database import SessionLocal
+from models.transaction import Transaction
+from providers.base import AsyncPaymentProvider
+from constants import TERMINAL_PAYMENT_STATUSES
+from config import settings
+from utils.status_cache import status_cache
+from utils.provider_loader import resolve_provider_key
+from utils.log import get_logger
+
+log = get_logger(__name__)
+
+def _load_pending_transactions(created_after: datetime, after_id: int, batch_size: int) -> List[Dict[str, Any]]:
+    # Transactions de la fenêtre de recherche seulement : au-delà, une transaction restée
+    # non finalisée (statut unknown...) n'est plus interrogée à chaque passage
+    with SessionLocal() as db:
+        rows = db.execute(
+            select(Transaction.id, Transaction.provider, Transaction.provider_transaction_id, Transaction.status, Transaction.created_at)
+            .where(
+                Transaction.status.notin_(TERMINAL_PAYMENT_STATUSES),
+                Transaction.provider_transaction_id.isnot(None),
+                Transaction.created_at >= created_after,
+                Transaction.id > after_id
+            )
+            .order_by(Transaction.id)
+            .limit(batch_size)
+        ).all()
+    return [row._asdict() for row in rows]
+
+def _write_statuses(updates: List[Dict[str, Any]]) -> int:
+    # Une ligne n'est modifiée que si elle a gardé le statut lu avant d'interroger le fournisseur :
+    # un webhook appliqué entre-temps n'est pas écrasé par un statut plus ancien
+    if not updates:
+        return 0
+    transactions = Transaction.__table__
+    with SessionLocal() as db:
+        result = db.execute(
+            update(transactions)
+            .where(transactions.c.id == bindparam("b_id"), transactions.c.status == bindparam("b_old_status"))
+            .values(status=bindparam("b_status")),
+            updates
+        )
+        db.commit()
+    return result.rowcount
+
+async def _reconcile_provider(provider: AsyncPaymentProvider, rows: List[Dict[str, Any]], concurrency: int, lookback: timedelta) -> Tuple[Dict[str, Dict[str, Any]], int]:
+    """Statuts obtenus par ID fournisseur et nombre de vérifications en échec ; une erreur
+    du fournisseur (HTTP, SDK, délai) n'interrompt pas la réconciliation des autres."""
+    ids = [row["provider_transaction_id"] for row in rows]
+    statuses: Dict[str, Dict[str, Any]] = {}
+    failed = 0
+
+    # Endpoint de liste du fournisseur, limité à la fenêtre de recherche
+    oldest = min((row["created_at"] for row in rows if row["created_at"]), default=None)
+    if oldest is not None:
+        created_after = max(oldest, datetime.utcnow() - lookback) - timedelta(minutes=5)
+        try:
+            statuses.update(await provider.list_payment_statuses(ids, created_after))
+        except Exception as e:
+            log.warning("reconciliation.list_unavailable", provider=provider.name, error=str(e))
+
+    # Vérifications unitaires pour les transactions restantes, avec une concurrence bornée
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(provider_transaction_id: str):
+        nonlocal failed
+        async with semaphore:
+            try:
+                statuses[provider_transaction_id] = await provider.check_payment_status(provider_transaction_id)
+            except Exception as e:
+                failed += 1
+                log.warning("reconciliation.check_failed", provider=provider.name, provider_transaction_id=provider_transaction_id, error=str(e))
+
+    await asyncio.gather(*(check(transaction_id) for transaction_id in ids if transaction_id not in statuses))
+    return statuses, failed
+
+async def _reconcile_provider_safely(provider_key: str, providers: Dict[str, AsyncPaymentProvider], rows: List[Dict[str, Any]], concurrency: int, lookback: timedelta) -> Tuple[Dict[str, Dict[str, Any]], int]:
+    # Fournisseur impossible à charger ou erreur inattendue : toutes ses vérifications échouent
+    try:
+        return await _reconcile_provider(providers[provider_key], rows, concurrency, lookback)
+    except Exception as e:
+        log.exception("reconciliation.provider_failed", provider=provider_key, error=str(e))
+        return {}, len(rows)
+
+async def reconcile_pending_transactions(providers: Dict[str, AsyncPaymentProvider], concurrency: int = 5, lookback_hours: int = 72, batch_size: int = 500, after_id: int = 0) -> Dict[str, int]:
+    """Rafraîchit le statut d'au plus `batch_size` transactions non finalisées de la fenêtre de
+    recherche, d'ID supérieur à `after_id`, et l'écrit en UPDATE groupés.
+
+    Le résumé indique dans `next_after_id` où reprendre au passage suivant (0 une fois la
+    fenêtre parcourue), pour que toutes les transactions soient vérifiées à tour de rôle.
+    """
+    lookback = timedelta(hours=lookback_hours)
+    rows = await asyncio.to_thread(_load_pending_transactions, datetime.utcnow() - lookback, after_id, batch_size)
+
+    # Seuls les fournisseurs ayant des transactions en attente sont chargés
+    rows_by_provider: Dict[str, List[Dict[str, Any]]] = {}
+    skipped = 0
+    for row in rows:
+        key = resolve_provider_key(row["provider"])
+        if key is None or key not in providers:
+            skipped += 1
+            continue
+        rows_by_provider.setdefault(key, []).append(row)
+
+    results = await asyncio.gather(*(
+        _reconcile_provider_safely(key, providers, provider_rows, concurrency, lookback)
+        for key, provider_rows in rows_by_provider.items()
+    ))
+
+    updates = []
+    for (key, provider_rows), (statuses, _) in zip(rows_by_provider.items(), results):
+        for row in provider_rows:
+            status_info = statuses.get(row["provider_transaction_id"])
+            if status_info and status_info.get("status"):
+                status_cache.set(key, row["provider_transaction_id"], status_info)
+                if status_info["status"] != row["status"]:
+                    updates.append({"b_id": row["id"], "b_old_status": row["status"], "b_status": status_info["status"]})
+    updated = await asyncio.to_thread(_write_statuses, updates)
+
+    return {
+        "pending": len(rows),
+        "checked": sum(len(statuses) for statuses, _ in results),
+        "failed": sum(failed for _, failed in results),
+        "updated": updated,
+        "skipped": skipped,
+        "next_after_id": rows[-1]["id"] if len(rows) == batch_size else 0
+    }
+
+async def reconciliation_loop(providers: Dict[str, AsyncPaymentProvider], interval: int, concurrency: int = 5, lookback_hours: int = 72, batch_size: int = 500) -> None:
+    """Tâche de fond réconciliant un lot de transactions toutes les `interval` secondes."""
+    after_id = 0
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            summary = await reconcile_pending_transactions(providers, concurrency, lookback_hours, batch_size, after_id)
+            after_id = summary["next_after_id"]
+            log.info("reconciliation.completed", **summary)
+        except Exception as e:
+            log.exception("reconciliation.error", error=str(e))
+
+async def _main(concurrency: int, lookback_hours: int, batch_size: int) -> None:
+    from utils.provider_loader import async_payment_providers
+    try:
+        # Lots successifs jusqu'à avoir parcouru toute la fenêtre de recherche
+        after_id = 0
+        while True:
+            summary = await reconcile_pending_transactions(async_payment_providers, concurrency, lookback_hours, batch_size, after_id)
+            print(f"Lot réconcilié : {summary}")
+            after_id = summary["next_after_id"]
+            if not after_id:
+                break
+    finally:
+        for provider in async_payment_providers.loaded().values():
+            await provider.aclose()
+
+# Point d'entrée en ligne de commande : python -m utils.reconciliation
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Réconcilie le statut des transactions non finalisées avec les fournisseurs de paiement.")
+    parser.add_argument("--concurrency", type=int, default=settings.reconciliation_concurrency, help="Nombre maximal de vérifications simultanées par fournisseur")
+    parser.add_argument("--lookback-hours", type=int, default=settings.reconciliation_lookback_hours, help="Ancienneté maximale des transactions vérifiées (et fenêtre des endpoints de liste)")
+    parser.add_argument("--batch-size", type=int, default=settings.reconciliation_batch_size, help="Nombre de transactions vérifiées par lot")
+    args = parser.parse_args()
+    from utils.log import setup_logging
+    setup_logging(settings)
+    asyncio.run(_main(args.concurrency, args.lookback_hours, args.batch_size))
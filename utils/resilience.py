@@ -0,0 +1,296 @@
+# Disjoncteur, nouvelles tentatives et cloisonnement des appels aux fournisseurs de paiement
+import asyncio
+import math
+import random
+import time
+import uuid
+from collections import deque
+from typing import Deque, Dict, Any, Optional
+from fastapi import HTTPException
+from providers.base import AsyncPaymentProvider, ProviderUnavailableError, ProviderWrapper
+from constants import CIRCUIT_STATE
+from utils.deadline import DeadlineExceededError, check_deadline, expired, remaining, wait_for_deadline
+from utils.log import get_logger
+
+log = get_logger(__name__)
+
+# Traitement local, sans appel réseau : ni disjoncteur ni cloisonnement
+LOCAL_METHODS = frozenset({"process_webhook"})
+
+class ProviderRejectedError(ProviderUnavailableError):
+    """Appel refusé sans contacter le fournisseur ; `retry_after` en secondes."""
+
+    def __init__(self, message: str, provider_key: str, retry_after: float):
+        super().__init__(message)
+        self.provider_key = provider_key
+        self.retry_after = retry_after
+
+class CircuitOpenError(ProviderRejectedError):
+    """Le disjoncteur du fournisseur est ouvert."""
+
+    def __init__(self, provider_key: str, retry_after: float):
+        super().__init__(f"Fournisseur {provider_key} temporairement indisponible, nouvel essai possible dans {retry_after:.0f} s", provider_key, retry_after)
+
+class ProviderBusyError(ProviderRejectedError):
+    """Trop d'appels simultanés au fournisseur : sa file d'attente est pleine ou l'attente a expiré."""
+
+    def __init__(self, provider_key: str, retry_after: float = 1.0):
+        super().__init__(f"Fournisseur {provider_key} saturé, trop d'appels simultanés", provider_key, retry_after)
+
+class CircuitBreaker:
+    """Disjoncteur d'un fournisseur, propre à chaque processus.
+
+    Après `failure_threshold` échecs transitoires consécutifs, le disjoncteur s'ouvre et
+    les appels échouent immédiatement pendant `recovery_timeout` secondes. Un seul appel
+    de test est ensuite autorisé : il referme le disjoncteur s'il aboutit, le rouvre sinon.
+    Utilisé uniquement depuis la boucle d'événements, sans verrou.
+    """
+
+    def __init__(self, provider_key: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.provider_key = provider_key
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CIRCUIT_STATE['CLOSED']
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self.opened_total = 0
+        self.rejected_total = 0
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(self.opened_at + self.recovery_timeout - time.monotonic(), 0.0)
+
+    def accepting_calls(self) -> bool:
+        """Indique, sans rien réserver, si un appel serait transmis au fournisseur."""
+        if self.state == CIRCUIT_STATE['OPEN']:
+            return self.retry_after() <= 0
+        return not (self.state == CIRCUIT_STATE['HALF_OPEN'] and self._probe_in_flight)
+
+    def allow(self) -> bool:
+        """Réserve le droit d'appeler le fournisseur ; False si l'appel doit échouer immédiatement."""
+        if self.state == CIRCUIT_STATE['OPEN']:
+            if self.retry_after() > 0:
+                self.rejected_total += 1
+                return False
+            self._transition(CIRCUIT_STATE['HALF_OPEN'])
+        if self.state == CIRCUIT_STATE['HALF_OPEN']:
+            if self._probe_in_flight:
+                self.rejected_total += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        """Le fournisseur a répondu, y compris par une erreur métier (paiement refusé, paramètre invalide)."""
+        self._probe_in_flight = False
+        self.consecutive_failures = 0
+        if self.state != CIRCUIT_STATE['CLOSED']:
+            self.opened_at = None
+            self._transition(CIRCUIT_STATE['CLOSED'])
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self.consecutive_failures += 1
+        if self.state == CIRCUIT_STATE['HALF_OPEN'] or (self.state == CIRCUIT_STATE['CLOSED'] and self.consecutive_failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            self.opened_total += 1
+            self._transition(CIRCUIT_STATE['OPEN'])
+
+    def record_cancelled(self) -> None:
+        # Appel interrompu sans résultat : un autre appel de test pourra être tenté
+        self._probe_in_flight = False
+
+    def _transition(self, state: str) -> None:
+        log.warning("provider.circuit_changed", provider=self.provider_key, previous=self.state, state=state, consecutive_failures=self.consecutive_failures)
+        self.state = state
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "failure_threshold": self.failure_threshold,
+            "recovery_timeout": self.recovery_timeout,
+            "retry_after": round(self.retry_after(), 3) if self.state == CIRCUIT_STATE['OPEN'] else 0.0,
+            "opened_total": self.opened_total,
+            "rejected_total": self.rejected_total
+        }
+
+class ResilientProvider(ProviderWrapper):
+    """Protège les appels au fournisseur délégué par un disjoncteur et les retente si c'est sans risque.
+
+    Seules les erreurs transitoires (`is_transient_error`) comptent pour le disjoncteur et
+    déclenchent une nouvelle tentative. Les lectures sont toujours retentées ; les créations
+    uniquement si le fournisseur applique les clés d'idempotence, une clé étant générée
+    lorsque le client n'en fournit pas afin que toutes les tentatives désignent la même opération.
+    """
+
+    # Lectures sans effet de bord
+    SAFE_METHODS = frozenset({"check_payment_status", "list_payment_statuses"})
+    # Créations dédupliquées par le fournisseur grâce à la clé d'idempotence
+    IDEMPOTENT_METHODS = frozenset({"create_payment", "create_subscription"})
+
+    def __init__(self, inner: AsyncPaymentProvider, provider_key: str, breaker: CircuitBreaker, retry_attempts: int = 2, retry_base_delay: float = 0.2, retry_max_delay: float = 2.0):
+        super().__init__(inner)
+        self.provider_key = provider_key
+        self.breaker = breaker
+        self.retry_attempts = retry_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+    def _attempts(self, method: str, kwargs: Dict[str, Any]) -> int:
+        if method in self.SAFE_METHODS:
+            return 1 + self.retry_attempts
+        if method in self.IDEMPOTENT_METHODS and self.supports_idempotency_keys:
+            if not kwargs.get("idempotency_key"):
+                kwargs["idempotency_key"] = uuid.uuid4().hex
+            return 1 + self.retry_attempts
+        return 1
+
+    async def _call(self, method: str, func, *args, **kwargs):
+        if method in LOCAL_METHODS:
+            return await func(*args, **kwargs)
+
+        operation = f"{self.provider_key}.{method}"
+        attempts = self._attempts(method, kwargs)
+        for attempt in range(attempts):
+            check_deadline(operation)
+            if not self.breaker.allow():
+                raise CircuitOpenError(self.provider_key, self.breaker.retry_after())
+            try:
+                # Chaque tentative est bornée par l'échéance de la requête en cours
+                result = await wait_for_deadline(func(*args, **kwargs), operation)
+            except (asyncio.CancelledError, DeadlineExceededError):
+                # Appel interrompu par le client ou par l'échéance : ni succès ni échec du fournisseur
+                self.breaker.record_cancelled()
+                raise
+            except Exception as e:
+                if not self.is_transient_error(e):
+                    self.breaker.record_success()
+                    raise
+                if expired():
+                    # Délai du client HTTP réduit au temps restant : l'échéance est atteinte
+                    self.breaker.record_cancelled()
+                    raise DeadlineExceededError(operation) from e
+                self.breaker.record_failure()
+                if attempt + 1 >= attempts:
+                    raise
+                # Délai aléatoire (« full jitter ») : les nouvelles tentatives ne se synchronisent pas
+                delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+                left = remaining()
+                if left is not None and left <= delay:
+                    # Plus le temps de retenter avant l'échéance : l'erreur du fournisseur est remontée
+                    raise
+                log.info("provider.retry", provider=self.provider_key, method=method, attempt=attempt + 1, delay=round(delay, 3), error=str(e))
+                await asyncio.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+class Bulkhead:
+    """Limite les appels simultanés à un fournisseur, avec une file d'attente bornée.
+
+    Au-delà de `max_concurrency` appels en cours, jusqu'à `max_queued` appels attendent
+    une place pendant au plus `queue_timeout` secondes (et jusqu'à l'échéance de la
+    requête) ; les autres sont refusés
+    immédiatement (ProviderBusyError). Une place libérée est transmise directement au
+    plus ancien appel en attente. Avec `max_concurrency` à 0, les appels sont seulement comptés.
+    Utilisé uniquement depuis la boucle d'événements, sans verrou.
+    """
+
+    def __init__(self, provider_key: str, max_concurrency: int = 0, max_queued: int = 0, queue_timeout: float = 5.0):
+        self.provider_key = provider_key
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        # Compteur tenu à jour par les appels en attente : lu sans risque depuis le thread de /metrics
+        self.queued = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.rejected_total = 0
+        self.timed_out_total = 0
+
+    def accepting_calls(self) -> bool:
+        """Indique si un appel serait admis, immédiatement ou dans la file d'attente."""
+        return self.max_concurrency <= 0 or self.in_flight < self.max_concurrency or self.queued < self.max_queued
+
+    async def acquire(self) -> None:
+        if self.max_concurrency <= 0 or (self.in_flight < self.max_concurrency and not self.queued):
+            self.in_flight += 1
+            return
+        if self.queued >= self.max_queued:
+            self.rejected_total += 1
+            raise ProviderBusyError(self.provider_key)
+
+        # Future créée dans la boucle courante (et non à la construction, hors de toute boucle)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        left = remaining()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout if left is None else min(self.queue_timeout, max(left, 0)))
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # La place a été transmise au moment de l'expiration : elle est conservée
+                return
+            waiter.cancel()
+            if expired():
+                raise DeadlineExceededError(f"{self.provider_key}.queue")
+            self.timed_out_total += 1
+            raise ProviderBusyError(self.provider_key)
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            self.queued -= 1
+            if waiter.cancelled() and waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self) -> None:
+        # La place passe au plus ancien appel en attente : in_flight reste inchangé
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queued": self.max_queued,
+            "queue_timeout": self.queue_timeout,
+            "rejected_total": self.rejected_total,
+            "timed_out_total": self.timed_out_total
+        }
+
+class BulkheadProvider(ProviderWrapper):
+    """Cloisonne les appels au fournisseur délégué : un fournisseur lent ne monopolise pas le processus."""
+
+    def __init__(self, inner: AsyncPaymentProvider, bulkhead: Bulkhead):
+        super().__init__(inner)
+        self.bulkhead = bulkhead
+
+    async def _call(self, method: str, func, *args, **kwargs):
+        if method in LOCAL_METHODS:
+            return await func(*args, **kwargs)
+        await self.bulkhead.acquire()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            self.bulkhead.release()
+
+def provider_http_error(error: Exception) -> HTTPException:
+    """Erreur HTTP d'un appel au fournisseur : 503 avec Retry-After si l'appel a été refusé
+    (disjoncteur ouvert, fournisseur saturé), 504 si l'échéance de la requête est atteinte, 400 sinon."""
+    if isinstance(error, DeadlineExceededError):
+        return HTTPException(status_code=504, detail=str(error))
+    if isinstance(error, ProviderRejectedError):
+        return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(max(math.ceil(error.retry_after), 1))})
+    return HTTPException(status_code=400, detail=str(error))
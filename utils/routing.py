@@ -0,0 +1,148 @@
+# Choix du fournisseur de paiement selon la latence et le taux d'erreur observés (provider=auto)
+import random
+import time
+from typing import Dict, Any, Iterable, List, Optional
+from providers.base import AsyncPaymentProvider, ProviderWrapper
+from utils.deadline import DeadlineExceededError
+from utils.resilience import CircuitOpenError, ProviderBusyError, ProviderRejectedError
+from utils.log import get_logger
+
+log = get_logger(__name__)
+
+class ProviderHealth:
+    """Moyennes mobiles exponentielles (EWMA) de la durée de création et du taux d'erreur d'un fournisseur.
+
+    Le taux d'erreur décroît avec le temps écoulé depuis la dernière observation
+    (demi-vie `error_half_life`) : un fournisseur écarté après une panne redevient
+    progressivement candidat, même sans nouveau trafic.
+    """
+
+    def __init__(self, alpha: float = 0.2, error_half_life: float = 60.0):
+        self.alpha = alpha
+        self.error_half_life = error_half_life
+        self.latency: Optional[float] = None
+        self._error_rate = 0.0
+        self._updated_at: Optional[float] = None
+        self.samples = 0
+
+    def error_rate(self, now: Optional[float] = None) -> float:
+        if self._updated_at is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return self._error_rate * 0.5 ** ((now - self._updated_at) / self.error_half_life)
+
+    def observe(self, latency: Optional[float], failed: bool) -> None:
+        """Enregistre un appel ; `latency` vaut None pour un échec sans réponse du fournisseur."""
+        now = time.monotonic()
+        self._error_rate = self.alpha * float(failed) + (1 - self.alpha) * self.error_rate(now)
+        self._updated_at = now
+        if latency is not None:
+            self.latency = latency if self.latency is None else self.alpha * latency + (1 - self.alpha) * self.latency
+        self.samples += 1
+
+class HealthTrackingProvider(ProviderWrapper):
+    """Alimente le `ProviderHealth` du fournisseur avec chaque création de paiement, nouvelles tentatives comprises."""
+
+    TRACKED_METHODS = frozenset({"create_payment"})
+
+    def __init__(self, inner: AsyncPaymentProvider, health: ProviderHealth):
+        super().__init__(inner)
+        self.health = health
+
+    async def _call(self, method: str, func, *args, **kwargs):
+        if method not in self.TRACKED_METHODS:
+            return await func(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            result = await func(*args, **kwargs)
+        except DeadlineExceededError:
+            # Échéance propre à la requête (éventuellement courte, fixée par le client) : pas une mesure du fournisseur
+            raise
+        except Exception as e:
+            # Une erreur métier (paramètre invalide...) prouve que le fournisseur répond ;
+            # un appel refusé (disjoncteur ouvert, fournisseur saturé) compte comme un échec
+            if isinstance(e, ProviderRejectedError) or self.is_transient_error(e):
+                self.health.observe(None, True)
+            else:
+                self.health.observe(time.perf_counter() - started, False)
+            raise
+        self.health.observe(time.perf_counter() - started, False)
+        return result
+
+class ProviderRouter:
+    """Choisit un fournisseur parmi les candidats configurés pour une devise.
+
+    Le coût d'un candidat est sa latence moyenne, majorée selon son taux d'erreur
+    (`latence × (1 + error_penalty × taux)`) et divisée par le poids choisi par le marchand.
+    Le candidat le moins coûteux est retenu ; une fraction `exploration` des choix est tirée
+    au hasard (selon les poids) pour que les mesures des autres fournisseurs restent à jour.
+    Les fournisseurs dont le disjoncteur est ouvert ou dont le cloisonnement est saturé sont écartés.
+    """
+
+    def __init__(self, candidates: Dict[str, List[str]], weights: Dict[str, float], alpha: float = 0.2, error_half_life: float = 60.0, error_penalty: float = 10.0, exploration: float = 0.05):
+        self.candidates = candidates
+        self.weights = weights
+        self.alpha = alpha
+        self.error_half_life = error_half_life
+        self.error_penalty = error_penalty
+        self.exploration = exploration
+        self._health: Dict[str, ProviderHealth] = {}
+
+    def health(self, provider_key: str) -> ProviderHealth:
+        if provider_key not in self._health:
+            self._health[provider_key] = ProviderHealth(self.alpha, self.error_half_life)
+        return self._health[provider_key]
+
+    def _candidates(self, currency: str, providers: Dict[str, AsyncPaymentProvider]) -> List[str]:
+        # Liste propre à la devise, sinon liste par défaut "*", sinon tous les fournisseurs chargés
+        configured: Iterable[str] = self.candidates.get(currency.upper(), self.candidates.get("*", list(providers)))
+        return [key for key in configured if key in providers and self.weights.get(key, 1.0) > 0]
+
+    def costs(self, provider_keys: List[str]) -> Dict[str, float]:
+        now = time.monotonic()
+        known = [self.health(key).latency for key in provider_keys if self.health(key).latency is not None]
+        # Fournisseur sans mesure : supposé aussi rapide que le meilleur, pour qu'il soit essayé
+        default_latency = min(known, default=1.0)
+        costs = {}
+        for key in provider_keys:
+            health = self.health(key)
+            latency = health.latency if health.latency is not None else default_latency
+            costs[key] = latency * (1 + self.error_penalty * health.error_rate(now)) / self.weights.get(key, 1.0)
+        return costs
+
+    def choose(self, currency: str, providers: Dict[str, AsyncPaymentProvider]) -> str:
+        """Clé du fournisseur retenu ; ValueError si aucun n'est configuré, CircuitOpenError ou
+        ProviderBusyError si tous les candidats sont indisponibles ou saturés."""
+        candidates = self._candidates(currency, providers)
+        if not candidates:
+            raise ValueError(f"Aucun fournisseur configuré pour la devise {currency}")
+        reachable = [key for key in candidates if providers[key].breaker.accepting_calls()]
+        if not reachable:
+            raise CircuitOpenError("auto", min(providers[key].breaker.retry_after() for key in candidates))
+        available = [key for key in reachable if providers[key].bulkhead.accepting_calls()]
+        if not available:
+            raise ProviderBusyError("auto")
+
+        costs = self.costs(available)
+        if len(available) > 1 and random.random() < self.exploration:
+            chosen = random.choices(available, weights=[self.weights.get(key, 1.0) for key in available])[0]
+        else:
+            chosen = min(available, key=costs.__getitem__)
+        log.debug("provider.routed", currency=currency, provider=chosen, costs={key: round(cost, 4) for key, cost in costs.items()})
+        return chosen
+
+    def snapshot(self, providers: Dict[str, AsyncPaymentProvider]) -> Dict[str, Dict[str, Any]]:
+        keys = list(providers)
+        costs = self.costs(keys)
+        return {
+            key: {
+                "latency_ewma": self.health(key).latency,
+                "error_rate": round(self.health(key).error_rate(), 4),
+                "samples": self.health(key).samples,
+                "weight": self.weights.get(key, 1.0),
+                "cost": round(costs[key], 6),
+                "circuit_state": providers[key].breaker.state,
+                "in_flight": providers[key].bulkhead.in_flight
+            }
+            for key in keys
+        }
@@ -0,0 +1,98 @@
+# Profil de stockage SQLite : pragmas appliqués à chaque connexion, pool et maintenance périodique
+import asyncio
+from typing import Any, Dict
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from utils.log import get_logger
+
+log = get_logger(__name__)
+
+# "default" : réglages par défaut de SQLite et de SQLAlchemy ; "wal" : profil pour une base
+# partagée par plusieurs workers (écritures concurrentes des webhooks et des routes)
+SQLITE_PROFILES = ("default", "wal")
+
+def is_sqlite_file(database_url: str) -> bool:
+    """Vrai pour une base SQLite sur disque (les bases en mémoire gardent leur configuration)."""
+    url = make_url(database_url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+def uses_sqlite_profile(settings, database_url: str) -> bool:
+    if settings.sqlite_profile not in SQLITE_PROFILES:
+        raise ValueError(f"Profil SQLite inconnu : {settings.sqlite_profile} (attendu : {', '.join(SQLITE_PROFILES)})")
+    return settings.sqlite_profile == "wal" and is_sqlite_file(database_url)
+
+def sqlite_engine_options(settings, database_url: str, is_async: bool = False) -> Dict[str, Any]:
+    """Options de create_engine du profil : pool de connexions dimensionné pour les lectures concurrentes du mode WAL."""
+    if not uses_sqlite_profile(settings, database_url):
+        return {}
+    return {
+        "poolclass": AsyncAdaptedQueuePool if is_async else QueuePool,
+        "pool_size": settings.sqlite_pool_size,
+        "max_overflow": settings.sqlite_max_overflow,
+    }
+
+def configure_sqlite_engine(engine: Engine, settings) -> None:
+    """Applique les pragmas du profil à chaque nouvelle connexion du moteur."""
+    if not uses_sqlite_profile(settings, str(engine.url)):
+        return
+    pragmas = [
+        # WAL : les lectures ne bloquent plus les écritures, et inversement
+        "PRAGMA journal_mode=WAL",
+        # NORMAL suffit en WAL : pas de perte de cohérence, seules les dernières transactions peuvent être perdues en cas de coupure
+        f"PRAGMA synchronous={settings.sqlite_synchronous}",
+        # Attente du verrou d'écriture au lieu d'une erreur "database is locked" immédiate
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}",
+        f"PRAGMA mmap_size={settings.sqlite_mmap_size}",
+        f"PRAGMA cache_size=-{settings.sqlite_cache_size_kb}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+def sqlite_pragmas(engine: Engine) -> Dict[str, Any]:
+    """Valeurs effectives des pragmas, lues sur une connexion du pool."""
+    if not is_sqlite_file(str(engine.url)):
+        return {}
+    with engine.connect() as connection:
+        return {
+            name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+            for name in ("journal_mode", "synchronous", "busy_timeout", "mmap_size", "cache_size", "temp_store")
+        }
+
+def run_sqlite_maintenance(engine: Engine, analyze: bool = False) -> Dict[str, Any]:
+    """Point de contrôle du journal WAL, et mise à jour des statistiques du planificateur si `analyze`."""
+    result: Dict[str, Any] = {}
+    with engine.connect() as connection:
+        # PASSIVE : copie dans la base ce qui peut l'être sans attendre les lecteurs ni bloquer les écritures
+        busy, log_frames, checkpointed = connection.exec_driver_sql("PRAGMA wal_checkpoint(PASSIVE)").one()
+        result.update(busy=busy, wal_frames=log_frames, checkpointed_frames=checkpointed)
+        if analyze:
+            # Échantillonnage borné : ANALYZE reste rapide sur les grandes tables
+            connection.exec_driver_sql("PRAGMA analysis_limit=1000")
+            connection.exec_driver_sql("ANALYZE")
+            connection.commit()
+            result["analyzed"] = True
+    return result
+
+async def sqlite_maintenance_loop(engine: Engine, checkpoint_interval: int, analyze_interval: int) -> None:
+    """Tâche de fond : point de contrôle toutes les `checkpoint_interval` secondes, ANALYZE toutes les `analyze_interval` secondes."""
+    elapsed_since_analyze = 0
+    while True:
+        await asyncio.sleep(checkpoint_interval)
+        elapsed_since_analyze += checkpoint_interval
+        analyze = analyze_interval > 0 and elapsed_since_analyze >= analyze_interval
+        try:
+            summary = await asyncio.to_thread(run_sqlite_maintenance, engine, analyze)
+            if analyze:
+                elapsed_since_analyze = 0
+            log.debug("sqlite.maintenance", **summary)
+        except Exception as e:
+            log.warning("sqlite.maintenance_failed", error=str(e))
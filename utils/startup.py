@@ -0,0 +1,38 @@
+# Rapport de démarrage : durée de chaque étape du chargement de l'application, propre au processus
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+class StartupTimer:
+    """Durées (ms) des étapes du démarrage, mesurées depuis l'import de ce module.
+
+    `mark` clôt une étape séquentielle (imports, migrations) commencée à la fin de la
+    précédente ; `phase` mesure un bloc isolé (démarrage d'un worker, après le fork).
+    """
+
+    def __init__(self):
+        self.started = self._last_mark = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.ready_ms: Optional[float] = None
+
+    def mark(self, name: str) -> None:
+        now = time.perf_counter()
+        self.phases[name] = round((now - self._last_mark) * 1000, 1)
+        self._last_mark = now
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    def ready(self) -> None:
+        """Fin du démarrage : durée totale depuis le début du chargement de l'application."""
+        self.ready_ms = round((time.perf_counter() - self.started) * 1000, 1)
+
+    def report(self) -> Dict[str, Any]:
+        return {"phases_ms": dict(self.phases), "ready_ms": self.ready_ms}
+
+startup_timer = StartupTimer()
@@ -0,0 +1,120 @@
+# Cache des statuts de paiement placé devant check_payment_status
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from providers.base import AsyncPaymentProvider
+from constants import TERMINAL_PAYMENT_STATUSES
+from utils.deadline import DeadlineExceededError, expired, wait_for_deadline
+from config import settings
+
+class StatusCache:
+    """Cache LRU borné des résultats de check_payment_status.
+
+    La durée de vie dépend du statut unifié retourné : les statuts définitifs
+    (completed, failed, cancelled) sont conservés sans expiration, les autres
+    selon `ttls`. Les appels simultanés pour un même paiement sont regroupés
+    en un seul appel au fournisseur. Les entrées sont invalidées lorsque la
+    file des webhooks applique une mise à jour, mais seulement dans le processus
+    qui la traite (le leader des tâches de fond) : dans les autres workers, une
+    entrée non définitive reste servie jusqu'à son expiration. Les routes font
+    donc prévaloir un statut définitif en base sur le cache.
+    """
+
+    def __init__(self, max_size: int = 10000, ttls: Optional[Dict[str, float]] = None, default_ttl: float = 5.0):
+        self.max_size = max_size
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Optional[float], Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _ttl(self, status: Optional[str]) -> Optional[float]:
+        if status in TERMINAL_PAYMENT_STATUSES:
+            return None
+        return self.ttls.get(status, self.default_ttl)
+
+    def get(self, provider: str, provider_transaction_id: str) -> Optional[Dict[str, Any]]:
+        key = (provider, provider_transaction_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, status_info = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return status_info
+
+    def set(self, provider: str, provider_transaction_id: str, status_info: Dict[str, Any]) -> None:
+        ttl = self._ttl(status_info.get("status"))
+        if ttl is not None and ttl <= 0:
+            return
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        key = (provider, provider_transaction_id)
+        with self._lock:
+            self._entries[key] = (expires_at, status_info)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, provider: str, provider_transaction_id: str) -> None:
+        with self._lock:
+            self._entries.pop((provider, provider_transaction_id), None)
+
+    async def check_payment_status(self, provider: str, payment_provider: AsyncPaymentProvider, provider_transaction_id: str) -> Dict[str, Any]:
+        """Retourne le statut en cache ou interroge le fournisseur une seule fois pour tous les appelants."""
+        cached = self.get(provider, provider_transaction_id)
+        if cached is not None:
+            return cached
+
+        key = (provider, provider_transaction_id)
+        while key in self._in_flight:
+            try:
+                # Attente bornée par l'échéance de cette requête, qui peut précéder celle de l'appel en cours
+                return await wait_for_deadline(asyncio.shield(self._in_flight[key]), f"{provider}.check_payment_status")
+            except DeadlineExceededError:
+                if expired():
+                    raise
+                # L'appel a atteint l'échéance de la requête qui l'a lancé : il est relancé pour celle-ci
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            status_info = await payment_provider.check_payment_status(provider_transaction_id)
+            self.set(provider, provider_transaction_id, status_info)
+            future.set_result(status_info)
+            return status_info
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Évite l'avertissement "exception never retrieved" lorsqu'aucun autre appelant n'attend
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+# Cache partagé par les routes de consultation et la file des webhooks
+status_cache = StatusCache(
+    max_size=settings.status_cache_size,
+    ttls=settings.status_cache_ttls,
+    default_ttl=settings.status_cache_default_ttl
+)
@@ -0,0 +1,196 @@
+# Découpage du temps de chaque requête en spans (fournisseurs, base de données, sérialisation)
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from fastapi.routing import APIRoute
+from providers.base import ProviderWrapper
+
+class Trace:
+    """Spans d'une requête HTTP. L'objet est partagé avec les threads du pool
+    (contexte copié par run_in_threadpool), d'où le verrou sur la liste."""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.handler_ended: Optional[float] = None
+        self.spans: List[Tuple[str, float, float]] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, started: float, duration: float) -> None:
+        with self._lock:
+            self.spans.append((name, started - self.started, duration))
+
+    def summary(self) -> Dict[str, Tuple[float, int]]:
+        """Durée cumulée et nombre d'occurrences par nom de span."""
+        totals: Dict[str, Tuple[float, int]] = {}
+        with self._lock:
+            for name, _, duration in self.spans:
+                total, count = totals.get(name, (0.0, 0))
+                totals[name] = (total + duration, count + 1)
+        return totals
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+def record_span(name: str, started: float, duration: float) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, started, duration)
+
+@contextmanager
+def span(name: str):
+    """Enregistre la durée du bloc dans la trace de la requête courante, s'il y en a une."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, started, time.perf_counter() - started)
+
+class SlowRequestBuffer:
+    """Tampon circulaire des requêtes dont la durée dépasse un seuil."""
+
+    def __init__(self, size: int = 100, threshold: float = 0.5):
+        self.threshold = threshold
+        self._entries: Deque[Dict[str, Any]] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace, status: int, duration: float) -> None:
+        if duration < self.threshold:
+            return
+        entry = {
+            "method": trace.method,
+            "path": trace.path,
+            "status": status,
+            "started_at": trace.started_at.isoformat(),
+            "duration_ms": round(duration * 1000, 3),
+            "spans": [
+                {"name": name, "offset_ms": round(offset * 1000, 3), "duration_ms": round(span_duration * 1000, 3)}
+                for name, offset, span_duration in trace.spans
+            ]
+        }
+        with self._lock:
+            self._entries.append(entry)
+
+    def slowest(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = list(self._entries)
+        return sorted(entries, key=lambda entry: entry["duration_ms"], reverse=True)[:limit]
+
+def server_timing_header(trace: Trace, total: float) -> str:
+    parts = []
+    for name, (duration, count) in trace.summary().items():
+        description = f';desc="{count}x"' if count > 1 else ""
+        parts.append(f"{name};dur={duration * 1000:.3f}{description}")
+    parts.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(parts)
+
+class TracingMiddleware:
+    """Middleware ASGI : ouvre une trace par requête, ajoute l'en-tête Server-Timing
+    et conserve les requêtes lentes dans `slow_requests`."""
+
+    def __init__(self, app, slow_requests: SlowRequestBuffer):
+        self.app = app
+        self.slow_requests = slow_requests
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = Trace(scope["method"], scope["path"])
+        token = _current_trace.set(trace)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                now = time.perf_counter()
+                status[0] = message["status"]
+                # Temps écoulé entre la fin de la route et l'envoi : validation et sérialisation de la réponse
+                if trace.handler_ended is not None:
+                    trace.add_span("serialize", trace.handler_ended, now - trace.handler_ended)
+                header = server_timing_header(trace, now - trace.started).encode("latin-1")
+                message = dict(message)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            self.slow_requests.add(trace, status[0], time.perf_counter() - trace.started)
+
+class TracedRoute(APIRoute):
+    """Route FastAPI qui enregistre la durée de la fonction de la route (span `handler`)
+    et sa fin, pour distinguer la sérialisation de la réponse."""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _traced_endpoint(endpoint), **kwargs)
+
+def _traced_endpoint(endpoint):
+    if not inspect.iscoroutinefunction(endpoint):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    async def traced(*args, **kwargs):
+        trace = _current_trace.get()
+        if trace is None:
+            return await endpoint(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            trace.handler_ended = time.perf_counter()
+            trace.add_span("handler", started, trace.handler_ended - started)
+    return traced
+
+class TracedProvider(ProviderWrapper):
+    """Enregistre chaque appel au fournisseur comme un span `provider.<méthode>`."""
+
+    async def _call(self, method: str, func, *args, **kwargs):
+        with span(f"provider.{method}"):
+            return await func(*args, **kwargs)
+
+def trace_engine(engine) -> None:
+    """Enregistre les requêtes SQL d'un moteur comme spans `db.<instruction>`."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current_trace.get() is not None:
+            conn.info.setdefault("span_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("span_started")
+        if _current_trace.get() is not None and stack:
+            started = stack.pop()
+            record_span(f"db.{statement.lstrip().split(' ', 1)[0].lower()}", started, time.perf_counter() - started)
+
+def trace_sessions() -> None:
+    """Enregistre les commits des sessions ORM comme spans `db.commit`."""
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    @event.listens_for(Session, "before_commit")
+    def _before_commit(session):
+        if _current_trace.get() is not None:
+            session.info["span_commit_started"] = time.perf_counter()
+
+    @event.listens_for(Session, "after_commit")
+    def _after_commit(session):
+        started = session.info.pop("span_commit_started", None)
+        if started is not None:
+            record_span("db.commit", started, time.perf_counter() - started)
@@ -0,0 +1,275 @@
+# File d'attente durable des webhooks et workers d'application par lots
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Tuple
+from sqlalchemy import bindparam, func, or_, select, update
+from database import SessionLocal
+from models.transaction import Transaction
+from models.subscription import Subscription
+from models.webhook_event import WebhookEvent
+from providers.base import PaymentProvider
+from constants import WEBHOOK_EVENT_STATUS
+from config import settings
+from utils.provider_loader import payment_providers
+from utils.status_cache import status_cache
+from utils.log import get_logger
+from utils.metrics import webhook_events, webhook_batch_duration
+
+log = get_logger(__name__)
+
+class WebhookQueue:
+    """Applique en arrière-plan les webhooks enregistrés dans la table `webhook_events`.
+
+    Chaque worker réserve un lot d'événements en attente, les décode avec le
+    `process_webhook` du fournisseur, puis applique toutes les mises à jour de
+    statut du lot en UPDATE groupés et en un seul commit. Un événement en échec
+    (fournisseur injoignable...) est remis en file et retenté après `retry_delay`
+    secondes, jusqu'à `max_attempts` tentatives avant d'être marqué `failed`.
+    """
+
+    def __init__(self, providers: Dict[str, PaymentProvider], workers: int = 2, batch_size: int = 100, poll_interval: float = 1.0, max_attempts: int = 5, claim_timeout: float = 300.0, retry_delay: float = 30.0):
+        self.providers = providers
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.claim_timeout = claim_timeout
+        self.retry_delay = timedelta(seconds=retry_delay)
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._stats_lock = threading.Lock()
+        self._next_stale_release = 0.0
+        self.processed_total = 0
+        self.retried_total = 0
+        self.failed_total = 0
+        self.batches_total = 0
+        self.last_batch_size = 0
+        self.last_batch_duration = 0.0
+
+    def start(self) -> None:
+        self._release_stale_claims_periodically()
+        self._stopping.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"webhook-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self) -> None:
+        """Réveille les workers après l'enregistrement d'un nouvel événement."""
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self._release_stale_claims_periodically()
+                processed = self.drain_once()
+            except Exception as e:
+                log.exception("webhook.worker_error", error=str(e))
+                processed = 0
+            # Un lot complet laisse supposer qu'il reste des événements : on enchaîne sans attendre
+            if processed < self.batch_size:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _release_stale_claims_periodically(self) -> None:
+        # Une seule libération par demi-délai de réservation, tous threads confondus
+        with self._stats_lock:
+            now = time.monotonic()
+            if now < self._next_stale_release:
+                return
+            self._next_stale_release = now + self.claim_timeout / 2
+        self._release_stale_claims()
+
+    def _release_stale_claims(self) -> None:
+        # Événements réservés par un worker interrompu (arrêt brutal du processus)
+        limit = datetime.utcnow() - timedelta(seconds=self.claim_timeout)
+        with SessionLocal() as db:
+            db.execute(
+                update(WebhookEvent)
+                .where(WebhookEvent.status == WEBHOOK_EVENT_STATUS['PROCESSING'], WebhookEvent.claimed_at < limit)
+                .values(status=WEBHOOK_EVENT_STATUS['PENDING'], claim_token=None)
+            )
+            db.commit()
+
+    def _claim_batch(self, db) -> List[WebhookEvent]:
+        # La réservation par jeton évite qu'un même événement soit traité par deux workers ou deux processus
+        token = uuid.uuid4().hex
+        # Un événement déjà tenté (processed_at renseigné) attend `retry_delay` avant la tentative suivante
+        retry_before = datetime.utcnow() - self.retry_delay
+        pending_ids = (
+            select(WebhookEvent.id)
+            .where(
+                WebhookEvent.status == WEBHOOK_EVENT_STATUS['PENDING'],
+                or_(WebhookEvent.processed_at.is_(None), WebhookEvent.processed_at < retry_before)
+            )
+            .order_by(WebhookEvent.id)
+            .limit(self.batch_size)
+            .scalar_subquery()
+        )
+        db.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id.in_(pending_ids), WebhookEvent.status == WEBHOOK_EVENT_STATUS['PENDING'])
+            .values(status=WEBHOOK_EVENT_STATUS['PROCESSING'], claim_token=token, claimed_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return list(db.execute(
+            select(WebhookEvent).where(WebhookEvent.claim_token == token).order_by(WebhookEvent.id)
+        ).scalars())
+
+    def drain_once(self) -> int:
+        """Traite un lot d'événements et retourne le nombre d'événements réservés."""
+        with SessionLocal() as db:
+            events = self._claim_batch(db)
+            if not events:
+                return 0
+            event_ids = [event.id for event in events]
+            started = time.perf_counter()
+
+            # Les événements sont traités dans l'ordre de réception : le dernier statut l'emporte
+            transaction_updates: Dict[Tuple[str, str], str] = {}
+            subscription_updates: Dict[Tuple[str, str], str] = {}
+            now = datetime.utcnow()
+            failed = 0
+            retried = 0
+            outcomes: List[Tuple[str, str, str]] = []
+            for event in events:
+                provider = self.providers.get(event.provider)
+                event_type = "unknown"
+                try:
+                    if provider is None:
+                        raise ValueError(f"Fournisseur de paiement non supporté: {event.provider}")
+                    result = provider.process_webhook(event.payload)
+                    event_type = result["type"]
+                    if result["type"] == "transaction":
+                        transaction_updates[(event.provider, result["provider_transaction_id"])] = result["status"]
+                    elif result["type"] == "subscription":
+                        subscription_updates[(event.provider, result["provider_subscription_id"])] = result["status"]
+                    event.status = WEBHOOK_EVENT_STATUS['PROCESSED']
+                    event.error = None
+                except Exception as e:
+                    event.error = str(e)
+                    # Remis en file tant qu'il reste des tentatives : l'erreur peut être passagère
+                    if (event.attempts or 0) + 1 >= self.max_attempts:
+                        event.status = WEBHOOK_EVENT_STATUS['FAILED']
+                        failed += 1
+                    else:
+                        event.status = WEBHOOK_EVENT_STATUS['PENDING']
+                        retried += 1
+                outcomes.append((event.provider, event_type, "retry" if event.status == WEBHOOK_EVENT_STATUS['PENDING'] else event.status))
+                event.attempts = (event.attempts or 0) + 1
+                event.processed_at = now
+                event.claim_token = None
+
+            try:
+                self._apply_updates(db, transaction_updates, subscription_updates)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                log.error("webhook.batch_failed", events=len(events), error=str(e))
+                self._release_batch(db, event_ids)
+                return len(events)
+
+            # Les prochaines consultations de statut interrogeront à nouveau le fournisseur
+            for provider_key, provider_transaction_id in transaction_updates:
+                status_cache.invalidate(provider_key, provider_transaction_id)
+
+            duration = time.perf_counter() - started
+            webhook_batch_duration.observe(duration)
+            for provider_key, event_type, outcome in outcomes:
+                webhook_events.inc(provider_key, event_type, outcome)
+
+            with self._stats_lock:
+                self.processed_total += len(events) - failed - retried
+                self.retried_total += retried
+                self.failed_total += failed
+                self.batches_total += 1
+                self.last_batch_size = len(events)
+                self.last_batch_duration = duration
+            return len(events)
+
+    def _apply_updates(self, db, transaction_updates: Dict[Tuple[str, str], str], subscription_updates: Dict[Tuple[str, str], str]) -> None:
+        # Recherche par (provider, id fournisseur) : couverte par les index uniques composites
+        if transaction_updates:
+            transactions = Transaction.__table__
+            db.execute(
+                update(transactions)
+                .where(
+                    transactions.c.provider == bindparam("b_provider"),
+                    transactions.c.provider_transaction_id == bindparam("b_provider_id")
+                )
+                .values(status=bindparam("b_status")),
+                [{"b_provider": provider, "b_provider_id": key, "b_status": value} for (provider, key), value in transaction_updates.items()]
+            )
+        if subscription_updates:
+            subscriptions = Subscription.__table__
+            db.execute(
+                update(subscriptions)
+                .where(
+                    subscriptions.c.provider == bindparam("b_provider"),
+                    subscriptions.c.provider_subscription_id == bindparam("b_provider_id")
+                )
+                .values(status=bindparam("b_status")),
+                [{"b_provider": provider, "b_provider_id": key, "b_status": value} for (provider, key), value in subscription_updates.items()]
+            )
+
+    def _release_batch(self, db, event_ids: List[int]) -> None:
+        # Remise en file du lot, sauf pour les événements ayant épuisé leurs tentatives
+        db.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id.in_(event_ids))
+            .values(
+                attempts=WebhookEvent.attempts + 1,
+                claim_token=None,
+                status=WEBHOOK_EVENT_STATUS['PENDING']
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id.in_(event_ids), WebhookEvent.attempts >= self.max_attempts)
+            .values(status=WEBHOOK_EVENT_STATUS['FAILED'], error="Nombre maximal de tentatives atteint")
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Profondeur de la file et retard de traitement."""
+        with SessionLocal() as db:
+            depth, oldest = db.execute(
+                select(func.count(WebhookEvent.id), func.min(WebhookEvent.received_at))
+                .where(WebhookEvent.status.in_([WEBHOOK_EVENT_STATUS['PENDING'], WEBHOOK_EVENT_STATUS['PROCESSING']]))
+            ).one()
+        lag = (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+        with self._stats_lock:
+            return {
+                "depth": depth,
+                "drain_lag_seconds": lag,
+                "processed_total": self.processed_total,
+                "retried_total": self.retried_total,
+                "failed_total": self.failed_total,
+                "batches_total": self.batches_total,
+                "last_batch_size": self.last_batch_size,
+                "last_batch_duration_seconds": self.last_batch_duration,
+                "workers": len(self._threads)
+            }
+
+# File partagée par la route de réception et les workers de l'application
+webhook_queue = WebhookQueue(
+    payment_providers,
+    workers=settings.webhook_workers,
+    batch_size=settings.webhook_batch_size,
+    poll_interval=settings.webhook_poll_interval,
+    max_attempts=settings.webhook_max_attempts,
+    retry_delay=settings.webhook_retry_delay
+)